@@ -33,8 +33,72 @@ module StaticNarrative {
     */
     funcdef create_static_narrative(CreateStaticNarrativeInput params) returns (CreateStaticNarrativeOutput output) authentication required;
 
+    typedef structure {
+        string job_id;
+    } SubmitStaticNarrativeOutput;
+
+    /*
+        Starts creating a static Narrative from the given Narrative ref string in the background.
+        Returns a job id to check on it with get_static_narrative_job.
+    */
+    funcdef submit_static_narrative(CreateStaticNarrativeInput params) returns (SubmitStaticNarrativeOutput output) authentication required;
+
+    typedef structure {
+        string job_id;
+    } GetStaticNarrativeJobInput;
+
+    /*
+        name - the name of the stage, one of check_permissions, check_existing, export, upload
+        state - one of queued, running, completed, error, skipped
+        started - ms since epoch of when the stage started (absent if it hasn't)
+        finished - ms since epoch of when the stage finished (absent if it hasn't)
+    */
+    typedef structure {
+        string name;
+        string state;
+        int started;
+        int finished;
+    } StaticNarrativeJobStage;
+
+    /*
+        job_id - the id of the job
+        narrative_ref - the reference to the Narrative object being made static
+        state - one of queued, running, completed, error
+        stage - the name of the stage that's running (absent or null if none are)
+        stages - the progress of each stage, in order
+        static_narrative_url - the url of the static Narrative, once the job is completed
+        error - the error message, if the job failed
+        created - ms since epoch of when the job was submitted
+        started - ms since epoch of when the job started running
+        finished - ms since epoch of when the job finished
+    */
+    typedef structure {
+        string job_id;
+        ws_ref narrative_ref;
+        string state;
+        string stage;
+        list<StaticNarrativeJobStage> stages;
+        url static_narrative_url;
+        string error;
+        int created;
+        int started;
+        int finished;
+    } StaticNarrativeJob;
+
+    /*
+        Returns the state of a static Narrative job started by submit_static_narrative.
+        Only the user who submitted the job can see it.
+    */
+    funcdef get_static_narrative_job(GetStaticNarrativeJobInput params) returns (StaticNarrativeJob job) authentication required;
+
+    /*
+        ws_id - the workspace id
+        verify - optional, if true, gets the info from the Workspace rather than the service's
+            own index of static narratives
+    */
     typedef structure {
         ws_id ws_id;
+        boolean verify;
     } GetStaticNarrativeInfo;
 
     /*
@@ -57,17 +121,51 @@ module StaticNarrative {
     /*
         Returns info about a created static narrative, given the workspace id.
         If no static narrative has been created, returns an empty structure.
+        This is answered from the service's index of the static narratives it has made,
+        unless verify is set.
     */
     funcdef get_static_narrative_info(GetStaticNarrativeInfo params) returns (StaticNarrativeInfo info) authentication required;
 
 
 
+    /*
+        All parameters are optional.
+        offset - the number of matching static narratives to skip (default 0)
+        limit - the most static narratives to return (default and maximum 1000)
+        min_ws_id - only include static narratives with at least this workspace id
+        max_ws_id - only include static narratives with at most this workspace id
+        saved_after - only include static narratives saved after this time (ms since epoch)
+        sort_by - either ws_id (the default) or static_saved
+        sort_desc - if true, sort in descending order
+    */
+    typedef structure {
+        int offset;
+        int limit;
+        ws_id min_ws_id;
+        ws_id max_ws_id;
+        int saved_after;
+        string sort_by;
+        boolean sort_desc;
+    } ListStaticNarrativesParams;
+
+    /*
+        count - the number of static narratives returned
+        total - the number of static narratives that matched, before offset and limit
+        narratives - the returned static narratives, by workspace id
+        order - the workspace ids of the returned static narratives, in sorted order
+    */
     typedef structure {
         int count;
+        int total;
         mapping<ws_id, StaticNarrativeInfo> narratives;
+        list<ws_id> order;
     } AllStaticNarratives;
 
-    funcdef list_static_narratives() returns (AllStaticNarratives narratives);
+    /*
+        Returns one page of the current static narrative of each workspace.
+        Called without params, this returns the first 1000 by workspace id.
+    */
+    funcdef list_static_narratives(ListStaticNarrativesParams params) returns (AllStaticNarratives narratives);
 
     /*
         state - a string, either OK or ...(TBD)
@@ -1,11 +1,12 @@
 # -*- coding: utf-8 -*-
 # BEGIN_HEADER
 
+from installed_clients.baseclient import configure_session_pool
+
+from StaticNarrative.clients import ServiceCaches, ServiceClients
 from StaticNarrative.creator import StaticNarrativeCreator
+from StaticNarrative.jobs import StaticNarrativeJobs
 from StaticNarrative.manager import StaticNarrativeManager
-from StaticNarrative.narrative.narrative_util import (
-    get_static_info,
-)
 
 # END_HEADER
 
@@ -37,6 +38,17 @@ class StaticNarrative:
     def __init__(self, config):
         # BEGIN_CONSTRUCTOR
         self.config = config
+        # all the service clients share one pool of connections per worker
+        configure_session_pool(
+            pool_connections=config.get("http-pool-connections", 10),
+            pool_maxsize=config.get("http-pool-maxsize", 10),
+            pool_block=str(config.get("http-pool-block", "false")).lower() == "true",
+            keep_alive=str(config.get("http-keep-alive", "true")).lower() == "true",
+        )
+        # the caches of service responses are shared by every request in a worker
+        self.caches = ServiceCaches(config)
+        # background jobs run on a small pool of threads in each worker
+        self.jobs = StaticNarrativeJobs(config, caches=self.caches)
         # END_CONSTRUCTOR
         pass
 
@@ -56,7 +68,7 @@ class StaticNarrative:
         # ctx is the context object
         # return variables are: output
         # BEGIN create_static_narrative
-        snc = StaticNarrativeCreator(self.config)
+        snc = StaticNarrativeCreator(self.config, caches=self.caches)
         params["user_id"] = ctx["user_id"]
         params["token"] = ctx["token"]
         output = snc.create_static_narrative(params)
@@ -71,12 +83,93 @@ class StaticNarrative:
         # return the results
         return [output]
 
+    def submit_static_narrative(self, ctx, params):
+        """
+        Starts creating a static Narrative from the given Narrative ref string in the background.
+        Returns a job id to check on it with get_static_narrative_job.
+        :param params: instance of type "CreateStaticNarrativeInput"
+           (narrative_ref - the reference to the Narrative object to make a
+           static version of. must include version! overwrite - if true,
+           overwrite any previous version of the static Narrative.) ->
+           structure: parameter "narrative_ref" of type "ws_ref" (a workspace
+           object reference string (of the form wsid/objid/ver)), parameter
+           "overwrite" of type "boolean" (allowed 0 or 1)
+        :returns: instance of type "SubmitStaticNarrativeOutput" ->
+           structure: parameter "job_id" of String
+        """
+        # ctx is the context object
+        # return variables are: output
+        # BEGIN submit_static_narrative
+        job_id = self.jobs.submit(params, ctx["user_id"], ctx["token"])
+        output = {"job_id": job_id}
+        # END submit_static_narrative
+
+        # At some point might do deeper type checking...
+        if not isinstance(output, dict):
+            raise ValueError(
+                "Method submit_static_narrative return value "
+                + "output is not type dict as required."
+            )
+        # return the results
+        return [output]
+
+    def get_static_narrative_job(self, ctx, params):
+        """
+        Returns the state of a static Narrative job started by submit_static_narrative.
+        Only the user who submitted the job can see it.
+        :param params: instance of type "GetStaticNarrativeJobInput" ->
+           structure: parameter "job_id" of String
+        :returns: instance of type "StaticNarrativeJob" (job_id - the id of
+           the job narrative_ref - the reference to the Narrative object
+           being made static state - one of queued, running, completed, error
+           stage - the name of the stage that's running (absent or null if
+           none are) stages - the progress of each stage, in order
+           static_narrative_url - the url of the static Narrative, once the
+           job is completed error - the error message, if the job failed
+           created - ms since epoch of when the job was submitted started -
+           ms since epoch of when the job started running finished - ms since
+           epoch of when the job finished) -> structure: parameter "job_id"
+           of String, parameter "narrative_ref" of type "ws_ref" (a workspace
+           object reference string (of the form wsid/objid/ver)), parameter
+           "state" of String, parameter "stage" of String, parameter "stages"
+           of list of type "StaticNarrativeJobStage" (name - the name of the
+           stage, one of check_permissions, check_existing, export, upload
+           state - one of queued, running, completed, error, skipped started
+           - ms since epoch of when the stage started (absent if it hasn't)
+           finished - ms since epoch of when the stage finished (absent if it
+           hasn't)) -> structure: parameter "name" of String, parameter
+           "state" of String, parameter "started" of Long, parameter
+           "finished" of Long, parameter "static_narrative_url" of type "url",
+           parameter "error" of String, parameter "created" of Long,
+           parameter "started" of Long, parameter "finished" of Long
+        """
+        # ctx is the context object
+        # return variables are: job
+        # BEGIN get_static_narrative_job
+        job = self.jobs.get_job(params.get("job_id"), ctx["user_id"])
+        # END get_static_narrative_job
+
+        # At some point might do deeper type checking...
+        if not isinstance(job, dict):
+            raise ValueError(
+                "Method get_static_narrative_job return value "
+                + "job is not type dict as required."
+            )
+        # return the results
+        return [job]
+
     def get_static_narrative_info(self, ctx, params):
         """
         Returns info about a created static narrative, given the workspace id.
         If no static narrative has been created, returns an empty structure.
-        :param params: instance of type "GetStaticNarrativeInfo" ->
-           structure: parameter "ws_id" of type "ws_id" (a workspace id)
+        This is answered from the service's index of the static narratives it has made,
+        unless verify is set.
+        :param params: instance of type "GetStaticNarrativeInfo" (ws_id - the
+           workspace id verify - optional, if true, gets the info from the
+           Workspace rather than the service's own index of static
+           narratives) -> structure: parameter "ws_id" of type "ws_id" (a
+           workspace id), parameter "verify" of type "boolean" (allowed 0 or
+           1)
         :returns: instance of type "StaticNarrativeInfo" (ws_id - the
            workspace id narrative_id - the id of the narrative object made
            static narrative_version - the version of the narrative object
@@ -92,8 +185,10 @@ class StaticNarrative:
         # ctx is the context object
         # return variables are: info
         # BEGIN get_static_narrative_info
-        info = get_static_info(
-            self.config["workspace-url"], ctx["token"], params.get("ws_id")
+        clients = ServiceClients(self.config, ctx["token"], caches=self.caches)
+        manager = StaticNarrativeManager(self.config)
+        info = manager.get_static_narrative_info(
+            params.get("ws_id"), clients, verify=bool(params.get("verify"))
         )
         # END get_static_narrative_info
 
@@ -106,27 +201,49 @@ class StaticNarrative:
         # return the results
         return [info]
 
-    def list_static_narratives(self, ctx):
+    def list_static_narratives(self, ctx, params=None):
         """
-        :returns: instance of type "AllStaticNarratives" -> structure:
-           parameter "count" of Long, parameter "narratives" of mapping from
-           type "ws_id" (a workspace id) to type "StaticNarrativeInfo" (ws_id
-           - the workspace id narrative_id - the id of the narrative object
-           made static narrative_version - the version of the narrative
-           object saved url - the url of the static narrative (just the path,
-           the Narrative front end should provide the host) narr_saved - ms
-           since epoch of when the narrative that was made static was saved.
-           static_saved - ms since epoch of when the static narrative was
-           saved) -> structure: parameter "ws_id" of type "ws_id" (a
-           workspace id), parameter "narrative_id" of Long, parameter
-           "narrative_version" of Long, parameter "url" of type "url",
-           parameter "narr_saved" of Long, parameter "static_saved" of Long
+        Returns one page of the current static narrative of each workspace.
+        Called without params, this returns the first 1000 by workspace id.
+        :param params: instance of type "ListStaticNarrativesParams" (All
+           parameters are optional. offset - the number of matching static
+           narratives to skip (default 0) limit - the most static narratives
+           to return (default and maximum 1000) min_ws_id - only include
+           static narratives with at least this workspace id max_ws_id -
+           only include static narratives with at most this workspace id
+           saved_after - only include static narratives saved after this
+           time (ms since epoch) sort_by - either ws_id (the default) or
+           static_saved sort_desc - if true, sort in descending order) ->
+           structure: parameter "offset" of Long, parameter "limit" of Long,
+           parameter "min_ws_id" of type "ws_id" (a workspace id), parameter
+           "max_ws_id" of type "ws_id" (a workspace id), parameter
+           "saved_after" of Long, parameter "sort_by" of String, parameter
+           "sort_desc" of type "boolean" (allowed 0 or 1)
+        :returns: instance of type "AllStaticNarratives" (count - the number
+           of static narratives returned total - the number of static
+           narratives that matched, before offset and limit narratives - the
+           returned static narratives, by workspace id order - the workspace
+           ids of the returned static narratives, in sorted order) ->
+           structure: parameter "count" of Long, parameter "total" of Long,
+           parameter "narratives" of mapping from type "ws_id" (a workspace
+           id) to type "StaticNarrativeInfo" (ws_id - the workspace id
+           narrative_id - the id of the narrative object made static
+           narrative_version - the version of the narrative object saved url
+           - the url of the static narrative (just the path, the Narrative
+           front end should provide the host) narr_saved - ms since epoch of
+           when the narrative that was made static was saved. static_saved -
+           ms since epoch of when the static narrative was saved) ->
+           structure: parameter "ws_id" of type "ws_id" (a workspace id),
+           parameter "narrative_id" of Long, parameter "narrative_version" of
+           Long, parameter "url" of type "url", parameter "narr_saved" of
+           Long, parameter "static_saved" of Long, parameter "order" of list
+           of type "ws_id" (a workspace id)
         """
         # ctx is the context object
         # return variables are: narratives
         # BEGIN list_static_narratives
         manager = StaticNarrativeManager(self.config)
-        narratives = manager.list_static_narratives()
+        narratives = manager.list_static_narratives(params or {})
         # END list_static_narratives
 
         # At some point might do deeper type checking...
@@ -345,13 +345,21 @@ class Application(object):
                              name='StaticNarrative.create_static_narrative',
                              types=[dict])
         self.method_authentication['StaticNarrative.create_static_narrative'] = 'required'  # noqa
+        self.rpc_service.add(impl_StaticNarrative.submit_static_narrative,
+                             name='StaticNarrative.submit_static_narrative',
+                             types=[dict])
+        self.method_authentication['StaticNarrative.submit_static_narrative'] = 'required'  # noqa
+        self.rpc_service.add(impl_StaticNarrative.get_static_narrative_job,
+                             name='StaticNarrative.get_static_narrative_job',
+                             types=[dict])
+        self.method_authentication['StaticNarrative.get_static_narrative_job'] = 'required'  # noqa
         self.rpc_service.add(impl_StaticNarrative.get_static_narrative_info,
                              name='StaticNarrative.get_static_narrative_info',
                              types=[dict])
         self.method_authentication['StaticNarrative.get_static_narrative_info'] = 'required'  # noqa
         self.rpc_service.add(impl_StaticNarrative.list_static_narratives,
                              name='StaticNarrative.list_static_narratives',
-                             types=[])
+                             types=[dict])
         self.method_authentication['StaticNarrative.list_static_narratives'] = 'none'  # noqa
         self.rpc_service.add(impl_StaticNarrative.status,
                              name='StaticNarrative.status',
@@ -0,0 +1,93 @@
+"""
+The auth client for the service's server. StaticNarrativeServer imports KBaseAuth from here
+instead of from installed_clients.authclient, if it's here, so this is where the server's
+token cache gets set up without changing any generated code.
+
+The users of valid tokens are kept in a TTLCache, like the service's other caches, with its
+size and TTL (in seconds) from the "auth-token-cache-size" and "auth-token-cache-ttl" config
+values (defaults 2000 and 300).
+"""
+import hashlib
+import os
+from configparser import ConfigParser
+from typing import Any
+
+from installed_clients.authclient import KBaseAuth as _KBaseAuth
+
+from StaticNarrative.ttl_cache import TTLCache
+
+DEFAULT_TOKEN_CACHE_SIZE = 2000
+DEFAULT_TOKEN_CACHE_TTL = 300
+
+
+class TokenCache(TTLCache):
+    """
+    Caches the users of valid tokens, with the same methods as
+    installed_clients.authclient.TokenCache. Tokens are stored hashed, so they're never
+    kept in memory as they are.
+    """
+
+    @staticmethod
+    def from_config(config: dict[str, Any]) -> "TokenCache":
+        """
+        Creates a TokenCache with its size and TTL from the "auth-token-cache-size" and
+        "auth-token-cache-ttl" config values.
+
+        :param config: dict - the service config
+        """
+        return TokenCache(
+            int(config.get("auth-token-cache-size", DEFAULT_TOKEN_CACHE_SIZE)),
+            float(config.get("auth-token-cache-ttl", DEFAULT_TOKEN_CACHE_TTL)),
+        )
+
+    def get_user(self: "TokenCache", token: str) -> str | None:
+        """Returns the user of token, or None if it's not cached."""
+        return self.get(_hash_token(token))
+
+    def add_valid_token(self: "TokenCache", token: str, user: str) -> None:
+        """Caches the user of a token that was just validated."""
+        if not token:
+            raise ValueError("Must supply token")
+        if not user:
+            raise ValueError("Must supply user")
+        self.put(_hash_token(token), user)
+
+
+class KBaseAuth(_KBaseAuth):
+    """
+    An installed_clients.authclient.KBaseAuth that gets its token cache from the service
+    config, found with KB_DEPLOYMENT_CONFIG, unless it's given one.
+    """
+
+    def __init__(
+        self: "KBaseAuth",
+        auth_url: str | None = None,
+        token_cache: TokenCache | None = None,
+        display_name_cache: TTLCache | None = None,
+    ) -> None:
+        """
+        :param auth_url: str - the auth service URL
+        :param token_cache: TokenCache - optional, the cache of users of valid tokens
+        :param display_name_cache: TTLCache - optional, the cache of user display names
+        """
+        if token_cache is None:
+            token_cache = TokenCache.from_config(_deploy_config())
+        super().__init__(
+            auth_url, token_cache=token_cache, display_name_cache=display_name_cache
+        )
+
+
+def _hash_token(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+def _deploy_config() -> dict[str, str]:
+    """Returns the service config, or an empty one if KB_DEPLOYMENT_CONFIG isn't set."""
+    config_file = os.environ.get("KB_DEPLOYMENT_CONFIG")
+    if not config_file:
+        return {}
+    parser = ConfigParser()
+    parser.read(config_file)
+    if not parser.has_section("StaticNarrative"):
+        return {}
+    return dict(parser.items("StaticNarrative"))
@@ -0,0 +1,191 @@
+"""
+The service clients used while handling a single request.
+"""
+import threading
+from collections import Counter
+from typing import Any
+
+from installed_clients.authclient import KBaseAuth
+from installed_clients.NarrativeMethodStoreClient import NarrativeMethodStore
+from installed_clients.NarrativeServiceClient import NarrativeService
+from installed_clients.WorkspaceClient import Workspace
+
+from StaticNarrative.exporter.app_specs import AppSpecCache
+from StaticNarrative.exporter.object_cache import ObjectCache
+from StaticNarrative.narrative.narrative_util import get_workspace_snapshot
+from StaticNarrative.ttl_cache import TTLCache
+
+DEFAULT_DISPLAY_NAME_CACHE_SIZE = 0
+DEFAULT_DISPLAY_NAME_CACHE_TTL = 3600
+
+
+class ServiceCaches:
+    """
+    Holds the caches of service responses that every request in a worker shares. The
+    service makes one of these when it starts, and hands it to the ServiceClients for
+    each request.
+    """
+
+    def __init__(self: "ServiceCaches", config: dict[str, Any]) -> None:
+        """
+        :param config: dict - the service config. See AppSpecCache.from_config and
+            ObjectCache.from_config for the app spec and object caches. The user display
+            name cache's size and TTL (in seconds) come from the
+            "auth-display-name-cache-size" and "auth-display-name-cache-ttl" config values
+            (defaults 0 and 3600), and it's turned off if the size is 0.
+        """
+        self.app_specs = AppSpecCache.from_config(config)
+        self.objects = ObjectCache.from_config(config)
+        display_name_size = int(
+            config.get("auth-display-name-cache-size", DEFAULT_DISPLAY_NAME_CACHE_SIZE)
+        )
+        self.display_names = None
+        if display_name_size > 0:
+            self.display_names = TTLCache(
+                display_name_size,
+                float(
+                    config.get(
+                        "auth-display-name-cache-ttl", DEFAULT_DISPLAY_NAME_CACHE_TTL
+                    )
+                ),
+            )
+
+    def stats(self: "ServiceCaches") -> dict[str, dict[str, int | float]]:
+        """Returns the hit and miss counts of each cache that's on, see TTLCache.stats."""
+        stats = {
+            "app_specs": self.app_specs.stats(),
+            "objects": self.objects.stats(),
+        }
+        if self.display_names is not None:
+            stats["display_names"] = self.display_names.stats()
+        return stats
+
+
+class ServiceClients:
+    """
+    Holds the clients for every service called while handling one request, all set up with
+    the same token. Each client is made on first use, then reused for the rest of the request,
+    and they all share the pooled HTTP session from installed_clients.baseclient.
+
+    Every call made through these clients gets counted in call_counts, keyed by the
+    service method name (e.g. "Workspace.get_objects2").
+
+    Workspace info and permissions are looked up once per request, see workspace_snapshot.
+    """
+
+    def __init__(
+        self: "ServiceClients",
+        config: dict[str, Any],
+        token: str,
+        caches: ServiceCaches | None = None,
+    ) -> None:
+        """
+        :param config: dict - the service config (needs workspace-url, nms-url, srv-wiz-url,
+            and auth-url)
+        :param token: str - the auth token for the request
+        :param caches: ServiceCaches - optional, the worker's caches. If not given, this
+            request gets its own.
+        """
+        self.config = config
+        self.token = token
+        self.caches = caches or ServiceCaches(config)
+        self.call_counts = Counter()
+        self._clients = {}
+        self._lock = threading.Lock()
+        self._snapshots = {}
+        self._snapshot_lock = threading.Lock()
+
+    @property
+    def workspace(self: "ServiceClients") -> Workspace:
+        """A Workspace client using the request token."""
+        return self._get_client(
+            "workspace",
+            lambda: Workspace(url=self.config["workspace-url"], token=self.token),
+        )
+
+    @property
+    def narrative_method_store(self: "ServiceClients") -> NarrativeMethodStore:
+        """A NarrativeMethodStore client. App info is public, so this has no token."""
+        return self._get_client(
+            "narrative_method_store",
+            lambda: NarrativeMethodStore(url=self.config["nms-url"]),
+        )
+
+    @property
+    def narrative_service(self: "ServiceClients") -> NarrativeService:
+        """A NarrativeService client (via the Service Wizard) using the request token."""
+        return self._get_client(
+            "narrative_service",
+            lambda: NarrativeService(url=self.config["srv-wiz-url"], token=self.token),
+        )
+
+    @property
+    def auth(self: "ServiceClients") -> KBaseAuth:
+        """An Auth client."""
+        return self._get_client(
+            "auth",
+            lambda: KBaseAuth(
+                self.config["auth-url"],
+                display_name_cache=self.caches.display_names,
+            ),
+        )
+
+    def workspace_snapshot(self: "ServiceClients", ws_id: int) -> dict[str, Any]:
+        """
+        Returns the info and permissions of a workspace, as seen with the request token
+        (see narrative_util.get_workspace_snapshot). They're fetched on first use, then the
+        permission checks and the author list all share that one lookup for the rest of
+        the request.
+
+        :param ws_id: int - the workspace id
+        """
+        # not self._lock, that's taken to count the calls this makes
+        with self._snapshot_lock:
+            ws_id = int(ws_id)
+            if ws_id not in self._snapshots:
+                self._snapshots[ws_id] = get_workspace_snapshot(self.workspace, ws_id)
+            return self._snapshots[ws_id]
+
+    def _get_client(self: "ServiceClients", name: str, make_client: Any) -> Any:
+        with self._lock:
+            if name not in self._clients:
+                self._clients[name] = self._count_calls(make_client())
+            return self._clients[name]
+
+    def _count_calls(self: "ServiceClients", client: Any) -> Any:
+        """
+        Wraps the client so each call it makes to its service gets counted. The generated
+        SDK clients all make their calls through their BaseClient's _call method, and the
+        Auth client's calls that get made during an export are through
+        _fetch_display_names (display names found in its cache don't make a call).
+        """
+        if isinstance(client, KBaseAuth):
+            fetch_display_names = client._fetch_display_names  # noqa: SLF001
+
+            def counted_fetch_display_names(*args: Any, **kwargs: Any) -> dict:
+                self._count("Auth.get_display_names")
+                return fetch_display_names(*args, **kwargs)
+
+            client._fetch_display_names = counted_fetch_display_names  # noqa: SLF001
+            return client
+
+        base_client = client._client  # noqa: SLF001
+        call = base_client._call  # noqa: SLF001
+
+        def counted_call(
+            url: str, method: str, params: list, context: dict | None = None
+        ) -> Any:
+            self._count(method)
+            return call(url, method, params, context)
+
+        base_client._call = counted_call  # noqa: SLF001
+        return client
+
+    def _count(self: "ServiceClients", method: str) -> None:
+        with self._lock:
+            self.call_counts[method] += 1
+
+    def total_calls(self: "ServiceClients") -> int:
+        """Returns the total number of service calls made so far."""
+        with self._lock:
+            return sum(self.call_counts.values())
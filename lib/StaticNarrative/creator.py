@@ -1,19 +1,55 @@
 import logging
 import os
+import shutil
+from collections.abc import Callable
+from typing import Any
 
+from StaticNarrative.clients import ServiceCaches, ServiceClients
+from StaticNarrative.exporter.data_exporter import (
+    get_narrative_data,
+    read_narrative_data,
+)
 from StaticNarrative.exporter.exporter import NarrativeExporter
+from StaticNarrative.fingerprint import narrative_fingerprint
 from StaticNarrative.narrative.narrative_util import (
+    get_narrative_saved,
+    get_saved_narrative_url,
     save_narrative_url,
     verify_admin_privilege,
     verify_public_narrative,
 )
 from StaticNarrative.narrative_ref import NarrativeRef
-from StaticNarrative.uploader.uploader import upload_static_narrative
+from StaticNarrative.registry import get_registry
+from StaticNarrative.single_flight import LockTimeoutError, SingleFlight, file_lock
+from StaticNarrative.uploader.compressor import get_compressor
+from StaticNarrative.uploader.uploader import (
+    find_static_narrative,
+    make_staging_dir,
+    register_static_narrative,
+    static_narrative_path,
+    upload_static_narrative,
+)
+
+# The stages of creating a static narrative, in order, as reported to on_stage.
+STAGES = ["check_permissions", "check_existing", "export", "upload"]
+
+# Requests in this process that are creating static narratives, by narrative ref.
+_exports = SingleFlight()
 
 
 class StaticNarrativeCreator:
-    def __init__(self: "StaticNarrativeCreator", config: dict) -> None:
+    def __init__(
+        self: "StaticNarrativeCreator",
+        config: dict,
+        caches: ServiceCaches | None = None,
+    ) -> None:
+        """
+        :param config: dict - the service config
+        :param caches: ServiceCaches - optional, the worker's caches. If not given, each
+            static narrative gets made with its own.
+        """
         self.config = config
+        self.caches = caches
         logging.basicConfig(
             format="%(created)s %(levelname)s: %(message)s", level=logging.INFO
         )
@@ -26,27 +62,164 @@ class StaticNarrativeCreator:
         self.logger.addHandler(ch)
 
     def create_static_narrative(
-        self: "StaticNarrativeCreator", params: dict[str, str]
+        self: "StaticNarrativeCreator",
+        params: dict[str, str],
+        on_stage: Callable[[str], None] | None = None,
     ) -> dict[str, str]:
         """Create a static narrative from a narrative reference.
 
+        Unless params["overwrite"] is true, this first checks whether the static narrative
+        was already made from the same inputs (see StaticNarrative.fingerprint). If so,
+        that one's URL gets returned without exporting the narrative again.
+
+        Concurrent requests for the same ref and overwrite flag get coalesced, so it's only
+        exported once - see _create. Requests that share another one's export get its
+        stages passed on to their on_stage as well. A request to overwrite never shares
+        one that might reuse the existing static narrative.
+
         :param params: query params
         :type params: dict
+        :param on_stage: called with the name of each stage (see STAGES) as it starts
+        :type on_stage: Callable[[str], None] | None
         :return: dictionary containing the resulting static narrative URL
         :rtype: dict[str, str]
         """
+        on_stage = on_stage or (lambda _: None)
         ref = NarrativeRef.parse(params["narrative_ref"])
         token = params["token"]
         user_id = params["user_id"]
         self.logger.info(f"Creating Static Narrative {ref}")
-        self.check_permissions(ref, user_id=user_id, token=token)
-        output_path = self.export_narrative(ref, user_id=user_id, token=token)
-        static_url = self.upload_and_save(ref, token=token, output_path=output_path)
+        clients = ServiceClients(self.config, token, caches=self.caches)
+        on_stage("check_permissions")
+        self.check_permissions(ref, user_id=user_id, clients=clients)
+
+        overwrite = bool(params.get("overwrite"))
+        flight_key = f"{ref} overwrite" if overwrite else str(ref)
+        static_url, shared = _exports.do(
+            flight_key,
+            lambda: self._create(
+                ref,
+                user_id,
+                clients,
+                overwrite,
+                lambda stage: _exports.report(flight_key, stage),
+            ),
+            on_progress=on_stage,
+        )
+        if shared:
+            self.logger.info(f"Shared Static Narrative {ref} with another request")
+        self.logger.info(
+            f"Made {clients.total_calls()} service calls for Static Narrative {ref}: "
+            f"{dict(clients.call_counts)}"
+        )
+        self.logger.info(f"Service caches: {clients.caches.stats()}")
 
         return {"static_narrative_url": static_url}
 
+    def _create(
+        self: "StaticNarrativeCreator",
+        ref: NarrativeRef,
+        user_id: str,
+        clients: ServiceClients,
+        overwrite: bool,
+        on_stage: Callable[[str], None],
+    ) -> str:
+        """Does the work of creating the static narrative, once permissions are checked.
+
+        Only one process at a time does this for each ref, under a lock file in the
+        scratch directory. A process that had to wait for another to finish uses the
+        static narrative that was just made, if it's unchanged, unless overwrite is set.
+        Waiting takes at most the "lock-timeout" config value, in seconds (default 600).
+
+        :return: URL for the static narrative
+        :rtype: str
+        """
+        lock_path = os.path.join(
+            self.config["scratch"], "locks", f"{ref.wsid}.{ref.objid}.{ref.ver}.lock"
+        )
+        try:
+            with file_lock(lock_path, timeout=self._lock_timeout()) as waited:
+                return self._create_locked(
+                    ref, user_id, clients, overwrite, on_stage, waited
+                )
+        except LockTimeoutError as e:
+            raise LockTimeoutError(
+                f"Timed out waiting for another worker to finish creating Static "
+                f"Narrative {ref}"
+            ) from e
+
+    def _create_locked(
+        self: "StaticNarrativeCreator",
+        ref: NarrativeRef,
+        user_id: str,
+        clients: ServiceClients,
+        overwrite: bool,
+        on_stage: Callable[[str], None],
+        waited: bool,
+    ) -> str:
+        """Does the work of _create, once it holds the lock for ref."""
+        if waited:
+            self.logger.info(f"Waited on another worker for Static Narrative {ref}")
+        narrative_data = None
+        fingerprint = None
+        if not overwrite:
+            on_stage("check_existing")
+            # The workspace's data can change without a new Narrative version, so its
+            # listing is part of the fingerprint. If it's exported, this gets reused.
+            narrative_data = get_narrative_data(ref.wsid, clients.narrative_service)
+            fingerprint = narrative_fingerprint(ref, narrative_data, self.config)
+            static_url = find_static_narrative(
+                ref, self.config["static-file-root"], fingerprint
+            )
+            if static_url is not None:
+                self.logger.info(
+                    f"Static Narrative {ref} is unchanged, using the existing one"
+                )
+                # only write to the Workspace if its metadata is out of date
+                static_saved = get_saved_narrative_url(
+                    clients.workspace_snapshot(ref.wsid)["info"], ref, static_url
+                )
+                if static_saved is None:
+                    static_saved = save_narrative_url(
+                        clients.workspace, ref, static_url
+                    )
+                register_static_narrative(
+                    ref,
+                    self.config["static-file-root"],
+                    get_registry(self.config),
+                    static_saved,
+                )
+                # in case it was published before it'd get compressed
+                self.compress_later(ref)
+                return static_url
+
+        on_stage("export")
+        output_path = self.export_narrative(
+            ref, user_id=user_id, clients=clients, narrative_data=narrative_data
+        )
+        if fingerprint is None:
+            fingerprint = narrative_fingerprint(
+                ref,
+                read_narrative_data(os.path.dirname(output_path)),
+                self.config,
+            )
+        on_stage("upload")
+        return self.upload_and_save(
+            ref, clients=clients, output_path=output_path, fingerprint=fingerprint
+        )
+
+    def _lock_timeout(self: "StaticNarrativeCreator") -> float:
+        """
+        Returns how long to wait for another worker making the same static narrative, in
+        seconds, from the "lock-timeout" config value (default 600).
+        """
+        return float(self.config.get("lock-timeout", 600))
+
     def check_permissions(
-        self: "StaticNarrativeCreator", ref: NarrativeRef, user_id: str, token: str
+        self: "StaticNarrativeCreator",
+        ref: NarrativeRef,
+        user_id: str,
+        clients: ServiceClients,
     ) -> None:
         """Ensure the narrative and user have appropriate permissions for SN creation.
 
@@ -54,15 +227,19 @@ class StaticNarrativeCreator:
         :type ref: NarrativeRef
         :param user_id: user ID
         :type user_id: str
-        :param token: user token
-        :type token: str
+        :param clients: service clients for this request
+        :type clients: ServiceClients
         """
-        ws_url = self.config["workspace-url"]
-        verify_admin_privilege(ws_url, user_id, token, ref.wsid)
-        verify_public_narrative(ws_url, ref.wsid)
+        perms = clients.workspace_snapshot(ref.wsid)["perms"]
+        verify_admin_privilege(perms, user_id, ref.wsid)
+        verify_public_narrative(perms, ref.wsid)
 
     def export_narrative(
-        self: "StaticNarrativeCreator", ref: NarrativeRef, user_id: str, token: str
+        self: "StaticNarrativeCreator",
+        ref: NarrativeRef,
+        user_id: str,
+        clients: ServiceClients,
+        narrative_data: dict[str, Any] | None = None,
     ) -> str:
         """Create an output directory and export the SN to a file.
 
@@ -70,49 +247,82 @@ class StaticNarrativeCreator:
         :type ref: NarrativeRef
         :param user_id: user ID
         :type user_id: str
-        :param token: user token
-        :type token: str
+        :param clients: service clients for this request
+        :type clients: ServiceClients
+        :param narrative_data: the narrative's data listing, if already fetched
+        :type narrative_data: dict[str, Any] | None
         :return: path to the SN created by the exporter
         :rtype: str
         """
-        exporter = NarrativeExporter(self.config, user_id, token)
-        # set up output directories
+        exporter = NarrativeExporter(
+            self.config, user_id, clients.token, clients=clients
+        )
+        # set up the staging directory, which gets published as it is
         try:
-            output_dir = os.path.join(
-                self.config["scratch"], str(ref.wsid), str(ref.objid), str(ref.ver)
+            output_dir = make_staging_dir(
+                ref,
+                self.config["static-file-root"],
+                staging_root=self.config.get("staging-dir"),
             )
-            os.makedirs(output_dir, exist_ok=True)
         except OSError as e:
-            self.logger.error("Error while creating Static Narrative directory", e)
+            self.logger.error(f"Error while creating Static Narrative directory: {e}")
             raise
 
         # export the narrative to a file
         try:
-            output_path = exporter.export_narrative(ref, output_dir)
+            output_path = exporter.export_narrative(
+                ref, output_dir, narrative_data=narrative_data
+            )
         except Exception as e:
-            self.logger.error("Error while exporting Narrative", e)
+            self.logger.error(f"Error while exporting Narrative: {e}")
+            shutil.rmtree(output_dir, ignore_errors=True)
             raise
 
         return output_path
 
     def upload_and_save(
-        self: "StaticNarrativeCreator", ref: NarrativeRef, token: str, output_path: str
+        self: "StaticNarrativeCreator",
+        ref: NarrativeRef,
+        clients: ServiceClients,
+        output_path: str,
+        fingerprint: str | None = None,
     ) -> str:
-        """Upload the static narrative and save the URL to the ws metadata.
+        """Upload the static narrative, save the URL to the ws metadata, and record it in
+        the registry.
 
         :param ref: reference for the narrative
         :type ref: NarrativeRef
-        :param token: user token
-        :type token: str
+        :param clients: service clients for this request
+        :type clients: ServiceClients
         :param output_path: path to the saved output
         :type output_path: str
+        :param fingerprint: fingerprint of the static narrative, stored alongside it
+        :type fingerprint: str | None
         :return: URL for the static narrative
         :rtype: str
         """
         # upload it and save it to the Workspace metadata before returning the url path
         static_url = upload_static_narrative(
-            ref, output_path, self.config["static-file-root"]
+            ref, output_path, self.config["static-file-root"], fingerprint=fingerprint
         )
-        save_narrative_url(self.config["workspace-url"], token, ref, static_url)
+        static_saved = save_narrative_url(clients.workspace, ref, static_url)
+        register_static_narrative(
+            ref,
+            self.config["static-file-root"],
+            get_registry(self.config),
+            static_saved,
+            narr_saved=get_narrative_saved(clients.workspace, ref),
+        )
+        self.compress_later(ref)
         self.logger.info(f"Finished creating Static Narrative {ref}")
         return static_url
+
+    def compress_later(self: "StaticNarrativeCreator", ref: NarrativeRef) -> None:
+        """Queue up writing the compressed copies of a published static narrative's files.
+
+        :param ref: reference for the narrative
+        :type ref: NarrativeRef
+        """
+        get_compressor(self.config).compress_later(
+            static_narrative_path(ref, self.config["static-file-root"])
+        )
@@ -6,15 +6,74 @@ from installed_clients.WorkspaceClient import Workspace
 
 from .processor_util import build_report_view_data
 
+UPA_REGEX = r"^\d+\/\d+\/\d+$"
+
+
+def get_exec_result(app_cell: dict[str, Any]) -> list | dict | None:
+    """
+    Returns the result of the job run by an app cell, from either an NJS (aka EE1)
+    or EE2 job state. If the app hasn't been run, this returns an empty list.
+    :param app_cell: the appCell part of the cell's kbase metadata
+    """
+    job_state = app_cell.get("exec", {}).get("jobState", {})
+    if "result" in job_state:  # NJS (aka EE1)
+        return job_state["result"]
+    if "job_output" in job_state:  # EE2
+        return job_state["job_output"].get("result")
+    return []
+
+
+def get_param_upas(
+    value: None | int | str | list[str], param_spec: dict[str, Any]
+) -> list[str]:
+    """
+    Returns the list of UPAs in a parameter value, if that parameter is an object input
+    (i.e. a text field with some valid_ws_types in its spec).
+    :param value: the parameter value
+    :param param_spec: the spec for that parameter
+    """
+    upas = []
+    if param_spec["field_type"] == "text":
+        valid_ws_types = param_spec.get("text_options", {}).get("valid_ws_types", [])
+        if len(valid_ws_types) > 0 and value:
+            if isinstance(value, list):
+                for v in value:
+                    if _is_upa(v):
+                        upas.append(v)
+            elif _is_upa(value):
+                upas.append(value)
+    return upas
+
+
+def _is_upa(s: str) -> bool:
+    """
+    An UPA matches this structure: ##/##/##
+    E.g. 123/456/789
+    """
+    return re.match(UPA_REGEX, s) is not None
+
 
 class AppProcessor:
     def __init__(
-        self: "AppProcessor", host: str, ws_url: str, nms_url: str, token: str
+        self: "AppProcessor",
+        host: str,
+        ws_client: Workspace,
+        prefetched: dict[str, dict[str, Any]] | None = None,
+        report_dir: str | None = None,
     ) -> None:
+        """
+        :param host: str - the host for links out to the Narrative site
+        :param ws_client: Workspace - the Workspace client for the export
+        :param prefetched: optional - Workspace data that's already been fetched for the
+            whole Narrative (see prefetch.prefetch_narrative_data). Anything found here
+            won't be fetched again.
+        :param report_dir: optional - the directory to write report files into (see
+            published_files). If not given, reports get inlined in the page.
+        """
         self.host = host
-        self.ws_url = ws_url
-        self.nms_url = nms_url
-        self.token = token
+        self.ws_client = ws_client
+        self.prefetched = prefetched or {"reports": {}, "infos": {}}
+        self.report_dir = report_dir
 
     def process(
         self: "AppProcessor", kb_info: dict[str, Any], kb_meta: dict[str, Any]
@@ -38,18 +97,18 @@ class AppProcessor:
             kb_meta["appCell"]["params"],
         )
         exec_state = kb_meta["appCell"].get("exec", {})
-        exec_result = []
-        job_state = exec_state.get("jobState", {})
-        if "result" in job_state:  # NJS (aka EE1)
-            exec_result = job_state["result"]
-        elif "job_output" in job_state:  # EE2
-            exec_result = job_state["job_output"].get("result")
-
-        ws_client = Workspace(self.ws_url, token=self.token)
+        exec_result = get_exec_result(kb_meta["appCell"])
+
         kb_info["output"] = {
             "widget": exec_state.get("outputWidgetInfo", {}),
             "result": exec_result,
-            "report": build_report_view_data(self.host, ws_client, exec_result),
+            "report": build_report_view_data(
+                self.host,
+                self.ws_client,
+                exec_result,
+                prefetched=self.prefetched,
+                report_dir=self.report_dir,
+            ),
         }
         kb_info["job"] = {"state": "This app is new, and hasn't been started."}
         if "exec" in kb_meta["appCell"]:
@@ -84,25 +143,20 @@ class AppProcessor:
         value: None | int | str | list[str],
         param_spec: dict[str, Any],
     ) -> dict[str, Any]:
-        upas = []
-        if param_spec["field_type"] == "text":
-            valid_ws_types = param_spec.get("text_options", {}).get(
-                "valid_ws_types", []
-            )
-            if len(valid_ws_types) > 0 and value:
-                if isinstance(value, list):
-                    for v in value:
-                        if self._is_upa(v):
-                            upas.append(v)
-                elif self._is_upa(value):
-                    upas.append(value)
+        upas = get_param_upas(value, param_spec)
         upa_map = {}
-        if len(upas):
-            ws_client = Workspace(url=self.ws_url, token=self.token)
-            obj_infos = ws_client.get_object_info3(
-                {"objects": [{"ref": upa} for upa in upas]}
+        missing = []
+        for upa in upas:
+            info = self.prefetched["infos"].get(upa)
+            if info is None:
+                missing.append(upa)
+            else:
+                upa_map[upa] = info
+        if len(missing):
+            obj_infos = self.ws_client.get_object_info3(
+                {"objects": [{"ref": upa} for upa in missing]}
             )["infos"]
-            upa_map = {u: obj_infos[i] for i, u in enumerate(upas)}
+            upa_map.update({u: obj_infos[i] for i, u in enumerate(missing)})
         return upa_map
 
     def _translate_param_value(
@@ -137,14 +191,6 @@ class AppProcessor:
                     value = upas[value][1] if value in upas else value
         return value
 
-    def _is_upa(self: "AppProcessor", s: str) -> bool:
-        """
-        An UPA matches this structure: ##/##/##
-        E.g. 123/456/789
-        """
-        upa_regex = r"^\d+\/\d+\/\d+$"
-        return re.match(upa_regex, s) is not None
-
     def _get_job_state(self: "AppProcessor", app_meta: dict[str, Any]) -> str:
         """
         Returns the job state as a readable string.
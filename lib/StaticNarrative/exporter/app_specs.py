@@ -0,0 +1,78 @@
+"""
+A cache of app specs from the NarrativeMethodStore, shared by every export in a worker
+(see clients.ServiceCaches).
+
+Only the app names and publications are needed to build the citations for a Narrative,
+and the same few hundred apps show up in most of them. Specs for a release tag rarely
+change, so they're kept for a while (see AppSpecCache.from_config) and only the apps that
+aren't cached get looked up.
+"""
+import logging
+from typing import Any
+
+from installed_clients.baseclient import ServerError
+from installed_clients.NarrativeMethodStoreClient import NarrativeMethodStore
+from requests.exceptions import RequestException
+
+from StaticNarrative.ttl_cache import TTLCache
+
+DEFAULT_CACHE_SIZE = 2000
+DEFAULT_CACHE_TTL = 3600
+
+
+class AppSpecCache:
+    def __init__(self: "AppSpecCache", max_size: int, ttl: float) -> None:
+        """
+        :param max_size: int - the most app specs to keep
+        :param ttl: float - how long to keep each app spec, in seconds
+        """
+        self._cache = TTLCache(max_size, ttl)
+
+    @staticmethod
+    def from_config(config: dict[str, Any]) -> "AppSpecCache":
+        """
+        Creates an AppSpecCache with its size and TTL (in seconds) from the
+        "app-spec-cache-size" and "app-spec-cache-ttl" config values (defaults 2000 and
+        3600). Setting either to 0 turns off caching.
+
+        :param config: dict - the service config
+        """
+        return AppSpecCache(
+            int(config.get("app-spec-cache-size", DEFAULT_CACHE_SIZE)),
+            float(config.get("app-spec-cache-ttl", DEFAULT_CACHE_TTL)),
+        )
+
+    def get_infos(
+        self: "AppSpecCache", nms: NarrativeMethodStore, tag: str, app_ids: list[str]
+    ) -> list[dict[str, Any]]:
+        """
+        Returns the name and publications of each app with the given release tag, in the
+        same order as app_ids. Any apps that aren't cached are fetched with a single call
+        to NarrativeMethodStore.get_method_full_info. If that call fails, the error gets
+        logged and only the cached apps are returned.
+
+        :param nms: NarrativeMethodStore - the client to fetch uncached apps with
+        :param tag: str - the release tag (release, beta, or dev)
+        :param app_ids: list[str] - the app ids
+        """
+        infos = {app_id: self._cache.get((tag, app_id)) for app_id in app_ids}
+        missing = [app_id for app_id in app_ids if infos[app_id] is None]
+        if missing:
+            try:
+                fetched = nms.get_method_full_info({"ids": missing, "tag": tag})
+            except (ServerError, RequestException) as e:
+                logging.getLogger("StaticNarrative").warning(
+                    f"Unable to fetch {tag} app info for {missing}: {e}"
+                )
+            else:
+                for app_id, full_info in zip(missing, fetched, strict=True):
+                    info = {"name": full_info["name"]}
+                    if "publications" in full_info:
+                        info["publications"] = full_info["publications"]
+                    self._cache.put((tag, app_id), info)
+                    infos[app_id] = info
+        return [infos[app_id] for app_id in app_ids if infos[app_id] is not None]
+
+    def stats(self: "AppSpecCache") -> dict[str, int | float]:
+        """Returns the cache's hit and miss counts, see TTLCache.stats."""
+        return self._cache.stats()
@@ -0,0 +1,274 @@
+"""
+An on-disk cache of rendered Narrative cells.
+
+Consecutive versions of a Narrative usually only differ by a few cells, so each cell's
+rendered HTML gets cached, keyed by a hash of the cell itself (its type, source, metadata,
+and outputs), its position, and everything else from the export that goes into rendering
+it - the exporter version, host, workspace id, and assets. Cached cells get looked up as
+soon as the Narrative is read, so nothing gets fetched or processed for them, and their
+HTML gets spliced into the page after rendering. Report files and images that cached
+cells link to (see published_files) are kept in the cache too, and copied over with them.
+Once it's bigger than its max_size, the least recently used files get pruned.
+
+While rendering, the template wraps each cell that missed the cache in marker comments,
+and leaves a single marker comment for each one that hit it. finish_cells stores the
+newly rendered cells, and swaps the markers out for the final HTML.
+"""
+import contextlib
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+import time
+from typing import Any
+
+from bs4 import BeautifulSoup
+from nbformat import NotebookNode
+
+from StaticNarrative.fingerprint import exporter_version
+
+from .published_files import IMAGES_DIR, REPORTS_DIR, find_published_files
+
+CACHE_METADATA_KEY = "kbase_cell_cache"
+_RENDERED_CELL = re.compile(
+    r"<!--kbs-cell-start:([0-9a-f]{64})-->(.*?)<!--kbs-cell-end:\1-->", re.DOTALL
+)
+_CACHED_CELL = re.compile(r"<!--kbs-cell:([0-9a-f]{64})-->")
+# Stands in for a removed marker while the whitespace around it gets fixed up.
+_GAP = "\x00"
+# The whitespace between two tags that a marker was removed from.
+_GAP_WHITESPACE = re.compile(r"(?<=>)[ \t\n\r\f\x00]*\x00[ \t\n\r\f\x00]*(?=<)")
+# How often each worker prunes a cache, in seconds. Files used more recently than this are
+# never pruned, so nothing gets removed between being looked up and used.
+PRUNE_INTERVAL = 300
+# cache dir -> when this worker last pruned it (time.monotonic)
+_last_pruned = {}
+_prune_lock = threading.Lock()
+
+
+def is_cached_cell(cell: NotebookNode) -> bool:
+    """Returns True if the cell's rendered HTML was found in the cache."""
+    return cell.get("metadata", {}).get(CACHE_METADATA_KEY, {}).get("hit", False)
+
+
+class CellCache:
+    def __init__(
+        self: "CellCache", cache_dir: str, max_size: int | None = None
+    ) -> None:
+        """
+        :param cache_dir: str - the directory to keep the cached cells in
+        :param max_size: int - the most bytes to keep in the cache, after which the least
+            recently used files get pruned (see prune). If None, the cache isn't pruned.
+        """
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def look_up(self: "CellCache", nb: NotebookNode, session: Any) -> dict[str, str]:
+        """
+        Looks up each cell of the Narrative in the cache, and marks it (in the cell's
+        kbase_cell_cache metadata) with its cache key and whether it was found. This must
+        be done before anything changes the cells.
+
+        Returns a dict of cache key -> rendered HTML for every cell that was found.
+
+        :param nb: NotebookNode - the Narrative, as read from the Workspace
+        :param session: NarrativeSession - the session for the export
+        """
+        context = _hash(
+            {
+                "exporter": exporter_version(),
+                "host": session.host,
+                "ws_id": session.ws_id,
+                "nms_image_url": session.nms_image_url,
+                "assets_base_url": session.assets_base_url,
+                "assets_version": session.assets_version,
+                "language_info": nb.get("metadata", {}).get("language_info"),
+                # streamed pages aren't reformatted, so their cells aren't either
+                "stream_render": session.stream_render,
+                "report_files": session.report_dir is not None,
+                "image_files": session.image_dir is not None,
+            }
+        )
+        cached_cells = {}
+        for index, cell in enumerate(nb.cells):
+            key = _hash({"context": context, "index": index, "cell": cell})
+            html = self.get(key)
+            # a cell that links to published files can only be used if they're cached too
+            if html is not None and not all(
+                _touch(self._file_path(url)) for url in find_published_files(html)
+            ):
+                html = None
+            if html is not None:
+                cached_cells[key] = html
+            cell.metadata[CACHE_METADATA_KEY] = {"key": key, "hit": html is not None}
+        return cached_cells
+
+    def get(self: "CellCache", key: str) -> str | None:
+        """
+        Returns the cached HTML for a cell, or None if it's not there. The cell gets
+        marked as recently used.
+        """
+        path = self._path(key)
+        try:
+            with open(path, encoding="utf-8", newline="") as cell_file:
+                html = cell_file.read()
+        except OSError:
+            return None
+        _touch(path)
+        return html
+
+    def put(self: "CellCache", key: str, html: str) -> None:
+        """Stores the HTML for a cell."""
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8", newline="") as cell_file:
+            cell_file.write(html)
+        os.replace(tmp_path, path)
+
+    def store_files(self: "CellCache", output_dir: str) -> None:
+        """
+        Stores the report files and images written while exporting a Narrative (see
+        published_files), so they can be restored along with the cells that link to them.
+
+        :param output_dir: str - the directory the Narrative was exported into
+        """
+        for directory in (REPORTS_DIR, IMAGES_DIR):
+            files_dir = os.path.join(output_dir, directory)
+            if not os.path.isdir(files_dir):
+                continue
+            for name in os.listdir(files_dir):
+                path = self._file_path(f"{directory}/{name}")
+                if not os.path.exists(path):
+                    _copy_file(os.path.join(files_dir, name), path)
+
+    def restore_files(
+        self: "CellCache", cached_cells: dict[str, str], output_dir: str
+    ) -> None:
+        """
+        Copies the report files and images that the cached cells link to into the
+        directory the Narrative is being exported into.
+
+        :param cached_cells: dict - cache key -> HTML, as returned by look_up
+        :param output_dir: str - the directory the Narrative is being exported into
+        """
+        for html in cached_cells.values():
+            for url in find_published_files(html):
+                path = os.path.join(output_dir, *url.split("/"))
+                if not os.path.exists(path):
+                    _copy_file(self._file_path(url), path)
+
+    def prune(self: "CellCache") -> int:
+        """
+        Removes the least recently used files (cells, reports, and images) until the cache
+        holds no more than max_size bytes, and returns the number removed. Files used in the
+        last PRUNE_INTERVAL seconds are kept, even if the cache stays over max_size.
+        """
+        if self.max_size is None:
+            return 0
+        files = []
+        total = 0
+        for root, _, names in os.walk(self.cache_dir):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+        cutoff = time.time() - PRUNE_INTERVAL
+        removed = 0
+        for mtime, size, path in sorted(files):
+            if total <= self.max_size or mtime > cutoff:
+                break
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(path)
+            total -= size
+            removed += 1
+        return removed
+
+    def prune_if_due(self: "CellCache") -> None:
+        """Prunes the cache, if this worker hasn't in the last PRUNE_INTERVAL seconds."""
+        if self.max_size is None:
+            return
+        with _prune_lock:
+            now = time.monotonic()
+            last = _last_pruned.get(self.cache_dir)
+            if last is not None and now - last < PRUNE_INTERVAL:
+                return
+            _last_pruned[self.cache_dir] = now
+        self.prune()
+
+    def _path(self: "CellCache", key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.html")
+
+    def _file_path(self: "CellCache", url: str) -> str:
+        return os.path.join(self.cache_dir, *url.split("/"))
+
+
+def _touch(path: str) -> bool:
+    """Marks a cached file as recently used. Returns False if it's not there."""
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        return False
+    return True
+
+
+def _copy_file(src: str, dst: str) -> None:
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    tmp_path = f"{dst}.{os.getpid()}.{threading.get_ident()}.tmp"
+    shutil.copyfile(src, tmp_path)
+    os.replace(tmp_path, dst)
+
+
+def finish_cells(
+    html: str, cache: CellCache | None, cached_cells: dict[str, str]
+) -> str:
+    """
+    Finishes off the rendered page. Each newly rendered cell gets stored in the cache and
+    has its markers removed, and each cached cell gets spliced in.
+
+    :param html: str - the rendered page
+    :param cache: CellCache - the cache to store new cells in (if None, they're not stored)
+    :param cached_cells: dict - cache key -> HTML, as returned by CellCache.look_up
+    """
+
+    def store_cell(match: re.Match) -> str:
+        key, cell_html = match.groups()
+        # The exporter runs the whole page through BeautifulSoup, so only store cells
+        # that come out the same on their own, which they should unless the HTML is broken.
+        if (
+            cache is not None
+            and str(BeautifulSoup(cell_html, features="html.parser")) == cell_html
+        ):
+            cache.put(key, cell_html)
+        return _GAP + cell_html + _GAP
+
+    html = _RENDERED_CELL.sub(store_cell, html)
+    html = _CACHED_CELL.sub(
+        lambda match: _GAP + cached_cells[match.group(1)] + _GAP, html
+    )
+    return _GAP_WHITESPACE.sub(_join_whitespace, html).replace(_GAP, "")
+
+
+def _join_whitespace(match: re.Match) -> str:
+    """
+    BeautifulSoup shrinks any whitespace between two tags down to a single newline or
+    space, so the markers leave behind two bits of whitespace where there would have been
+    one. This joins them back up the same way.
+    """
+    whitespace = match.group(0).replace(_GAP, "")
+    if "\n" in whitespace:
+        return "\n"
+    return " " if whitespace else ""
+
+
+def _hash(value: Any) -> str:
+    return hashlib.sha256(
+        json.dumps(value, sort_keys=True, default=str).encode("utf-8")
+    ).hexdigest()
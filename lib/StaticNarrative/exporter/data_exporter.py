@@ -1,5 +1,6 @@
 import json
 import os
+from datetime import datetime, timezone
 from typing import Any
 
 from installed_clients.NarrativeServiceClient import NarrativeService
@@ -7,19 +8,276 @@ from installed_clients.NarrativeServiceClient import NarrativeService
 from .processor_util import get_data_icon
 
 IGNORED_TYPES = ["KBaseNarrative.Narrative"]
+DATA_FILE = "data.json"
+DATA_PAGE_FILE = "data-{:04d}.json"
+DATA_FORMATS = ["rows", "compact"]
+COMPACT_FORMAT_VERSION = 1
+# how the Workspace formats save dates
+_TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S+0000"
 
 
 def export_narrative_data(
-    wsid: int, output_dir: str, service_wizard_url: str, token: str
+    wsid: int,
+    output_dir: str,
+    ns_client: NarrativeService,
+    narrative_data: dict[str, Any] | None = None,
+    page_size: int = 0,
+    data_format: str = "rows",
 ) -> dict[str, Any]:
     """
     Exports data from a Narrative into an attached JSON file.
     Returns the output path to the JSON file as well as the data that was dumped into it.
     This includes a list of types and the data itself.
 
+    If page_size is set, the data gets split into pages of that many objects instead, in
+    the same order, and data.json is a manifest for them (see write_data_pages).
+
+    The data gets written with one object per row, same as returned by
+    get_narrative_data, unless data_format is "compact" (see encode_compact).
+
+    The returned dictionary has the format returned by get_narrative_data, plus:
+    {
+        path: str - the path to the JSON file
+    }
+
+    :param wsid: int - the workspace id of the Narrative
+    :param output_dir: str - the directory to write data.json to
+    :param ns_client: NarrativeService - a NarrativeService client with the user's token
+    :param narrative_data: dict - optional, the data already fetched by get_narrative_data.
+        If not given, it gets fetched here.
+    :param page_size: int - optional, the most objects to put in each page of data
+        (if < 1, they all go in data.json)
+    :param data_format: str - optional, the format to write the data in, one of
+        DATA_FORMATS
+    """
+    if data_format not in DATA_FORMATS:
+        raise ValueError(f"Unknown data format {data_format}")
+    if narrative_data is None:
+        narrative_data = get_narrative_data(wsid, ns_client)
+    output_data = {"data": narrative_data["data"], "types": narrative_data["types"]}
+
+    output_path = os.path.join(output_dir, DATA_FILE)
+    if page_size > 0:
+        write_data_pages(output_dir, output_data, page_size, data_format)
+    else:
+        with open(output_path, "w") as outfile:
+            json.dump(_encode(output_data, data_format), outfile)
+    output_data["path"] = output_path
+    return output_data
+
+
+def write_data_pages(
+    output_dir: str,
+    narrative_data: dict[str, Any],
+    page_size: int,
+    data_format: str = "rows",
+) -> dict[str, Any]:
+    """
+    Writes the data in a Narrative as a series of pages (data-0001.json, data-0002.json,
+    ...), so the data browser can load them as they're needed, instead of all at once.
+    Each page is written as soon as it's made, then data.json gets written last, as a
+    manifest of them. Returns the manifest.
+
+    Each page has the format:
+    {
+        offset: int - the index of the page's first object, in all the data
+        data: list - the objects on the page, in the same format as get_narrative_data
+    }
+    or, if data_format is "compact", the offset along with the objects on the page as
+    returned by encode_compact.
+
+    The manifest has the format:
+    {
+        types: dict - the types in all the data, same as get_narrative_data
+        count: int - the total number of objects
+        page_size: int - the most objects on each page
+        pages: [{
+            file: str - the page's file name, relative to data.json
+            offset: int - the index of the page's first object
+            count: int - the number of objects on the page
+        }]
+    }
+
+    :param output_dir: str - the directory to write the pages and data.json to
+    :param narrative_data: dict - the data, as returned by get_narrative_data
+    :param page_size: int - the most objects to put in each page
+    :param data_format: str - the format to write each page in, one of DATA_FORMATS
+    """
+    data = narrative_data["data"]
+    pages = []
+    for offset in range(0, len(data), page_size):
+        page_data = data[offset : offset + page_size]
+        page_file = DATA_PAGE_FILE.format(len(pages) + 1)
+        with open(os.path.join(output_dir, page_file), "w") as outfile:
+            json.dump(
+                {"offset": offset, **_encode({"data": page_data}, data_format)},
+                outfile,
+            )
+        pages.append({"file": page_file, "offset": offset, "count": len(page_data)})
+    manifest = {
+        "types": narrative_data["types"],
+        "count": len(data),
+        "page_size": page_size,
+        "pages": pages,
+    }
+    with open(os.path.join(output_dir, DATA_FILE), "w") as outfile:
+        json.dump(manifest, outfile)
+    return manifest
+
+
+def read_narrative_data(output_dir: str) -> dict[str, Any]:
+    """
+    Reads back the data exported by export_narrative_data, paged or not, and returns it
+    in the format returned by get_narrative_data.
+
+    :param output_dir: str - the directory that data.json was written to
+    """
+    with open(os.path.join(output_dir, DATA_FILE)) as infile:
+        narrative_data = json.load(infile)
+    if "pages" not in narrative_data:
+        return {"data": _decode(narrative_data), "types": narrative_data["types"]}
+    data = []
+    for page in narrative_data["pages"]:
+        with open(os.path.join(output_dir, page["file"])) as infile:
+            data += _decode(json.load(infile))
+    return {"data": data, "types": narrative_data["types"]}
+
+
+def encode_compact(data: list[list[Any]]) -> dict[str, Any]:
+    """
+    Encodes the data in a Narrative (the "data" from get_narrative_data) column by column,
+    so each type string and metadata key and value is only written once. Returns a dict with the
+    format:
+    {
+        format: "compact",
+        format_version: int - COMPACT_FORMAT_VERSION
+        type_names: list[str] - each full type string (e.g. KBaseGenomes.Genome-17.0)
+        meta_keys: list[str] - each metadata key
+        meta_values: list[str] - each metadata value
+        columns: {
+            ref: list[str] - each object's reference
+            name: list[str] - each object's name
+            type: list[int] - the index in type_names of each object's type
+            saved: list[int | str] - each object's save date, in ms since epoch (or as
+                it was, if it's not a date the Workspace would've made)
+            meta: list[list | None] - each object's metadata, as [key index in
+                meta_keys, value index in meta_values, key index, value index, ...]
+        }
+    }
+    decode_compact turns that back into the same data.
+
+    :param data: list - the objects, each in the format returned by get_narrative_data
+    """
+    type_names = {}
+    meta_keys = {}
+    meta_values = {}
+    columns = {"ref": [], "name": [], "type": [], "saved": [], "meta": []}
+    for ref, name, obj_type, saved, meta in data:
+        columns["ref"].append(ref)
+        columns["name"].append(name)
+        columns["type"].append(type_names.setdefault(obj_type, len(type_names)))
+        columns["saved"].append(_encode_timestamp(saved))
+        if meta is not None:
+            meta = [
+                item
+                for key, value in meta.items()
+                for item in (
+                    meta_keys.setdefault(key, len(meta_keys)),
+                    meta_values.setdefault(value, len(meta_values)),
+                )
+            ]
+        columns["meta"].append(meta)
+    return {
+        "format": "compact",
+        "format_version": COMPACT_FORMAT_VERSION,
+        "type_names": list(type_names),
+        "meta_keys": list(meta_keys),
+        "meta_values": list(meta_values),
+        "columns": columns,
+    }
+
+
+def decode_compact(encoded: dict[str, Any]) -> list[list[Any]]:
+    """
+    Decodes data encoded by encode_compact, back into a list of objects in the format
+    returned by get_narrative_data.
+
+    :param encoded: dict - the encoded data
+    """
+    if encoded.get("format_version") != COMPACT_FORMAT_VERSION:
+        raise ValueError(
+            f"Unknown compact data format version {encoded.get('format_version')}"
+        )
+    type_names = encoded["type_names"]
+    meta_keys = encoded["meta_keys"]
+    meta_values = encoded["meta_values"]
+    columns = encoded["columns"]
+    return [
+        [
+            ref,
+            name,
+            type_names[type_index],
+            _decode_timestamp(saved),
+            None
+            if meta is None
+            else {
+                meta_keys[key]: meta_values[value]
+                for key, value in zip(meta[::2], meta[1::2], strict=True)
+            },
+        ]
+        for ref, name, type_index, saved, meta in zip(
+            columns["ref"],
+            columns["name"],
+            columns["type"],
+            columns["saved"],
+            columns["meta"],
+            strict=True,
+        )
+    ]
+
+
+def _encode(narrative_data: dict[str, Any], data_format: str) -> dict[str, Any]:
+    """Encodes the data in narrative_data in data_format, along with its other keys."""
+    if data_format != "compact":
+        return narrative_data
+    other = {key: value for key, value in narrative_data.items() if key != "data"}
+    return {**other, **encode_compact(narrative_data["data"])}
+
+
+def _decode(narrative_data: dict[str, Any]) -> list[list[Any]]:
+    """Returns the data in narrative_data, whatever format it was written in."""
+    if narrative_data.get("format") == "compact":
+        return decode_compact(narrative_data)
+    return narrative_data["data"]
+
+
+def _encode_timestamp(timestamp: str) -> int | str:
+    """
+    Returns a Workspace save date in ms since epoch, or as it is if it's not in the format
+    that the Workspace uses, so it decodes back to the same string.
+    """
+    try:
+        saved = datetime.strptime(timestamp, _TIMESTAMP_FORMAT)
+    except (TypeError, ValueError):
+        return timestamp
+    ms = int(saved.replace(tzinfo=timezone.utc).timestamp()) * 1000
+    return ms if _decode_timestamp(ms) == timestamp else timestamp
+
+
+def _decode_timestamp(timestamp: int | str) -> str:
+    if isinstance(timestamp, int):
+        return datetime.fromtimestamp(timestamp / 1000, timezone.utc).strftime(
+            _TIMESTAMP_FORMAT
+        )
+    return timestamp
+
+
+def get_narrative_data(wsid: int, ns_client: NarrativeService) -> dict[str, Any]:
+    """
+    Fetches the list of data in a Narrative, along with a summary of their types.
+
     The returned dictionary has the following format:
     {
-        output_path: str,
         types: {
             type name (str): {
                 count: int,
@@ -39,10 +297,10 @@ def export_narrative_data(
         ]
     }
 
-    types and data (above) are dumped to data.json
+    :param wsid: int - the workspace id of the Narrative
+    :param ns_client: NarrativeService - a NarrativeService client with the user's token
     """
     # just call out to NarrativeService.list_objects_with_sets.
-    ns_client = NarrativeService(url=service_wizard_url, token=token)
     ws_data = ns_client.list_objects_with_sets({"ws_id": wsid, "includeMetadata": 1})[
         "data"
     ]
@@ -59,18 +317,11 @@ def export_narrative_data(
         filtered_data.append(_reshape_obj(obj))
         type_info[type_name]["count"] += 1
 
-    # Maybe sort it later. For now, dump to file.
-    output_data = {
+    return {
         "data": sorted(filtered_data, key=lambda o: o[1].lower()),
         "types": type_info,
     }
 
-    output_path = os.path.join(output_dir, "data.json")
-    with open(output_path, "w") as outfile:
-        json.dump(output_data, outfile)
-    output_data["path"] = output_path
-    return output_data
-
 
 def _reshape_obj(
     obj_info: list[str, str | dict[str, Any]]
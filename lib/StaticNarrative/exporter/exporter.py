@@ -7,26 +7,178 @@ the exporting.
 """
 __author__ = "Bill Riehl <wjriehl@lbl.gov>"
 
-import json
 import os
+import random
+import threading
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
 from typing import Any
 from urllib.parse import urlparse
 
-import nbformat
 from installed_clients.baseclient import ServerError
-from installed_clients.WorkspaceClient import Workspace
 from nbconvert import HTMLExporter
+from nbformat import NotebookNode
 from traitlets.config import Config
 
 from StaticNarrative import STATIC_NARRATIVE_BASE_DIR
+from StaticNarrative.clients import ServiceClients
 from StaticNarrative.exceptions import WorkspaceError
 from StaticNarrative.exporter import preprocessor
-from StaticNarrative.narrative.narrative_util import read_narrative
+from StaticNarrative.narrative.narrative_util import (
+    narrative_to_notebook,
+    read_narrative,
+)
 from StaticNarrative.narrative_ref import NarrativeRef
 
+from .cell_cache import CellCache, finish_cells
 from .data_exporter import export_narrative_data
+from .page_writer import PageWriter
+from .prefetch import prefetch_narrative_data
+from .processor_util import get_app_metadata, get_authors
 
 NARRATIVE_TEMPLATE_FILE = "narrative.tpl"
+TEMPLATE_BASE_DIR = os.path.join(
+    STATIC_NARRATIVE_BASE_DIR,
+    "lib",
+    "StaticNarrative",
+    "exporter",
+    "static",
+    "templates",
+)
+
+# Each thread (for uwsgi, each worker) keeps its own warm HTMLExporter.
+_exporter_cache = threading.local()
+
+
+class NarrativeSession(SimpleNamespace):
+    """
+    The per-request values that the NarrativePreprocessor needs to process a Narrative,
+    e.g. token, ws_id, and the exported narrative data.
+
+    This gets passed along to the HTMLExporter in resources["narrative_session"].
+    nbconvert deep copies the resources before preprocessing, so this returns itself
+    from a deepcopy rather than duplicating everything it holds.
+    """
+
+    def __deepcopy__(
+        self: "NarrativeSession", memo: dict[int, Any]
+    ) -> "NarrativeSession":
+        return self
+
+
+class NarrativeHTMLExporter(HTMLExporter):
+    """
+    An HTMLExporter that can also stream the page it renders to a file, see
+    render_to_file.
+
+    nbconvert validates the notebook against its schema after the preprocessors run,
+    which is just as slow as validating the Narrative, so that's only done when
+    validate_notebook is set for the export (see NarrativeExporter._should_validate).
+    """
+
+    # whether to validate the notebook once the preprocessors have run, set per export
+    validate_notebook = False
+    # while streaming, takes each bit of the page as it's rendered
+    _stream = None
+
+    @property
+    def template(self: "NarrativeHTMLExporter") -> Any:
+        template = super().template
+        if self._stream is None:
+            return template
+        return _StreamingTemplate(template, self._stream)
+
+    def _validate_preprocessor(
+        self: "NarrativeHTMLExporter", nbc: NotebookNode, preprocessor: Any
+    ) -> None:
+        if self.validate_notebook:
+            super()._validate_preprocessor(nbc, preprocessor)
+
+    def render_to_file(
+        self: "NarrativeHTMLExporter",
+        nb: NotebookNode,
+        resources: dict[str, Any],
+        write: Callable[[str], object],
+    ) -> dict[str, Any]:
+        """
+        Renders the notebook the same way as from_notebook_node, but passes the page to
+        write a bit at a time as it's rendered, instead of returning it. That skips
+        running the whole page through BeautifulSoup, which only adds alt text to images
+        without any (see page_writer.PageWriter to do that while streaming).
+        Returns the resources.
+
+        :param nb: NotebookNode - the notebook to render
+        :param resources: dict - the resources to render it with
+        :param write: Callable - takes each bit of the rendered page
+        """
+        self._stream = write
+        try:
+            _, resources = self.from_notebook_node(nb, resources=resources)
+        finally:
+            self._stream = None
+        return resources
+
+
+class _StreamingTemplate:
+    """Stands in for the page template, passing what it renders on to write."""
+
+    def __init__(
+        self: "_StreamingTemplate", template: Any, write: Callable[[str], object]
+    ) -> None:
+        self._template = template
+        self._write = write
+
+    def render(self: "_StreamingTemplate", *args: Any, **kwargs: Any) -> str:
+        for chunk in self._template.generate(*args, **kwargs):
+            self._write(chunk)
+        return ""
+
+
+def get_html_exporter() -> NarrativeHTMLExporter:
+    """
+    Returns the HTMLExporter used to render Narratives, building it on first use.
+
+    Building the exporter sets up the Jinja environment, and the templates get compiled
+    on its first render. Those are then reused by every later export in the same thread.
+    Nothing request-specific is configured here, see NarrativeSession for that.
+    """
+    html_exporter = getattr(_exporter_cache, "html_exporter", None)
+    if html_exporter is None:
+        html_exporter = _build_exporter()
+        _exporter_cache.html_exporter = html_exporter
+    return html_exporter
+
+
+def _build_exporter() -> NarrativeHTMLExporter:
+    """
+    This builds the HTMLExporter used to export the Notebook (i.e. Narrative) to
+    HTML.
+
+    The NarrativePreprocessor is used to process cells for templating, and consumes
+    the NarrativeSession passed in with the resources at render time. Then the
+    OutputImagePreprocessor moves output images out into their own files.
+    """
+    c = Config()
+    c.HTMLExporter.preprocessors = [
+        preprocessor.NarrativePreprocessor,
+        preprocessor.OutputImagePreprocessor,
+    ]
+    c.TemplateExporter.template_paths = [
+        TEMPLATE_BASE_DIR,
+        os.path.join(TEMPLATE_BASE_DIR, "html"),
+        os.path.join(TEMPLATE_BASE_DIR, "skeleton"),
+    ]
+    c.CSSHTMLHeaderPreprocessor.enabled = True
+    c.NarrativePreprocessor.enabled = True
+    c.OutputImagePreprocessor.enabled = True
+    c.ClearMetadataPreprocessor.enabled = False
+    # when validating, only check the notebook once all the preprocessors are done
+    c.Exporter.optimistic_validation = True
+
+    html_exporter = NarrativeHTMLExporter(config=c)
+    html_exporter.template_file = NARRATIVE_TEMPLATE_FILE
+    return html_exporter
 
 
 class NarrativeExporter:
@@ -35,75 +187,238 @@ class NarrativeExporter:
         exporter_cfg: dict[str, str],  # config object
         user_id: str,
         token: str,
+        clients: ServiceClients | None = None,
     ) -> None:
+        """
+        :param exporter_cfg: dict - the service config
+        :param user_id: str - the id of the user doing the export
+        :param token: str - the user's auth token
+        :param clients: ServiceClients - optional, the service clients for the current
+            request. If not given, a new set gets made with the token.
+        """
         self.exporter_cfg = exporter_cfg
-        self.ws_client = Workspace(url=exporter_cfg["workspace-url"], token=token)
+        self.clients = clients or ServiceClients(exporter_cfg, token)
+        self.ws_client = self.clients.workspace
         self.token = token
         self.user_id = user_id
 
     def export_narrative(
-        self: "NarrativeExporter", narrative_ref: NarrativeRef, output_dir: str
+        self: "NarrativeExporter",
+        narrative_ref: NarrativeRef,
+        output_dir: str,
+        narrative_data: dict[str, Any] | None = None,
     ) -> str:
         """
         Exports the Narrative to an HTML file and returns the path to that file.
         :param narrative_ref: NarrativeRef - the workspace reference to the narrative object
         :param output_dir: str - the requested output file path.
+        :param narrative_data: dict - optional, the Narrative's data listing if it was
+            already fetched (see data_exporter.get_narrative_data)
         :return: str - the absolute path to the generated static Narrative HTML file.
         """
-        # 1. Get the Narrative object
-        try:
-            nar = read_narrative(narrative_ref, self.ws_client)
-            nar["metadata"]["wsid"] = narrative_ref.wsid
-        except ServerError as e:
-            raise WorkspaceError(
-                e, narrative_ref.wsid, "Error while exporting Narrative"
-            ) from e
+        validate = self._should_validate()
+        session = self._build_session(narrative_ref.wsid)
+        session.report_dir = output_dir if self._report_files() else None
+        session.image_dir = output_dir if self._image_files() else None
 
-        # 2. Convert to a notebook object
-        kb_notebook = nbformat.reads(json.dumps(nar), as_version=4)
+        # The stages that fetch from other services don't depend on each other (except
+        # for needing the Narrative itself), so they run concurrently.
+        with ThreadPoolExecutor(max_workers=self._stage_workers()) as pool:
+            # 1. Start getting the Narrative, and everything else that only needs the
+            # workspace id - the Narrative workspace data gets exported to a sidecar
+            # JSON file, and the authors get looked up.
+            notebook_future = pool.submit(self._read_notebook, narrative_ref, validate)
+            data_future = pool.submit(
+                export_narrative_data,
+                narrative_ref.wsid,
+                output_dir,
+                self.clients.narrative_service,
+                narrative_data,
+                self._data_page_size(),
+                self._data_format(),
+            )
+            authors_future = pool.submit(get_authors, session, narrative_ref.wsid)
 
-        # 3. Export the Narrative workspace data to a sidecar JSON file.
-        exported_data = export_narrative_data(
-            narrative_ref.wsid, output_dir, self.exporter_cfg["srv-wiz-url"], self.token
-        )
+            # 2. Once the Narrative's ready, get the app specs and citations, look up
+            # its cells in the cell cache, and fetch the reports and object infos needed
+            # by all the other app cells up front.
+            kb_notebook = notebook_future.result()
+            app_meta_future = pool.submit(
+                get_app_metadata,
+                kb_notebook,
+                self.clients.narrative_method_store,
+                self.clients.caches.app_specs,
+            )
+            cell_cache = self._cell_cache()
+            session.cached_cells = {}
+            if cell_cache is not None:
+                session.cached_cells = cell_cache.look_up(kb_notebook, session)
+                cell_cache.restore_files(session.cached_cells, output_dir)
+            prefetch_future = pool.submit(
+                prefetch_narrative_data,
+                kb_notebook,
+                self.ws_client,
+                self.clients.caches.objects,
+            )
+
+            session.narrative_data = data_future.result()
+            session.data_file_path = session.narrative_data["path"]
+            session.authors = authors_future.result()
+            session.app_meta = app_meta_future.result()
+            session.prefetched = prefetch_future.result()
+
+        # 3. Export the Narrative to an HTML file
+        output_filename = "narrative.html"
+        output_path = os.path.join(output_dir, output_filename)
+        html_exporter = get_html_exporter()
+        html_exporter.validate_notebook = validate
+        if session.stream_render:
+            with open(output_path, "w") as output_html:
+                page_writer = PageWriter(
+                    output_html.write, cell_cache, session.cached_cells
+                )
+                html_exporter.render_to_file(
+                    kb_notebook, {"narrative_session": session}, page_writer.write
+                )
+                page_writer.close()
+            if cell_cache is not None:
+                cell_cache.store_files(output_dir)
+                cell_cache.prune_if_due()
+            return output_path
 
-        # 4. Export the Narrative to an HTML file
-        html_exporter = self._build_exporter(exported_data, narrative_ref.wsid)
-        (body, resources) = html_exporter.from_notebook_node(kb_notebook)
+        (body, resources) = html_exporter.from_notebook_node(
+            kb_notebook, resources={"narrative_session": session}
+        )
+        body = finish_cells(body, cell_cache, session.cached_cells)
+        if cell_cache is not None:
+            cell_cache.store_files(output_dir)
+            cell_cache.prune_if_due()
 
         # copy some assets
         # TODO: remove this, make them static, compile others, etc.
         # TODO: Maybe add to ui-assets repo?
         # ...maybe not yet.
 
-        output_filename = "narrative.html"
-        output_path = os.path.join(output_dir, output_filename)
         with open(output_path, "w") as output_html:
             output_html.write(body)
         return output_path
 
-    def _build_exporter(
-        self: "NarrativeExporter", exported_data: dict[str, Any], ws_id: int
-    ) -> HTMLExporter:
+    def _read_notebook(
+        self: "NarrativeExporter", narrative_ref: NarrativeRef, validate: bool = False
+    ) -> NotebookNode:
         """
-        This builds the HTMLExporter used to export the Notebook (i.e. Narrative) to
-        HTML. Data is passed into the exporter by configuration with various specific
-        keys set in the config traitlet.
+        Fetches the Narrative object and converts it to a notebook.
+        :param narrative_ref: NarrativeRef - the workspace reference to the narrative object
+        :param validate: bool - if True, validate the notebook against the nbformat schema
+        """
+        try:
+            nar = read_narrative(narrative_ref, self.ws_client)
+            nar["metadata"]["wsid"] = narrative_ref.wsid
+        except ServerError as e:
+            raise WorkspaceError(
+                e, narrative_ref.wsid, "Error while exporting Narrative"
+            ) from e
+        return narrative_to_notebook(nar, validate=validate)
 
-        The NarrativePreprocessor is used to process cells for templating, and consumes
-        the various elements in the narrative_session property of the config.
+    def _cell_cache(self: "NarrativeExporter") -> CellCache | None:
+        """
+        Returns the cache of rendered cells, kept in the "cell-cache-dir" config value
+        (default <scratch>/cell_cache). Returns None if that's set to an empty value, which
+        turns the cache off. It gets pruned down to the "cell-cache-max-mb" config value
+        (default 1024), or not at all if that's 0.
+        """
+        cache_dir = self.exporter_cfg.get(
+            "cell-cache-dir", os.path.join(self.exporter_cfg["scratch"], "cell_cache")
+        )
+        if not cache_dir:
+            return None
+        max_mb = int(self.exporter_cfg.get("cell-cache-max-mb", 1024))
+        return CellCache(cache_dir, max_size=max_mb * 1024 * 1024 if max_mb else None)
 
-        This expects to see the set of data exported from the Narrative as part of
-        its input - this gets passed along to the preprocessor, then to the template for
-        export.
+    def _stage_workers(self: "NarrativeExporter") -> int:
+        """
+        Returns the maximum number of export stages to run at once, from the
+        "export-stage-workers" config value (default 4). Setting it to 1 runs the
+        stages one after another.
+        """
+        return max(1, int(self.exporter_cfg.get("export-stage-workers", 4)))
 
-        :param exported_data: Dict - the exported data in the Narrative.
+    def _data_page_size(self: "NarrativeExporter") -> int:
+        """
+        Returns the most objects to put in each page of the Narrative's data, from the
+        "data-page-size" config value (default 0, which puts them all in data.json). Paged
+        data needs a version of staticNarrativeBundle.js (see assets-version) that can
+        load it.
         """
-        c = Config()
-        c.HTMLExporter.preprocessors = [preprocessor.NarrativePreprocessor]
+        return int(self.exporter_cfg.get("data-page-size", 0))
 
-        # all the static files (css, fonts, etc.) are relative to this dir.
-        base_path = os.path.dirname(os.path.abspath(__file__))
+    def _data_format(self: "NarrativeExporter") -> str:
+        """
+        Returns the format to write the Narrative's data in, from the "data-format" config
+        value, either "rows" (the default) or "compact" (see data_exporter.encode_compact).
+        Like paged data, compact data needs a version of staticNarrativeBundle.js that can
+        load it.
+        """
+        return self.exporter_cfg.get("data-format", "rows")
+
+    def _stream_render(self: "NarrativeExporter") -> bool:
+        """
+        Returns True if the page should be written to its file as it's rendered, instead
+        of all at once, from the "stream-render" config value (default false). That keeps
+        the memory used by huge Narratives down, see page_writer.
+        """
+        return str(self.exporter_cfg.get("stream-render", "false")).lower() == "true"
+
+    def _report_files(self: "NarrativeExporter") -> bool:
+        """
+        Returns True if app reports should be written to their own files next to the
+        page, instead of being inlined in it, from the "report-files" config value
+        (default false). See published_files.
+        """
+        return str(self.exporter_cfg.get("report-files", "false")).lower() == "true"
+
+    def _image_files(self: "NarrativeExporter") -> bool:
+        """
+        Returns True if images in code cell outputs should be written to their own files
+        next to the page, instead of being inlined in it, from the "image-files" config
+        value (default true). See preprocessor.OutputImagePreprocessor.
+        """
+        return str(self.exporter_cfg.get("image-files", "true")).lower() == "true"
+
+    def _shared_styles(self: "NarrativeExporter") -> bool:
+        """
+        Returns True if the page should link to a stylesheet shared by every Static
+        Narrative, instead of inlining its own styles, from the "shared-styles" config
+        value (default false). The stylesheet gets published in the static file root, so
+        that has to be served at the same level as the Static Narratives. See
+        shared_styles.
+        """
+        return str(self.exporter_cfg.get("shared-styles", "false")).lower() == "true"
+
+    def _should_validate(self: "NarrativeExporter") -> bool:
+        """
+        Returns True if the Narrative being exported should be validated against the
+        notebook schema, both when it's read and once it's been preprocessed for
+        rendering. Validation is expensive for large Narratives, so this is only done
+        for a sample of exports, set by the "narrative-validation-rate" config value (a
+        fraction between 0 and 1, default 0).
+        """
+        rate = float(self.exporter_cfg.get("narrative-validation-rate", 0))
+        return rate > 0 and random.random() < rate  # noqa: S311
+
+    def _build_session(self: "NarrativeExporter", ws_id: int) -> NarrativeSession:
+        """
+        Builds the NarrativeSession for exporting a single Narrative. This gets
+        passed into the exporter through the resources, where the NarrativePreprocessor
+        consumes it.
+
+        This only sets up the values known from the config. The results of the export
+        stages (narrative_data, data_file_path, authors, app_meta, cached_cells, and
+        prefetched) and the report_dir and image_dir get added by export_narrative once
+        they're ready.
+
+        :param ws_id: int - the workspace id of the Narrative.
+        """
         service_endpt = self.exporter_cfg["kbase-endpoint"]
 
         endpt_parsed = urlparse(service_endpt)
@@ -113,42 +428,19 @@ class NarrativeExporter:
             netloc = "narrative." + netloc
         host = (endpt_parsed.scheme or "https") + "://" + netloc
 
-        tpl_base_dir = os.path.join(
-            STATIC_NARRATIVE_BASE_DIR,
-            "lib",
-            "StaticNarrative",
-            "exporter",
-            "static",
-            "templates",
-        )
-        c.TemplateExporter.template_paths = [
-            tpl_base_dir,
-            os.path.join(tpl_base_dir, "html"),
-            os.path.join(tpl_base_dir, "skeleton"),
-        ]
-        c.CSSHTMLHeaderPreprocessor.enabled = True
-        c.NarrativePreprocessor.enabled = True
-        c.ClearMetadataPreprocessor.enabled = False
-
-        c.narrative_session.token = self.token
-        c.narrative_session.user_id = self.user_id
-        c.narrative_session.ws_url = self.exporter_cfg["workspace-url"]
-        c.narrative_session.nms_url = self.exporter_cfg["nms-url"]
-        c.narrative_session.nms_image_url = self.exporter_cfg["nms-image-url"]
-        c.narrative_session.profile_page_url = (
-            host + self.exporter_cfg["profile-page-path"]
+        return NarrativeSession(
+            clients=self.clients,
+            user_id=self.user_id,
+            nms_image_url=self.exporter_cfg["nms-image-url"],
+            profile_page_url=host + self.exporter_cfg["profile-page-path"],
+            assets_base_url=self.exporter_cfg["assets-base-url"],
+            service_wizard_url=self.exporter_cfg["srv-wiz-url"],
+            data_ie_url=self.exporter_cfg["data-ie-url"],
+            host=host,
+            assets_version=self.exporter_cfg["assets-version"],
+            ws_id=ws_id,
+            stream_render=self._stream_render(),
+            shared_styles_root=(
+                self.exporter_cfg["static-file-root"] if self._shared_styles() else None
+            ),
         )
-        c.narrative_session.auth_url = self.exporter_cfg["auth-url"]
-        c.narrative_session.assets_base_url = self.exporter_cfg["assets-base-url"]
-        c.narrative_session.service_wizard_url = self.exporter_cfg["srv-wiz-url"]
-        c.narrative_session.data_ie_url = self.exporter_cfg["data-ie-url"]
-        c.narrative_session.host = host
-        c.narrative_session.base_path = base_path
-        c.narrative_session.data_file_path = exported_data["path"]
-        c.narrative_session.narrative_data = exported_data
-        c.narrative_session.assets_version = self.exporter_cfg["assets-version"]
-        c.narrative_session.ws_id = ws_id
-
-        html_exporter = HTMLExporter(config=c)
-        html_exporter.template_file = NARRATIVE_TEMPLATE_FILE
-        return html_exporter
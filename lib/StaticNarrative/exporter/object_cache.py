@@ -0,0 +1,77 @@
+"""
+A cache of Workspace reports and object infos, shared by every export in a worker (see
+clients.ServiceCaches).
+
+A fully versioned reference (wsid/objid/ver) always points at the same object, so the
+report or object info it was fetched as never changes. What can change is who's allowed to
+see it, so this only holds objects from public workspaces, and prefetch_narrative_data only
+uses it for workspaces that it's just checked are still public.
+"""
+import re
+from typing import Any
+
+from StaticNarrative.ttl_cache import TTLCache
+
+DEFAULT_CACHE_SIZE = 5000
+DEFAULT_CACHE_TTL = 86400
+
+_VERSIONED_REF = re.compile(r"^(\d+)/\d+/\d+$")
+
+
+def versioned_ref_ws_id(ref: str) -> int | None:
+    """
+    Returns the workspace id of a fully versioned reference, like 1/2/3, or None if ref
+    isn't one (e.g. it's missing the version, or it's a reference path).
+    """
+    match = _VERSIONED_REF.match(ref)
+    return int(match.group(1)) if match else None
+
+
+class ObjectCache:
+    def __init__(self: "ObjectCache", max_size: int, ttl: float) -> None:
+        """
+        :param max_size: int - the most reports and object infos to keep, in total
+        :param ttl: float - how long to keep each one, in seconds
+        """
+        self._cache = TTLCache(max_size, ttl)
+
+    @staticmethod
+    def from_config(config: dict[str, Any]) -> "ObjectCache":
+        """
+        Creates an ObjectCache with its size and TTL (in seconds) from the
+        "object-cache-size" and "object-cache-ttl" config values (defaults 5000 and
+        86400). Setting either to 0 turns off caching.
+
+        :param config: dict - the service config
+        """
+        return ObjectCache(
+            int(config.get("object-cache-size", DEFAULT_CACHE_SIZE)),
+            float(config.get("object-cache-ttl", DEFAULT_CACHE_TTL)),
+        )
+
+    def get_report(self: "ObjectCache", ref: str) -> dict[str, Any] | None:
+        """Returns the cached report data for ref, or None if it's not there."""
+        return self._cache.get(("report", ref))
+
+    def put_report(self: "ObjectCache", ref: str, report: dict[str, Any]) -> None:
+        """Caches the data of the report at ref, which must be fully versioned."""
+        self._put("report", ref, report)
+
+    def get_info(self: "ObjectCache", ref: str) -> list | None:
+        """Returns the cached object info for ref, or None if it's not there."""
+        return self._cache.get(("info", ref))
+
+    def put_info(self: "ObjectCache", ref: str, info: list) -> None:
+        """Caches the info of the object at ref, which must be fully versioned."""
+        self._put("info", ref, info)
+
+    def _put(self: "ObjectCache", kind: str, ref: str, value: Any) -> None:
+        if versioned_ref_ws_id(ref) is None:
+            raise ValueError(
+                f"Only fully versioned references can be cached, not {ref}"
+            )
+        self._cache.put((kind, ref), value)
+
+    def stats(self: "ObjectCache") -> dict[str, int | float]:
+        """Returns the cache's hit and miss counts, see TTLCache.stats."""
+        return self._cache.stats()
@@ -0,0 +1,122 @@
+"""
+Writes a rendered Narrative page to a file as it streams out of the template, so the whole
+page never has to be held in memory (see the "stream-render" config value).
+
+When a page gets rendered all at once, nbconvert's HTMLExporter runs it through
+BeautifulSoup to add alt text to images, then finish_cells splices in the cached cells.
+PageWriter does the same as the page goes by, holding onto no more than part of a tag, or
+the one newly rendered cell that's being cached. The page doesn't get reformatted by
+BeautifulSoup, so it's not byte for byte the same as one rendered all at once, but it's
+the same page.
+"""
+import re
+from collections.abc import Callable
+
+from .cell_cache import CellCache
+
+MISSING_ALT_TEXT = "No description has been provided for this image"
+_IMG_WITHOUT_ALT = re.compile(r"<img\b(?![^>]*\salt=)([^>]*?)\s*(/?)>", re.IGNORECASE)
+_MARKER_START = "<!--kbs-cell"
+_MARKER = re.compile(r"<!--kbs-cell(-start)?:([0-9a-f]{64})-->")
+
+
+def add_missing_alt_text(html: str) -> str:
+    """Adds the same alt text as nbconvert's HTMLExporter to every image without any."""
+    return _IMG_WITHOUT_ALT.sub(rf'<img\1 alt="{MISSING_ALT_TEXT}"\2>', html)
+
+
+class PageWriter:
+    def __init__(
+        self: "PageWriter",
+        write: Callable[[str], object],
+        cache: CellCache | None,
+        cached_cells: dict[str, str],
+    ) -> None:
+        """
+        :param write: Callable - writes the finished page, a bit at a time
+        :param cache: CellCache - the cache to store new cells in (if None, they're not
+            stored)
+        :param cached_cells: dict - cache key -> HTML, as returned by CellCache.look_up
+        """
+        self._write = write
+        self._cache = cache
+        self._cached_cells = cached_cells
+        self._started = False
+        # the end of the page that might be part of a tag
+        self._pending = ""
+        # the newly rendered cell being held onto, and the end of it that's been checked
+        self._cell_key = None
+        self._cell = []
+        self._cell_tail = ""
+
+    def write(self: "PageWriter", chunk: str) -> None:
+        """Takes the next bit of the rendered page."""
+        if not self._started:
+            # same as TemplateExporter
+            chunk = chunk.lstrip("\r\n")
+            self._started = bool(chunk)
+        while chunk:
+            if self._cell_key is None:
+                chunk = self._write_page(chunk)
+            else:
+                chunk = self._write_cell(chunk)
+
+    def close(self: "PageWriter") -> None:
+        """Writes whatever's left, once the whole page has been rendered."""
+        if self._cell_key is not None:
+            self._pending = "".join(self._cell) + self._pending
+        self._write(add_missing_alt_text(self._pending))
+        self._pending = ""
+
+    def _write_page(self: "PageWriter", chunk: str) -> str:
+        """
+        Writes as much of the page as it can, up to the next cell marker, and returns
+        what's after the marker.
+        """
+        text = self._pending + chunk
+        self._pending = ""
+        marker_start = text.find(_MARKER_START)
+        marker_end = text.find("-->", marker_start) if marker_start >= 0 else -1
+        if marker_end < 0:
+            # hold back anything that might be the start of a tag (or marker)
+            tag_start = text.rfind("<")
+            if tag_start >= 0 and text.find(">", tag_start) < 0:
+                self._pending = text[tag_start:]
+                text = text[:tag_start]
+            self._write(add_missing_alt_text(text))
+            return ""
+
+        self._write(add_missing_alt_text(text[:marker_start]))
+        marker_end += len("-->")
+        match = _MARKER.fullmatch(text, marker_start, marker_end)
+        if match is None:
+            self._write(text[marker_start:marker_end])
+        elif match.group(1):
+            self._cell_key = match.group(2)
+        else:
+            self._write(self._cached_cells[match.group(2)])
+        return text[marker_end:]
+
+    def _write_cell(self: "PageWriter", chunk: str) -> str:
+        """
+        Holds onto the newly rendered cell until its end marker. Then it gets cached and
+        written, and what's after the marker is returned.
+        """
+        end_marker = f"<!--kbs-cell-end:{self._cell_key}-->"
+        window = self._cell_tail + chunk
+        if end_marker not in window:
+            self._cell.append(chunk)
+            self._cell_tail = window[-len(end_marker) :]
+            return ""
+
+        cell_html = "".join(self._cell) + chunk
+        end = cell_html.index(end_marker, len(cell_html) - len(window))
+        rest = cell_html[end + len(end_marker) :]
+        cell_html = add_missing_alt_text(cell_html[:end])
+        if self._cache is not None:
+            self._cache.put(self._cell_key, cell_html)
+        self._write(cell_html)
+        self._cell_key = None
+        self._cell = []
+        self._cell_tail = ""
+        return rest
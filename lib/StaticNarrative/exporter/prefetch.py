@@ -0,0 +1,205 @@
+"""
+Fetches the Workspace data needed to render all the app cells in a Narrative, using as few
+Workspace calls as possible.
+"""
+import logging
+from typing import Any
+
+from installed_clients.baseclient import ServerError
+from installed_clients.WorkspaceClient import Workspace
+from nbformat import NotebookNode
+
+from .app_processor import get_exec_result, get_param_upas
+from .cell_cache import is_cached_cell
+from .object_cache import ObjectCache, versioned_ref_ws_id
+from .processor_util import get_report_ref
+
+# Reports can be large, so they're fetched in smaller batches than object infos.
+REPORT_BATCH_SIZE = 50
+INFO_BATCH_SIZE = 1000
+
+
+def prefetch_narrative_data(
+    nb: NotebookNode, ws_client: Workspace, object_cache: ObjectCache | None = None
+) -> dict[str, dict[str, Any]]:
+    """
+    Walks over every app cell in the Narrative to collect the reports they created and the
+    objects used as their inputs, then fetches all of those at once. That takes one batch of
+    Workspace.get_objects2 calls for the reports, then one batch of get_object_info3 calls for
+    both the input objects and the objects created by the reports.
+
+    The result is meant to be handed to the AppProcessor (and from there to
+    build_report_view_data), which only go to the Workspace for anything missing here.
+
+    Returns a dict with the following format:
+    {
+        reports: {
+            report ref (str): report data (dict)
+        },
+        infos: {
+            object ref (str): object info (list), or None if it couldn't be fetched
+        }
+    }
+    Any report that couldn't be fetched is left out, so it's fetched again (and its error
+    gets raised) while processing its cell. Cells found in the cell cache are skipped, as
+    they don't get processed.
+
+    If object_cache is given, reports and infos with fully versioned refs are looked up
+    there first, and cached once they're fetched. That's only done for refs in public
+    workspaces, which takes one more call to Workspace.get_permissions_mass to check.
+
+    :param nb: NotebookNode - the Narrative to prefetch data for
+    :param ws_client: Workspace - the Workspace client to use
+    :param object_cache: ObjectCache - optional, the cache of reports and object infos
+    """
+    report_refs, upas = _app_cell_refs(nb)
+    public_ws_ids = set()
+    if object_cache is not None:
+        public_ws_ids = _public_ws_ids(ws_client, report_refs + upas)
+
+    reports = _get_reports(ws_client, report_refs, object_cache, public_ws_ids)
+    for report in reports.values():
+        upas += [obj["ref"] for obj in report.get("objects_created") or []]
+    infos = _get_infos(
+        ws_client, list(dict.fromkeys(upas)), object_cache, public_ws_ids
+    )
+    return {"reports": reports, "infos": infos}
+
+
+def _app_cell_refs(nb: NotebookNode) -> tuple[list[str], list[str]]:
+    """
+    Returns the refs of the reports made by the Narrative's app cells (without
+    duplicates), and the UPAs of the objects used as their inputs. Cells found in the cell
+    cache are skipped.
+    """
+    report_refs = []
+    upas = []
+    for cell in nb.cells:
+        kb_meta = cell.get("metadata", {}).get("kbase", {})
+        if (
+            kb_meta.get("type") != "app"
+            or "appCell" not in kb_meta
+            or is_cached_cell(cell)
+        ):
+            continue
+        app_cell = kb_meta["appCell"]
+        report_ref = get_report_ref(get_exec_result(app_cell))
+        if report_ref is not None:
+            report_refs.append(report_ref)
+        param_values = app_cell.get("params") or {}
+        for p in app_cell.get("app", {}).get("spec", {}).get("parameters", []):
+            upas += get_param_upas(param_values.get(p["id"]), p)
+    return list(dict.fromkeys(report_refs)), upas
+
+
+def _cached_refs(refs: list[str], public_ws_ids: set[int]) -> list[str]:
+    """Returns the refs that can be cached, the fully versioned ones in public_ws_ids."""
+    return [ref for ref in refs if versioned_ref_ws_id(ref) in public_ws_ids]
+
+
+def _get_reports(
+    ws_client: Workspace,
+    refs: list[str],
+    object_cache: ObjectCache | None,
+    public_ws_ids: set[int],
+) -> dict[str, dict[str, Any]]:
+    """
+    Returns the reports at refs. The ones in public_ws_ids are looked up in object_cache
+    first, and cached once they're fetched.
+    """
+    cached_refs = _cached_refs(refs, public_ws_ids)
+    reports = {}
+    for ref in cached_refs:
+        report = object_cache.get_report(ref)
+        if report is not None:
+            reports[ref] = report
+    fetched = _fetch_reports(ws_client, [ref for ref in refs if ref not in reports])
+    for ref in cached_refs:
+        if ref in fetched:
+            object_cache.put_report(ref, fetched[ref])
+    reports.update(fetched)
+    return reports
+
+
+def _get_infos(
+    ws_client: Workspace,
+    refs: list[str],
+    object_cache: ObjectCache | None,
+    public_ws_ids: set[int],
+) -> dict[str, list | None]:
+    """
+    Returns the object infos at refs. The ones in public_ws_ids are looked up in
+    object_cache first, and cached once they're fetched.
+    """
+    cached_refs = _cached_refs(refs, public_ws_ids)
+    infos = {}
+    for ref in cached_refs:
+        info = object_cache.get_info(ref)
+        if info is not None:
+            infos[ref] = info
+    fetched = _fetch_infos(ws_client, [ref for ref in refs if ref not in infos])
+    for ref in cached_refs:
+        if fetched.get(ref) is not None:
+            object_cache.put_info(ref, fetched[ref])
+    infos.update(fetched)
+    return infos
+
+
+def _public_ws_ids(ws_client: Workspace, refs: list[str]) -> set[int]:
+    """
+    Returns the ids of the workspaces that refs are in that are publicly readable right
+    now. Refs that aren't fully versioned are skipped.
+    """
+    ws_ids = sorted({versioned_ref_ws_id(ref) for ref in refs} - {None})
+    if not ws_ids:
+        return set()
+    try:
+        perms = ws_client.get_permissions_mass(
+            {"workspaces": [{"id": ws_id} for ws_id in ws_ids]}
+        )["perms"]
+    except ServerError as err:
+        logging.getLogger("StaticNarrative").warning(
+            "Unable to check workspace permissions: %s", err.message
+        )
+        return set()
+    return {
+        ws_id
+        for ws_id, ws_perms in zip(ws_ids, perms, strict=True)
+        if ws_perms.get("*", "n") != "n"
+    }
+
+
+def _fetch_reports(ws_client: Workspace, refs: list[str]) -> dict[str, dict[str, Any]]:
+    reports = {}
+    for i in range(0, len(refs), REPORT_BATCH_SIZE):
+        batch = refs[i : i + REPORT_BATCH_SIZE]
+        try:
+            data = ws_client.get_objects2(
+                {"objects": [{"ref": ref} for ref in batch], "ignoreErrors": 1}
+            )["data"]
+        except ServerError as err:
+            logging.getLogger("StaticNarrative").warning(
+                "Unable to prefetch reports: %s", err.message
+            )
+            continue
+        for ref, obj in zip(batch, data, strict=True):
+            if obj is not None:
+                reports[ref] = obj["data"]
+    return reports
+
+
+def _fetch_infos(ws_client: Workspace, refs: list[str]) -> dict[str, list | None]:
+    infos = {}
+    for i in range(0, len(refs), INFO_BATCH_SIZE):
+        batch = refs[i : i + INFO_BATCH_SIZE]
+        try:
+            batch_infos = ws_client.get_object_info3(
+                {"objects": [{"ref": ref} for ref in batch], "ignoreErrors": 1}
+            )["infos"]
+        except ServerError as err:
+            logging.getLogger("StaticNarrative").warning(
+                "Unable to prefetch object infos: %s", err.message
+            )
+            continue
+        infos.update(zip(batch, batch_infos, strict=True))
+    return infos
@@ -3,52 +3,74 @@ Narrative preprocessor for nbconvert exporting
 """
 __author__ = "Bill Riehl <wjriehl@lbl.gov>"
 
+import base64
+import binascii
 import os
-from collections import defaultdict
 from datetime import datetime
 from typing import Any
 
-from installed_clients.NarrativeMethodStoreClient import NarrativeMethodStore
 from nbconvert.preprocessors import Preprocessor
 from nbformat import NotebookNode
 
 from StaticNarrative.upa import deserialize
 
 from .app_processor import AppProcessor
-from .processor_util import get_authors, get_icon
+from .cell_cache import is_cached_cell
+from .processor_util import get_icon
+from .published_files import write_image_file
+from .shared_styles import publish_stylesheet
+
+# all the static files (css, fonts, etc.) are relative to this dir.
+BASE_PATH = os.path.dirname(os.path.abspath(__file__))
+# the output image types that get written to their own files, and their file extensions
+OUTPUT_IMAGE_TYPES = {"image/png": "png", "image/jpeg": "jpg"}
 
 
 class NarrativePreprocessor(Preprocessor):
+    """
+    Processes the KBase cells of a Narrative for templating.
+
+    A single instance of this gets reused for every export by the cached HTMLExporter,
+    so anything specific to one Narrative is read from the NarrativeSession that
+    comes in with the resources (as resources["narrative_session"]).
+    """
+
     def __init__(
         self: "NarrativePreprocessor", config: Any | None = None, **kw: dict[str, Any]
     ) -> None:
         super().__init__(config=config, **kw)
-        self.host = self.config.narrative_session.host
-        base_path = self.config.narrative_session.base_path
         self.style_file = os.path.join(
-            base_path, "static", "styles", "static_narrative.css"
+            BASE_PATH, "static", "styles", "static_narrative.css"
         )
         self.icon_style_file = os.path.join(
-            base_path, "static", "styles", "kbase_icons.css"
-        )
-        self.assets_base_url = self.config.narrative_session.assets_base_url
-        self.assets_version = self.config.narrative_session.assets_version
-        self.app_processor = AppProcessor(
-            self.host,
-            self.config.narrative_session.ws_url,
-            self.config.narrative_session.nms_url,
-            self.config.narrative_session.token,
+            BASE_PATH, "static", "styles", "kbase_icons.css"
         )
+        # these only change when the service does, so they're only read once
+        with open(self.style_file) as css:
+            self.style_css = css.read()
+        with open(self.icon_style_file) as icons:
+            self.icon_style_css = icons.read()
 
     def preprocess(
         self: "NarrativePreprocessor", nb: NotebookNode, resources: dict[str, Any]
     ) -> tuple[Any, dict[str, Any]]:
-        (nb, resources) = super().preprocess(nb, resources)
+        session = resources["narrative_session"]
+        app_processor = self._build_app_processor(session)
+        for index, cell in enumerate(nb.cells):
+            # cells from the cell cache are already rendered
+            if is_cached_cell(cell):
+                continue
+            nb.cells[index], resources = self.preprocess_cell(
+                cell, resources, index, app_processor=app_processor
+            )
 
-        app_meta = self._get_app_metadata(nb, self.config.narrative_session.nms_url)
-        narr_data = self.config.narrative_session.narrative_data
+        app_meta = session.app_meta
+        narr_data = session.narrative_data
         data_types = ", ".join(sorted(narr_data.get("types", {}).keys()))
-        ws_id = self.config.narrative_session.ws_id
+        ws_id = session.ws_id
+        host = session.host
+        assets_base_url = session.assets_base_url
+        assets_version = session.assets_version
 
         # Get some more stuff to show in the page into resources
         if "kbase" not in resources:
@@ -56,101 +78,59 @@ class NarrativePreprocessor(Preprocessor):
         resources["kbase"].update(
             {
                 "title": nb["metadata"]["name"],
-                "host": self.host,
+                "host": host,
                 "creator": nb["metadata"]["creator"],
-                "narrative_link": f"{self.host}/narrative/{ws_id}",
-                "authors": get_authors(self.config, nb["metadata"]["wsid"]),
-                "service_wizard_url": self.config.narrative_session.service_wizard_url,
-                "data_ie_url": self.config.narrative_session.data_ie_url,
-                "script_bundle_url": self.assets_base_url
+                "narrative_link": f"{host}/narrative/{ws_id}",
+                "authors": session.authors,
+                "service_wizard_url": session.service_wizard_url,
+                "data_ie_url": session.data_ie_url,
+                "script_bundle_url": assets_base_url
                 + "/js/"
-                + self.assets_version
+                + assets_version
                 + "/staticNarrativeBundle.js",
                 "datestamp": datetime.now().strftime("%B %d, %Y").replace(" 0", " "),
-                "logo_url": self.assets_base_url
-                + "/images/kbase-logos/logo-icon-46-46.png",
+                "logo_url": assets_base_url + "/images/kbase-logos/logo-icon-46-46.png",
                 "app_citations": app_meta["citations"],
                 "meta_keywords": f"{app_meta['meta']}, {data_types}",
                 "meta_description": f"A KBase Narrative that uses these Apps: {app_meta['meta']}",
             }
         )
 
-        if "inlining" not in resources:
-            resources["inlining"] = {}
-        if "css" not in resources["inlining"]:
-            resources["inlining"]["css"] = []
-        with open(self.style_file) as css:
-            resources["inlining"]["css"].append(css.read())
-        with open(self.icon_style_file) as icons:
-            icons_file = self.icons_font_css() + icons.read()
-            resources["inlining"]["css"].append(icons_file)
+        styles = [
+            self.style_css,
+            self.icons_font_css(assets_base_url, assets_version) + self.icon_style_css,
+        ]
+        resources["kbase"]["stylesheets"] = []
+        if session.shared_styles_root is not None:
+            resources["kbase"]["stylesheets"].append(
+                publish_stylesheet(session.shared_styles_root, "\n".join(styles))
+            )
+        else:
+            if "inlining" not in resources:
+                resources["inlining"] = {}
+            if "css" not in resources["inlining"]:
+                resources["inlining"]["css"] = []
+            resources["inlining"]["css"].extend(styles)
 
         return nb, resources
 
-    def _get_app_metadata(
-        self: "NarrativePreprocessor", nb: NotebookNode, nms_url: str
-    ) -> dict[str, str | list[dict[str, str | dict[str, str]]]]:
-        """
-        Returns a structure containing app metadata and citations.
-        {
-            meta: str,
-            citations: [{
-                heading: "Released Apps" (some readable str, not just "dev"),
-                app_list: {
-                    app_name_1: [{
-                        link: 'some link',
-                        display_text: 'publication_text'
-                    }],
-                    app_name_2: [{
-                        link: 'some other link',
-                        display_text: 'other publication'
-                    }]
-                }
-            }]
-        }
-        """
-        # will be tag -> app_id
-        apps = defaultdict(set)
-        for cell in nb.cells:
-            if "kbase" in cell.metadata:
-                kb_meta = cell.metadata.get("kbase", {})
-                if kb_meta.get("type") == "app" and "app" in kb_meta:
-                    apps[kb_meta["app"].get("tag", "dev")].add(kb_meta["app"]["id"])
-
-        citations = defaultdict(dict)
-        app_names = set()  # the "metadata" is just a list of unique app names.
-        nms = NarrativeMethodStore(url=nms_url)
-        for tag in apps:
-            nms_inputs = {"ids": list(apps[tag]), "tag": tag}
-
-            try:
-                app_infos = nms.get_method_full_info(nms_inputs)
-            except Exception as e:
-                app_infos = []
-            for info in app_infos:
-                app_names.add(info["name"])
-                if "publications" in info:
-                    citations[tag][info["name"]] = info["publications"]
-
-        tag_map = {
-            "release": "Released Apps",
-            "beta": "Apps in Beta",
-            "dev": "Apps in development",
-        }
-        parsed_citations = [
-            {"heading": tag_map[tag], "app_list": citations[tag]}
-            for tag in tag_map
-            if tag in citations
-        ]
-        return {"citations": parsed_citations, "meta": ", ".join(sorted(app_names))}
+    def _build_app_processor(
+        self: "NarrativePreprocessor", session: Any
+    ) -> AppProcessor:
+        return AppProcessor(
+            session.host,
+            session.clients.workspace,
+            prefetched=session.prefetched,
+            report_dir=session.report_dir,
+        )
 
-    def icons_font_css(self: "NarrativePreprocessor") -> str:
+    def icons_font_css(
+        self: "NarrativePreprocessor", assets_base_url: str, assets_version: str
+    ) -> str:
         """
         Generates the icon font loading css chunk
         """
-        font_url = (
-            self.assets_base_url + "/fonts/" + self.assets_version + "/kbase-icons"
-        )
+        font_url = assets_base_url + "/fonts/" + assets_version + "/kbase-icons"
         return (
             "@font-face {\n"
             '    font-family: "kbase-icons";\n'
@@ -204,8 +184,10 @@ class NarrativePreprocessor(Preprocessor):
         cell: object,
         resources: dict[str, Any],
         index: int,
+        app_processor: AppProcessor | None = None,
     ) -> tuple[object, dict[str, Any]]:
-        ws_id = self.config.narrative_session.ws_id
+        session = resources["narrative_session"]
+        ws_id = session.ws_id
 
         if "kbase" in cell.metadata:
             kb_meta = cell.metadata.get("kbase", {})
@@ -213,15 +195,17 @@ class NarrativePreprocessor(Preprocessor):
                 "type": kb_meta.get("type"),
                 "idx": index,
                 "attributes": kb_meta.get("attributes", {}),
-                "icon": get_icon(self.config, kb_meta),
+                "icon": get_icon(session, kb_meta),
             }
             if kb_info["type"] == "app":
-                kb_info.update(self.app_processor.process(kb_info, kb_meta))
-                kb_info["external_link"] = self.host + kb_info["app"]["catalog_url"]
+                if app_processor is None:
+                    app_processor = self._build_app_processor(session)
+                kb_info.update(app_processor.process(kb_info, kb_meta))
+                kb_info["external_link"] = session.host + kb_info["app"]["catalog_url"]
             elif kb_info["type"] == "data":
                 ref = self._get_data_cell_ref(kb_meta, ws_id)
                 if ref is not None:
-                    kb_info["external_link"] = f"{self.host}/#dataview/{ref}"
+                    kb_info["external_link"] = f"{session.host}/#dataview/{ref}"
         else:
             kb_info = {"type": "nonkb"}
         cell.metadata["kbase"] = kb_info
@@ -231,3 +215,45 @@ class NarrativePreprocessor(Preprocessor):
             resources["kbase"]["cells"] = {}
         resources["kbase"]["cells"][index] = cell.metadata.get("kbase")
         return cell, resources
+
+
+class OutputImagePreprocessor(Preprocessor):
+    """
+    Moves the images in code cell outputs out of the page and into their own files (see
+    published_files.write_image_file), which get published next to it. Otherwise, they'd
+    be inlined in the page as base64. Each output that had an image gets its URL in
+    output.metadata.filenames, which the template uses instead of the image data.
+
+    Like the NarrativePreprocessor, this gets reused for every export, and the directory
+    to write the images to comes from the NarrativeSession (as its image_dir). If that's
+    None, the images are left where they are.
+    """
+
+    def preprocess(
+        self: "OutputImagePreprocessor", nb: NotebookNode, resources: dict[str, Any]
+    ) -> tuple[Any, dict[str, Any]]:
+        image_dir = resources["narrative_session"].image_dir
+        if image_dir is None:
+            return nb, resources
+        for cell in nb.cells:
+            # cells from the cell cache are already rendered
+            if cell.cell_type != "code" or is_cached_cell(cell):
+                continue
+            for output in cell.get("outputs", []):
+                self._extract_images(output, image_dir)
+        return nb, resources
+
+    def _extract_images(
+        self: "OutputImagePreprocessor", output: NotebookNode, image_dir: str
+    ) -> None:
+        for mime_type, extension in OUTPUT_IMAGE_TYPES.items():
+            data = output.get("data", {}).get(mime_type)
+            if not isinstance(data, str):
+                continue
+            try:
+                image = base64.b64decode(data)
+            except binascii.Error:
+                # leave it to the browser
+                continue
+            filenames = output.setdefault("metadata", {}).setdefault("filenames", {})
+            filenames[mime_type] = write_image_file(image_dir, image, extension)
@@ -4,14 +4,19 @@ Some catch-all functions for helping process Narrative cells.
 import html
 import json
 import os
+from collections import defaultdict
 from typing import Any
 from urllib.parse import quote
 
-from installed_clients.authclient import KBaseAuth
+from installed_clients.NarrativeMethodStoreClient import NarrativeMethodStore
 from installed_clients.WorkspaceClient import Workspace
+from nbformat import NotebookNode
 
 from StaticNarrative import STATIC_NARRATIVE_BASE_DIR
 
+from .app_specs import AppSpecCache
+from .published_files import write_report_file
+
 ICON_DATA = None
 
 
@@ -23,16 +28,47 @@ def _load_icon_data() -> None:
         ICON_DATA = json.load(icon_file)
 
 
+def get_report_ref(result: dict[str, Any] | list[dict[str, Any]]) -> str | None:
+    """
+    Returns the reference to the report created by an app, given the app's job result,
+    or None if there's no report.
+    """
+    if not result:
+        return None
+    if not isinstance(result, list):
+        result = [result]
+    if (
+        not result[0]
+        or not isinstance(result[0], dict)
+        or not result[0].get("report_name")
+        or not result[0].get("report_ref")
+    ):
+        return None
+    return result[0]["report_ref"]
+
+
 def build_report_view_data(
-    host: str, ws_client: Workspace, result: dict[str, Any] | list[dict[str, Any]]
+    host: str,
+    ws_client: Workspace,
+    result: dict[str, Any] | list[dict[str, Any]],
+    prefetched: dict[str, dict[str, Any]] | None = None,
+    report_dir: str | None = None,
 ) -> dict[str, str | list | dict]:
     """
+    If prefetched is given (see prefetch.prefetch_narrative_data), the report and the
+    infos for its created objects are looked up there first, and only fetched from
+    the Workspace if they're missing.
+
+    If report_dir is given, the report's direct html gets written to a file under it (see
+    published_files.write_report_file), and linked to from the page. Otherwise, it's inlined
+    in the page as a data: URL. Either way, the page shows it in a sandboxed iframe.
+
     Returns a structure like this:
     {
         html: {
             height: max height string for iframes (default = 500px, unless present in report),
-            set_height: boolean - if True, then apply height to the height style value as well.
-            direct: string (optional) - direct html to plop in the page,
+            set_height: boolean - False if the direct html is only part of a page.
+            direct: string (optional) - URL of the direct html to plop in the page,
             iframe_style: string (optional) - styling for direct html iframe,
             links: [{
                 url: string,
@@ -64,21 +100,16 @@ def build_report_view_data(
         report: ''
     }
     """
-    if not result:
-        return {}
-    if not isinstance(result, list):
-        result = [result]
-    if (
-        not result[0]
-        or not isinstance(result[0], dict)
-        or not result[0].get("report_name")
-        or not result[0].get("report_ref")
-    ):
+    report_ref = get_report_ref(result)
+    if report_ref is None:
         return {}
-    report_ref = result[0]["report_ref"]
-    report = ws_client.get_objects2({"objects": [{"ref": report_ref}]})["data"][0][
-        "data"
-    ]
+    prefetched = prefetched or {}
+    prefetched_infos = prefetched.get("infos", {})
+    report = prefetched.get("reports", {}).get(report_ref)
+    if report is None:
+        report = ws_client.get_objects2({"objects": [{"ref": report_ref}]})["data"][0][
+            "data"
+        ]
     """{'direct_html': None,
      'direct_html_link_index': None,
      'file_links': [],
@@ -92,11 +123,14 @@ def build_report_view_data(
     created_objs = []
     if report.get("objects_created"):
         report_objs_created = report["objects_created"]
-        # make list to look up obj types with get_object_info3
-        info_lookup = [{"ref": o["ref"]} for o in report_objs_created]
-        infos = ws_client.get_object_info3({"objects": info_lookup, "ignoreErrors": 1})[
-            "infos"
-        ]
+        if all(o["ref"] in prefetched_infos for o in report_objs_created):
+            infos = [prefetched_infos[o["ref"]] for o in report_objs_created]
+        else:
+            # make list to look up obj types with get_object_info3
+            info_lookup = [{"ref": o["ref"]} for o in report_objs_created]
+            infos = ws_client.get_object_info3(
+                {"objects": info_lookup, "ignoreErrors": 1}
+            )["infos"]
 
         for idx, info in enumerate(infos):
             if info:
@@ -116,9 +150,12 @@ def build_report_view_data(
     if report.get("direct_html"):
         if not report.get("direct_html").startswith("<html"):
             html["set_height"] = False
-        html["direct"] = "data:text/html;charset=utf-8," + quote(
-            report.get("direct_html")
-        )
+        if report_dir is not None:
+            html["direct"] = write_report_file(report_dir, report["direct_html"])
+        else:
+            html["direct"] = "data:text/html;charset=utf-8," + quote(
+                report.get("direct_html")
+            )
 
     if report.get("html_links"):
         idx = report.get("direct_html_link_index", 0)
@@ -137,11 +174,9 @@ def build_report_view_data(
     if summary_height is None:
         summary_height = 500
 
-    html["iframe_style"] = f"max-height: {html['height']}"
-    if html["set_height"]:
-        html["iframe_style"] += f"; height: {html['height']}"
-    else:
-        html["iframe_style"] += "; height: auto"
+    # The report is sandboxed in its own origin, so the page can't size the iframe to
+    # fit it, and it always gets the full height.
+    html["iframe_style"] = f"max-height: {html['height']}; height: {html['height']}"
     return {
         "objects": created_objs,
         "summary": report.get("text_message", ""),
@@ -150,7 +185,7 @@ def build_report_view_data(
     }
 
 
-def get_icon(config: dict[str, Any], metadata: dict[str, Any]) -> dict[str, str]:
+def get_icon(session: Any, metadata: dict[str, Any]) -> dict[str, str]:
     """
     Should return a dict with keys "type" and "icon"
     * if "type" = image, then "icon" second should be the src.
@@ -177,7 +212,7 @@ def get_icon(config: dict[str, Any], metadata: dict[str, Any]) -> dict[str, str]
         ):
             icon["type"] = "image"
             icon["icon"] = (
-                config.narrative_session.nms_image_url
+                session.nms_image_url
                 + metadata["appCell"]["app"]["spec"]["info"]["icon"]["url"]
             )
         else:
@@ -209,14 +244,11 @@ def get_data_icon(obj_type: str) -> dict[str, str]:
     return icon_info
 
 
-def get_authors(config: dict[str, Any], wsid: str) -> list[dict[str, str]]:
-    ws_client = Workspace(
-        url=config.narrative_session.ws_url, token=config.narrative_session.token
-    )
-    ws_info = ws_client.get_workspace_info({"id": wsid})
-    author_id_list = [ws_info[2]]
+def get_authors(session: Any, wsid: str) -> list[dict[str, str]]:
+    snapshot = session.clients.workspace_snapshot(wsid)
+    author_id_list = [snapshot["info"][2]]
 
-    other_authors = ws_client.get_permissions({"id": wsid})
+    other_authors = snapshot["perms"]
 
     for author in sorted(other_authors.keys()):
         if (
@@ -226,11 +258,10 @@ def get_authors(config: dict[str, Any], wsid: str) -> list[dict[str, str]]:
         ):
             author_id_list.append(author)
 
-    auth = KBaseAuth(config.narrative_session.auth_url)
     disp_names = {}
     try:
-        disp_names = auth.get_display_names(
-            config.narrative_session.token, author_id_list
+        disp_names = session.clients.auth.get_display_names(
+            session.clients.token, author_id_list
         )
     except Exception as e:
         print(str(e))
@@ -239,7 +270,65 @@ def get_authors(config: dict[str, Any], wsid: str) -> list[dict[str, str]]:
         {
             "id": author,
             "name": html.escape(disp_names.get(author, author)),
-            "path": config.narrative_session.profile_page_url + author,
+            "path": session.profile_page_url + author,
         }
         for author in author_id_list
     ]
+
+
+def get_app_metadata(
+    nb: NotebookNode, nms: NarrativeMethodStore, app_specs: AppSpecCache | None = None
+) -> dict[str, str | list[dict[str, str | dict[str, str]]]]:
+    """
+    Returns a structure containing app metadata and citations for all the app cells in
+    a Narrative. This reads the app info from the Narrative's cell metadata as it's stored,
+    so it doesn't need to wait for the cells to be preprocessed.
+    {
+        meta: str,
+        citations: [{
+            heading: "Released Apps" (some readable str, not just "dev"),
+            app_list: {
+                app_name_1: [{
+                    link: 'some link',
+                    display_text: 'publication_text'
+                }],
+                app_name_2: [{
+                    link: 'some other link',
+                    display_text: 'other publication'
+                }]
+            }
+        }]
+    }
+
+    App info is looked up in app_specs first, if given, and only the apps that aren't
+    there are fetched from the NarrativeMethodStore.
+    """
+    # will be tag -> app_id
+    apps = defaultdict(set)
+    for cell in nb.cells:
+        if "kbase" in cell.metadata:
+            kb_meta = cell.metadata.get("kbase", {})
+            if kb_meta.get("type") == "app" and "appCell" in kb_meta:
+                app = kb_meta["appCell"]["app"]
+                apps[app.get("tag", "dev")].add(app["id"])
+
+    citations = defaultdict(dict)
+    app_names = set()  # the "metadata" is just a list of unique app names.
+    app_specs = app_specs or AppSpecCache(0, 0)
+    for tag in apps:
+        for info in app_specs.get_infos(nms, tag, sorted(apps[tag])):
+            app_names.add(info["name"])
+            if "publications" in info:
+                citations[tag][info["name"]] = info["publications"]
+
+    tag_map = {
+        "release": "Released Apps",
+        "beta": "Apps in Beta",
+        "dev": "Apps in development",
+    }
+    parsed_citations = [
+        {"heading": tag_map[tag], "app_list": citations[tag]}
+        for tag in tag_map
+        if tag in citations
+    ]
+    return {"citations": parsed_citations, "meta": ", ".join(sorted(app_names))}
@@ -0,0 +1,68 @@
+"""
+Writes the parts of a Narrative that would otherwise be inlined in the page into their own
+files, which get published next to the Static Narrative:
+    * the HTML of app reports (their direct_html), instead of data: URLs in their iframes
+      (see the "report-files" config value)
+    * images from code cell outputs, instead of base64 data: URLs in their img tags (see
+      the "image-files" config value, and preprocessor.OutputImagePreprocessor)
+
+Each file is named by the sha256 of its content, like reports/<sha256>.html or
+images/<sha256>.png, so something that shows up in more than one cell only gets written
+once. The page links to them with URLs relative to itself, and only loads them when
+they're scrolled to.
+"""
+import hashlib
+import os
+import re
+
+REPORTS_DIR = "reports"
+IMAGES_DIR = "images"
+_PUBLISHED_FILE = re.compile(
+    rf"\b((?:{REPORTS_DIR}|{IMAGES_DIR})/[0-9a-f]{{64}}\.(?:html|png|jpg))\b"
+)
+# Static file servers don't always say what charset a file is in, and reports were
+# always shown as UTF-8, so each report file starts with a byte order mark to say so.
+_BOM = "\ufeff"
+
+
+def write_report_file(output_dir: str, report_html: str) -> str:
+    """
+    Writes a report's HTML into the reports directory under output_dir, unless the same
+    report is already there. Returns the report's URL, relative to the page.
+
+    :param output_dir: str - the directory the Static Narrative is being exported into
+    :param report_html: str - the report's direct_html
+    """
+    return _write_file(
+        output_dir, REPORTS_DIR, "html", (_BOM + report_html).encode("utf-8")
+    )
+
+
+def write_image_file(output_dir: str, image: bytes, extension: str) -> str:
+    """
+    Writes an image into the images directory under output_dir, unless the same image is
+    already there. Returns the image's URL, relative to the page.
+
+    :param output_dir: str - the directory the Static Narrative is being exported into
+    :param image: bytes - the image itself
+    :param extension: str - the file extension for the image's type, e.g. "png"
+    """
+    return _write_file(output_dir, IMAGES_DIR, extension, image)
+
+
+def _write_file(output_dir: str, directory: str, extension: str, content: bytes) -> str:
+    url = f"{directory}/{hashlib.sha256(content).hexdigest()}.{extension}"
+    path = os.path.join(output_dir, *url.split("/"))
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as published_file:
+            published_file.write(content)
+    return url
+
+
+def find_published_files(html: str) -> set[str]:
+    """
+    Returns the URLs (relative to the page, like reports/<sha256>.html) of all the files
+    that some rendered HTML links to.
+    """
+    return set(_PUBLISHED_FILE.findall(html))
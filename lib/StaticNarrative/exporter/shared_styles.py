@@ -0,0 +1,48 @@
+"""
+Publishes the Static Narrative stylesheet once, in the static file root, so every page can
+link to the same copy instead of inlining its own (see the "shared-styles" config value).
+
+The stylesheet is named by a hash of its content, like
+<static-file-root>/styles/static_narrative.<hash>.css, so browsers and CDNs can cache it
+for as long as they like, and a page always gets the styles it was exported with. Old
+stylesheets are left in place, as the pages published with them still link to them.
+"""
+import hashlib
+import os
+import threading
+
+from StaticNarrative.uploader.compressor import compress_static_files
+
+STYLES_DIR = "styles"
+STYLESHEET_NAME = "static_narrative"
+
+# the stylesheets this worker already knows are published
+_published = set()
+_published_lock = threading.Lock()
+
+
+def publish_stylesheet(webroot: str, css: str) -> str:
+    """
+    Writes a stylesheet to the styles directory in the static file root, unless it's
+    already there. Returns its URL, relative to a published Static Narrative (which are
+    at <webroot>/<ws_id>/<version>/index.html).
+
+    :param webroot: str - the static file root
+    :param css: str - the stylesheet
+    """
+    digest = hashlib.sha256(css.encode("utf-8")).hexdigest()[:16]
+    file_name = f"{STYLESHEET_NAME}.{digest}.css"
+    styles_dir = os.path.join(webroot, STYLES_DIR)
+    path = os.path.join(styles_dir, file_name)
+    with _published_lock:
+        if path not in _published:
+            if not os.path.exists(path):
+                os.makedirs(styles_dir, exist_ok=True)
+                tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                with open(tmp_path, "w", encoding="utf-8") as css_file:
+                    css_file.write(css)
+                os.replace(tmp_path, path)
+            # only writes the siblings that aren't there yet
+            compress_static_files(styles_dir)
+            _published.add(path)
+    return f"../../{STYLES_DIR}/{file_name}"
@@ -1,3 +1,37 @@
+/**
+ * Returns the objects in some Narrative data (data.json or a page of it), one row per
+ * object. The data's either already in rows, or in columns (see
+ * data_exporter.encode_compact).
+ *
+ * @param {Object} data - the data, as loaded from its file
+ * @return {Array} the objects, each as [ref, name, type, save date, metadata]
+ */
+function decodeDataRows(data) {
+    if (data.format !== 'compact') {
+        return data.data
+    }
+    if (data.format_version !== 1) {
+        throw new Error('Unknown data format version ' + data.format_version)
+    }
+    const columns = data.columns
+    return columns.ref.map((ref, i) => {
+        let meta = columns.meta[i]
+        if (meta) {
+            const metaObj = {}
+            for (let j = 0; j < meta.length; j += 2) {
+                metaObj[data.meta_keys[meta[j]]] = data.meta_values[meta[j + 1]]
+            }
+            meta = metaObj
+        }
+        return [ref, columns.name[i], data.type_names[columns.type[i]], columns.saved[i], meta]
+    })
+}
+
+/**
+ * Shows the data in a Narrative, from its data.json file. That either has all the data in
+ * it, or it's a manifest of pages of data (see data_exporter.write_data_pages), which get
+ * loaded as they're scrolled to.
+ */
 class DataBrowser {
     constructor(options) {
         this.dataFile = options.dataFile
@@ -19,17 +53,77 @@ class DataBrowser {
     render(data) {
         this.container = this.structureRender()
         this.node.appendChild(this.container)
-        data.data.forEach((obj) => {
+        this.types = data.types
+        if (data.pages) {
+            this.pages = data.pages.slice()
+            this.renderPager()
+        }
+        else {
+            this.renderObjects(decodeDataRows(data))
+        }
+    }
+
+    renderObjects(objects) {
+        objects.forEach((obj) => {
             let type = obj[2].split('-')[0].split('.')[1]
             new DataCard({
                 container: this.container,
                 data: obj,
-                icon: data.types[type].icon,
+                icon: this.types[type].icon,
                 type: type
             })
         })
     }
 
+    renderPager() {
+        // a button that loads the next page, clicked automatically when it's scrolled to
+        this.moreButton = document.createElement('button')
+        this.moreButton.classList.add('kb-data-more')
+        this.moreButton.textContent = 'Show more'
+        this.moreButton.addEventListener('click', () => this.loadNextPage())
+        this.node.appendChild(this.moreButton)
+        if ('IntersectionObserver' in window) {
+            this.observer = new IntersectionObserver((entries) => {
+                if (entries.some(entry => entry.isIntersecting)) {
+                    this.loadNextPage()
+                }
+            })
+            this.observer.observe(this.moreButton)
+        }
+        this.loadNextPage()
+    }
+
+    loadNextPage() {
+        if (this.loadingPage || !this.pages.length) {
+            return
+        }
+        this.loadingPage = true
+        const page = this.pages.shift()
+        const pageFile = this.dataFile.replace(/[^/]*$/, page.file)
+        fetch(pageFile)
+            .then(data => data.json())
+            .then((data) => {
+                this.renderObjects(decodeDataRows(data))
+                this.loadingPage = false
+                if (!this.pages.length) {
+                    if (this.observer) {
+                        this.observer.disconnect()
+                    }
+                    this.moreButton.remove()
+                }
+                else if (this.observer) {
+                    // observing it again checks if it's still in view
+                    this.observer.unobserve(this.moreButton)
+                    this.observer.observe(this.moreButton)
+                }
+            })
+            .catch((error) => {
+                this.pages.unshift(page)
+                this.loadingPage = false
+                this.renderError(error)
+            })
+    }
+
     structureRender() {
         // do some stuff. make overall structure. I guess.
         let container = document.createElement('div')
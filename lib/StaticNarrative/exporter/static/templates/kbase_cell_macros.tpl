@@ -34,10 +34,12 @@
                 <div class="kb-app-report"></div>
             </div>
         {% elif html_info.direct %}
+            {# no allow-same-origin, so reports can't get at the page or its cookies #}
             <iframe src="{{ html_info.direct|e }}"
+                    loading="lazy"
+                    sandbox="allow-scripts allow-popups"
                     class="kb-app-report-iframe"
-                    style="{{ html_info.iframe_style }}"
-                    onload="this.style.height=(Math.max(500, this.contentDocument.body.scrollHeight+45)) + 'px';"></iframe>
+                    style="{{ html_info.iframe_style }}"></iframe>
         {% endif %}
     {%- endcall %}
 {% endmacro %}
@@ -29,6 +29,9 @@
     {{ css }}
     </style>
 {% endfor %}
+{% for stylesheet in resources.kbase.stylesheets -%}
+<link rel="stylesheet" href="{{ stylesheet }}">
+{% endfor %}
 
 <style type="text/css">
 /* Overrides of notebook CSS for static HTML export */
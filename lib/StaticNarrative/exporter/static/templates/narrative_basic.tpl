@@ -1,6 +1,22 @@
 {%- extends 'display_priority.tpl' -%}
 {% from 'kbase_cell_macros.tpl' import render_app_cell, render_output_cell, render_data_cell %}
 
+{#
+  Cells found in the cell cache just get a marker, and their cached HTML gets spliced in
+  after rendering. The others get wrapped in markers so they can be cached.
+  See StaticNarrative.exporter.cell_cache.
+#}
+{%- block any_cell scoped -%}
+{%- set cell_cache = cell.metadata.get('kbase_cell_cache') -%}
+{%- if cell_cache and cell_cache.hit -%}
+<!--kbs-cell:{{ cell_cache.key }}-->
+{%- elif cell_cache -%}
+<!--kbs-cell-start:{{ cell_cache.key }}-->{{ super() }}<!--kbs-cell-end:{{ cell_cache.key }}-->
+{%- else -%}
+{{ super() }}
+{%- endif -%}
+{%- endblock any_cell -%}
+
 {% block codecell %}
 <div class="cell border-box-sizing code_cell rendered">
 {%- if cell.metadata.kbase and cell.metadata.kbase.type == 'app' -%}
@@ -141,7 +157,7 @@ unknown type  {{ cell.type }}
 {% block data_png scoped %}
 <div class="output_png output_subarea {{extra_class}}">
 {%- if 'image/png' in output.metadata.get('filenames', {}) %}
-<img src="{{output.metadata.filenames['image/png'] | posix_path}}"
+<img src="{{output.metadata.filenames['image/png'] | posix_path}}" loading="lazy"
 {%- else %}
 <img src="data:image/png;base64,{{ output.data['image/png'] }}"
 {%- endif %}
@@ -163,7 +179,7 @@ class="unconfined"
 {% block data_jpg scoped %}
 <div class="output_jpeg output_subarea {{extra_class}}">
 {%- if 'image/jpeg' in output.metadata.get('filenames', {}) %}
-<img src="{{output.metadata.filenames['image/jpeg'] | posix_path}}"
+<img src="{{output.metadata.filenames['image/jpeg'] | posix_path}}" loading="lazy"
 {%- else %}
 <img src="data:image/jpeg;base64,{{ output.data['image/jpeg'] }}"
 {%- endif %}
@@ -0,0 +1,112 @@
+"""
+Fingerprints a Static Narrative, so an unchanged Narrative doesn't get exported again.
+
+A fingerprint covers everything that goes into a Static Narrative other than the
+Narrative object itself, which can't change for a given ref (it always includes a version):
+    * the Narrative ref
+    * the version of the exporter - its code, templates, and static files
+    * the assets base url and version that the page links to
+    * the config values that change what gets exported (see OUTPUT_CONFIG)
+    * the data listing of the Narrative's workspace (what goes in data.json)
+"""
+import functools
+import hashlib
+import json
+import os
+from typing import Any
+
+from StaticNarrative import STATIC_NARRATIVE_BASE_DIR
+from StaticNarrative.narrative_ref import NarrativeRef
+
+FINGERPRINT_FILE = "fingerprint.json"
+EXPORTER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "exporter")
+# Files outside the exporter that go into rendering a Static Narrative.
+EXPORTER_DATA_FILES = [os.path.join(STATIC_NARRATIVE_BASE_DIR, "data", "icons.json")]
+# The config values that change a Static Narrative's files, and their defaults.
+OUTPUT_CONFIG = {
+    "stream-render": "false",
+    "data-page-size": "0",
+    "data-format": "rows",
+    "report-files": "false",
+    "image-files": "true",
+    "shared-styles": "false",
+}
+
+
+@functools.cache
+def exporter_version() -> str:
+    """
+    Returns a hash of all the files used to render a Static Narrative (the exporter's code,
+    templates, styles, and scripts, and the EXPORTER_DATA_FILES). This only changes when
+    the service gets updated, so it's only computed once per process.
+    """
+    digest = hashlib.sha256()
+    for root, dirs, files in os.walk(EXPORTER_DIR):
+        dirs[:] = sorted(d for d in dirs if d != "__pycache__")
+        for file_name in sorted(files):
+            path = os.path.join(root, file_name)
+            digest.update(os.path.relpath(path, EXPORTER_DIR).encode("utf-8"))
+            with open(path, "rb") as f:
+                digest.update(f.read())
+    for path in EXPORTER_DATA_FILES:
+        digest.update(os.path.relpath(path, STATIC_NARRATIVE_BASE_DIR).encode("utf-8"))
+        with open(path, "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def narrative_fingerprint(
+    ref: NarrativeRef, narrative_data: dict[str, Any], config: dict[str, str]
+) -> str:
+    """
+    Returns the fingerprint of a Static Narrative, as a hex string.
+
+    :param ref: NarrativeRef - the ref of the Narrative being made static
+    :param narrative_data: dict - the Narrative's data listing, as made by
+        StaticNarrative.exporter.data_exporter.get_narrative_data (the "path" key, if
+        present, is ignored)
+    :param config: dict - the service config
+    """
+    data = {key: narrative_data[key] for key in ("data", "types")}
+    data_hash = hashlib.sha256(
+        json.dumps(data, sort_keys=True).encode("utf-8")
+    ).hexdigest()
+    fingerprint = {
+        "ref": str(ref),
+        "exporter": exporter_version(),
+        "assets_base_url": config["assets-base-url"],
+        "assets_version": config["assets-version"],
+        "output_config": {
+            key: str(config.get(key, default)).lower()
+            for key, default in OUTPUT_CONFIG.items()
+        },
+        "data": data_hash,
+    }
+    return hashlib.sha256(
+        json.dumps(fingerprint, sort_keys=True).encode("utf-8")
+    ).hexdigest()
+
+
+def read_fingerprint(path: str) -> str | None:
+    """
+    Returns the fingerprint stored in the given directory, or None if there isn't one.
+
+    :param path: str - the directory of a published Static Narrative
+    """
+    try:
+        with open(os.path.join(path, FINGERPRINT_FILE)) as f:
+            return json.load(f).get("fingerprint")
+    except (OSError, ValueError):
+        return None
+
+
+def write_fingerprint(path: str, ref: NarrativeRef, fingerprint: str) -> None:
+    """
+    Stores the fingerprint of a Static Narrative in the given directory.
+
+    :param path: str - the directory of a published Static Narrative
+    :param ref: NarrativeRef - the ref of the Narrative that was made static
+    :param fingerprint: str - the fingerprint to store
+    """
+    with open(os.path.join(path, FINGERPRINT_FILE), "w") as f:
+        json.dump({"ref": str(ref), "fingerprint": fingerprint}, f)
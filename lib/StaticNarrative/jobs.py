@@ -0,0 +1,278 @@
+"""
+Runs Static Narrative creation as background jobs, so a web worker isn't tied up for the
+whole export.
+
+Jobs run on a small thread pool in the process that took the submission. Their state gets
+written to a JSON file per job in the job directory, so any worker process can report on
+any job.
+
+Each process that runs jobs holds a lock on its own owner file in the job directory for as
+long as it's alive. A job that's still queued or running when its owner's lock is free was
+lost along with the process running it, so it gets marked as an error when it's read.
+The service workers get forked from a process that's already made its StaticNarrativeJobs,
+so the owner file and thread pool are only set up once a process submits a job.
+"""
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, TextIO
+
+from StaticNarrative.clients import ServiceCaches
+from StaticNarrative.creator import STAGES, StaticNarrativeCreator
+from StaticNarrative.narrative_ref import NarrativeRef
+
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+ERROR = "error"
+SKIPPED = "skipped"
+# the lock files of the processes that run jobs, in the job directory
+OWNERS_DIR = "owners"
+
+
+def _now() -> int:
+    """Returns the current time in ms since the epoch."""
+    return int(time.time() * 1000)
+
+
+class StaticNarrativeJobs:
+    def __init__(
+        self: "StaticNarrativeJobs",
+        config: dict[str, Any],
+        caches: ServiceCaches | None = None,
+    ) -> None:
+        """
+        :param config: dict - the service config. Uses "job-workers" for the number of jobs
+            to run at once (default 2), and "job-dir" for where to keep the job state
+            (default <scratch>/jobs).
+        :param caches: ServiceCaches - optional, the worker's caches, shared by the jobs
+        """
+        self.config = config
+        self.caches = caches
+        self.job_dir = config.get("job-dir") or os.path.join(config["scratch"], "jobs")
+        self._lock = threading.Lock()
+        self.logger = logging.getLogger("StaticNarrative")
+        self._owners_dir = os.path.join(self.job_dir, OWNERS_DIR)
+        # set up by _set_up_process, in each process that runs jobs
+        self._pid = None
+        self._pid_lock = threading.Lock()
+        self._pool = None
+        self._owner_id = None
+        self._owner_lock = None
+
+    @property
+    def owner_id(self: "StaticNarrativeJobs") -> str:
+        """The owner id of this process, recorded in the jobs it runs."""
+        self._set_up_process()
+        return self._owner_id
+
+    def _set_up_process(self: "StaticNarrativeJobs") -> None:
+        """
+        Makes the thread pool and locked owner file for the current process, the first
+        time it's called in that process. Anything inherited from the parent process
+        belongs to the parent.
+        """
+        with self._pid_lock:
+            if self._pid == os.getpid():
+                return
+            if self._owner_lock is not None:
+                # the parent's lock is held by the parent's copy of the file
+                self._owner_lock.close()
+            os.makedirs(self.job_dir, exist_ok=True)
+            self._remove_dead_owners()
+            self._owner_id = str(uuid.uuid4())
+            self._owner_lock = self._lock_owner_file()
+            self._pool = ThreadPoolExecutor(
+                max_workers=max(1, int(self.config.get("job-workers", 2))),
+                thread_name_prefix="StaticNarrativeJob",
+            )
+            self._pid = os.getpid()
+
+    def submit(
+        self: "StaticNarrativeJobs", params: dict[str, Any], user_id: str, token: str
+    ) -> str:
+        """
+        Queues up a job to create a Static Narrative, and returns its job id.
+        The narrative_ref gets checked here, so a malformed one raises a ValueError right
+        away instead of failing the job.
+
+        :param params: dict - the create_static_narrative params
+        :param user_id: str - the id of the user making the Static Narrative
+        :param token: str - the user's auth token. This is only kept in memory.
+        """
+        ref = NarrativeRef.parse(params["narrative_ref"])
+        self._set_up_process()
+        job = {
+            "job_id": str(uuid.uuid4()),
+            "narrative_ref": str(ref),
+            "user_id": user_id,
+            "owner": self._owner_id,
+            "state": QUEUED,
+            "stage": None,
+            "stages": [{"name": stage, "state": QUEUED} for stage in STAGES],
+            "created": _now(),
+        }
+        self._save(job)
+        create_params = {
+            "narrative_ref": str(ref),
+            "overwrite": params.get("overwrite", 0),
+            "user_id": user_id,
+            "token": token,
+        }
+        self._pool.submit(self._run, job, create_params)
+        return job["job_id"]
+
+    def get_job(
+        self: "StaticNarrativeJobs", job_id: str, user_id: str
+    ) -> dict[str, Any]:
+        """
+        Returns the state of a job. Only the user who submitted a job can see it. If the
+        process running it is gone, it gets marked as an error first.
+        Raises a ValueError if there's no job with that id, and a PermissionError if it
+        belongs to another user.
+
+        :param job_id: str - the job id, from submit
+        :param user_id: str - the id of the user asking
+        """
+        path = self._job_path(job_id)
+        if path is None or not os.path.isfile(path):
+            raise ValueError(f"No Static Narrative job found with id {job_id}")
+        with open(path) as job_file:
+            job = json.load(job_file)
+        if job["user_id"] != user_id:
+            raise PermissionError(
+                f"User {user_id} does not have access to Static Narrative job {job_id}"
+            )
+        if job["state"] in (QUEUED, RUNNING) and not self._owner_alive(
+            job.get("owner")
+        ):
+            job["error"] = (
+                "The Static Narrative job was lost, as the service worker running it "
+                "stopped before it finished"
+            )
+            self._finish(job, ERROR)
+        return job
+
+    def _run(
+        self: "StaticNarrativeJobs", job: dict[str, Any], params: dict[str, Any]
+    ) -> None:
+        job["state"] = RUNNING
+        job["started"] = _now()
+        self._save(job)
+        try:
+            output = StaticNarrativeCreator(
+                self.config, caches=self.caches
+            ).create_static_narrative(
+                params, on_stage=lambda stage: self._start_stage(job, stage)
+            )
+        except Exception as e:
+            self.logger.exception(f"Static Narrative job {job['job_id']} failed")
+            job["error"] = str(e)
+            self._finish(job, ERROR)
+        else:
+            job["static_narrative_url"] = output["static_narrative_url"]
+            self._finish(job, COMPLETED)
+
+    def _start_stage(
+        self: "StaticNarrativeJobs", job: dict[str, Any], name: str
+    ) -> None:
+        now = _now()
+        for stage in job["stages"]:
+            if stage["state"] == RUNNING:
+                stage["state"] = COMPLETED
+                stage["finished"] = now
+            if stage["name"] == name:
+                stage["state"] = RUNNING
+                stage["started"] = now
+        job["stage"] = name
+        self._save(job)
+
+    def _finish(self: "StaticNarrativeJobs", job: dict[str, Any], state: str) -> None:
+        now = _now()
+        for stage in job["stages"]:
+            if stage["state"] == RUNNING:
+                stage["state"] = COMPLETED if state == COMPLETED else ERROR
+                stage["finished"] = now
+            elif stage["state"] == QUEUED:
+                stage["state"] = SKIPPED
+        job["state"] = state
+        job["stage"] = None
+        job["finished"] = now
+        self._save(job)
+
+    def _lock_owner_file(self: "StaticNarrativeJobs") -> TextIO:
+        """
+        Makes this owner's lock file and locks it, and returns it, open. It only gets its
+        name once it's locked, so no one else can see it unlocked before then.
+        """
+        os.makedirs(self._owners_dir, exist_ok=True)
+        path = self._owner_path(self._owner_id)
+        owner_file = open(f"{path}.tmp", "w")  # noqa: SIM115
+        fcntl.flock(owner_file, fcntl.LOCK_EX)
+        os.rename(f"{path}.tmp", path)
+        return owner_file
+
+    def _owner_alive(self: "StaticNarrativeJobs", owner_id: str | None) -> bool:
+        """Returns True if the process with this owner id is still around."""
+        if self._pid == os.getpid() and owner_id == self._owner_id:
+            return True
+        path = self._owner_path(owner_id)
+        if path is None:
+            return False
+        try:
+            owner_file = open(path)  # noqa: SIM115
+        except FileNotFoundError:
+            return False
+        with owner_file:
+            try:
+                fcntl.flock(owner_file, fcntl.LOCK_SH | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return True
+            return False
+
+    def _remove_dead_owners(self: "StaticNarrativeJobs") -> None:
+        """Removes the lock files of owners that are gone."""
+        if not os.path.isdir(self._owners_dir):
+            return
+        for name in os.listdir(self._owners_dir):
+            if name.endswith(".tmp"):
+                continue
+            path = os.path.join(self._owners_dir, name)
+            try:
+                owner_file = open(path)  # noqa: SIM115
+            except FileNotFoundError:
+                continue
+            with owner_file:
+                try:
+                    fcntl.flock(owner_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue
+                os.remove(path)
+
+    def _owner_path(self: "StaticNarrativeJobs", owner_id: str | None) -> str | None:
+        try:
+            owner_id = str(uuid.UUID(str(owner_id)))
+        except ValueError:
+            return None
+        return os.path.join(self._owners_dir, f"{owner_id}.lock")
+
+    def _job_path(self: "StaticNarrativeJobs", job_id: str) -> str | None:
+        try:
+            job_id = str(uuid.UUID(str(job_id)))
+        except ValueError:
+            return None
+        return os.path.join(self.job_dir, f"{job_id}.json")
+
+    def _save(self: "StaticNarrativeJobs", job: dict[str, Any]) -> None:
+        """Writes the job state, so readers never see a half-written file."""
+        path = self._job_path(job["job_id"])
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with self._lock:
+            with open(tmp_path, "w") as job_file:
+                json.dump(job, job_file)
+            os.replace(tmp_path, path)
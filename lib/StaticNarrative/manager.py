@@ -1,35 +1,140 @@
-import os
-from collections import defaultdict
+import logging
 from typing import Any
 
+from StaticNarrative.clients import ServiceClients
+from StaticNarrative.narrative.narrative_util import get_static_info
+from StaticNarrative.registry import SORT_FIELDS, get_registry
+
+MAX_LIMIT = 1000
+
 
 class StaticNarrativeManager:
     def __init__(self: "StaticNarrativeManager", config: dict[str, Any]) -> None:
         self.config = config
 
-    def list_static_narratives(
+    def get_static_narrative_info(
         self: "StaticNarrativeManager",
-    ) -> dict[str, dict[str, str]]:
+        ws_id: int,
+        clients: ServiceClients,
+        verify: bool = False,
+    ) -> dict[str, int | str]:
         """
-        Returns a list of all available static narratives.
-        Currently, this combs the filesystem for index.html files and assembles them.
-        Later, this'll make a call to MongoDB.
+        Returns info about the static narrative for a workspace, in the same form as
+        narrative_util.get_static_info, or an empty dict if there isn't one.
+
+        This is answered from the registry, which has the same info that gets saved in the
+        workspace metadata, so it doesn't call the Workspace. The exceptions are static
+        narratives registered before the Narrative's save time was recorded, and when verify
+        is True. Those get the info from the Workspace, and if it doesn't match what's
+        registered, the registry gets updated.
+
+        :param ws_id: int - the workspace id
+        :param clients: ServiceClients - the clients for the request, only used to call the
+            Workspace if needed
+        :param verify: bool - if True, always gets the info from the Workspace
         """
-        webroot = self.config["static-file-root"]
-        if webroot is None:
+        if not ws_id or not str(ws_id).isdigit():
+            raise ValueError(f"The parameter ws_id must be an integer, not {ws_id}")
+        registry = get_registry(self.config)
+        registered = registry.get(int(ws_id))
+        if not verify and (registered is None or registered["narr_saved"] is not None):
+            return _static_info(registered)
+
+        info = get_static_info(clients.workspace, ws_id)
+        if info and _static_info(registered) != info:
+            logging.getLogger("StaticNarrative").info(
+                f"Updating the registered Static Narrative for workspace {ws_id}"
+            )
+            registry.record(
+                {
+                    "ws_id": info["ws_id"],
+                    "narrative_id": info["narrative_id"],
+                    "narrative_version": info["version"],
+                    "url": info["url"],
+                    "narr_saved": info["narr_saved"],
+                    "static_saved": info["static_saved"],
+                }
+            )
+        return info
+
+    def list_static_narratives(
+        self: "StaticNarrativeManager", params: dict[str, Any] | None = None
+    ) -> dict[str, Any]:
+        """
+        Returns a page of the available static narratives, as an AllStaticNarratives
+        structure:
+        {
+            count: the number of static narratives returned,
+            total: the number of static narratives that matched, before paging,
+            narratives: {
+                ws_id: StaticNarrativeInfo (ws_id, narrative_id, narrative_version, url,
+                    narr_saved, static_saved) of the current one for that workspace
+            },
+            order: [ws_id, ...] in sorted order
+        }
+        These are served from the registry (see StaticNarrative.registry), which is
+        updated whenever a static narrative gets made.
+
+        :param params: dict - optional ListStaticNarrativesParams: offset, limit (default
+            and maximum 1000), min_ws_id, max_ws_id, saved_after, sort_by (ws_id or
+            static_saved), and sort_desc
+        """
+        if self.config.get("static-file-root") is None:
             raise ValueError("Missing path to static narratives")
-        all_sn = defaultdict(list)
-        for root, _, files in os.walk(webroot):
-            for name in files:
-                if name != "index.html":
-                    continue
-                print(root)
-                (ws_id, ver) = root.split("/")[-2:]
-                all_sn[ws_id].append(
-                    {
-                        "ws_id": ws_id,
-                        "narrative_version": ver,
-                        "url": f"/{ws_id}/{ver}/",
-                    }
-                )
-        return dict(all_sn)
+        params = params or {}
+        offset = _int_param(params, "offset", 0)
+        limit = _int_param(params, "limit", MAX_LIMIT)
+        if limit > MAX_LIMIT:
+            raise ValueError(f"limit must be at most {MAX_LIMIT}, not {limit}")
+        sort_by = params.get("sort_by") or "ws_id"
+        if sort_by not in SORT_FIELDS:
+            raise ValueError(
+                f"sort_by must be one of {', '.join(SORT_FIELDS)}, not {sort_by}"
+            )
+        total, infos = get_registry(self.config).query(
+            offset=offset,
+            limit=limit,
+            min_ws_id=_int_param(params, "min_ws_id"),
+            max_ws_id=_int_param(params, "max_ws_id"),
+            saved_after=_int_param(params, "saved_after"),
+            sort_by=sort_by,
+            sort_desc=bool(params.get("sort_desc")),
+        )
+        return {
+            "count": len(infos),
+            "total": total,
+            "narratives": {str(info["ws_id"]): info for info in infos},
+            "order": [info["ws_id"] for info in infos],
+        }
+
+
+def _int_param(
+    params: dict[str, Any], name: str, default: int | None = None
+) -> int | None:
+    """
+    Returns the named parameter as a non-negative int, or default if it's missing or None.
+    Raises a ValueError if it's anything else.
+    """
+    value = params.get(name)
+    if value is None:
+        return default
+    if isinstance(value, bool) or not isinstance(value, int) or value < 0:
+        raise ValueError(f"{name} must be a non-negative integer, not {value}")
+    return value
+
+
+def _static_info(registered: dict[str, Any] | None) -> dict[str, int | str]:
+    """
+    Converts a StaticNarrativeInfo from the registry to the form returned by
+    narrative_util.get_static_info.
+    """
+    if registered is None:
+        return {}
+    return {
+        "ws_id": registered["ws_id"],
+        "version": registered["narrative_version"],
+        "narrative_id": registered["narrative_id"],
+        "url": registered["url"],
+        "static_saved": registered["static_saved"],
+        "narr_saved": registered["narr_saved"],
+    }
@@ -6,9 +6,11 @@ import re
 import time
 from typing import Any
 
+import nbformat
 from dateutil import parser as date_parser
 from installed_clients.baseclient import ServerError
 from installed_clients.WorkspaceClient import Workspace
+from nbformat import NotebookNode
 
 from StaticNarrative.exceptions import WorkspaceError
 from StaticNarrative.narrative_ref import NarrativeRef
@@ -45,6 +47,45 @@ def read_narrative(ref: NarrativeRef, ws_client: Workspace) -> dict[str, Any]:
         raise WorkspaceError(err, ref.wsid) from err
 
 
+def narrative_to_notebook(nar: dict[str, Any], validate: bool = False) -> NotebookNode:
+    """
+    Converts a Narrative document (as returned by read_narrative) into an nbformat v4
+    NotebookNode.
+
+    This does what nbformat.reads does, but builds the NotebookNode straight from the
+    dict instead of dumping it to a JSON string and parsing that again, so large cell
+    outputs never get copied. The given dict isn't modified.
+
+    Schema validation is slow for large Narratives, so it's only done if validate is True.
+    Like nbformat.reads, an invalid Narrative just gets logged.
+
+    Can raise:
+        nbformat.NBFormatError if the nbformat version is not supported
+        nbformat.ValidationError if the Narrative is missing keys needed for conversion
+
+    :param nar: dict - the Narrative document
+    :param validate: bool - if True, validate the notebook against the nbformat schema
+    :return: NotebookNode - the Narrative as a v4 notebook
+    """
+    (major, minor) = nbformat.reader.get_version(nar)
+    if major not in nbformat.versions:
+        raise nbformat.NBFormatError(f"Unsupported nbformat version {major}")
+    try:
+        nb = nbformat.versions[major].to_notebook_json(nar, minor=minor)
+    except AttributeError as e:
+        err = f"The notebook is invalid and is missing an expected key: {e}"
+        raise nbformat.ValidationError(err) from None
+    nb = nbformat.convert(nb, 4)
+    if validate:
+        try:
+            nbformat.validate(nb)
+        except nbformat.ValidationError as e:
+            logging.getLogger("StaticNarrative").error(
+                "Narrative JSON is invalid: %s", e
+            )
+    return nb
+
+
 def _validate_narr_type(t: str, ref: NarrativeRef) -> None:
     """
     Validates that the given string is a KBase Narrative type string. That is,
@@ -65,7 +106,7 @@ def _validate_narr_type(t: str, ref: NarrativeRef) -> None:
         raise ValueError(err)
 
 
-def save_narrative_url(ws_url: str, token: str, ref: NarrativeRef, url: str) -> None:
+def save_narrative_url(ws_client: Workspace, ref: NarrativeRef, url: str) -> int:
     """
     Updates the Narrative workspace metadata with info about the new Static Narrative.
     Creates (or updates) metadata keys:
@@ -73,25 +114,61 @@ def save_narrative_url(ws_url: str, token: str, ref: NarrativeRef, url: str) ->
     static_narrative_ver: int, the version
     static_narrative_saved: int, ms since epoch saved
     If it fails, will throw a WorkspaceError
-    :param ws_url: str - the URL for the workspace endpoint
-    :param token: str - the user's auth token
+    :param ws_client: Workspace - a Workspace client with the user's auth token
     :param ref: the NarrativeRef for the Narrative that was made static
     :param url: the url string that was saved (should really just be the path, not the full url,
         something like /123/4 instead of ci.kbase.us/n/123/4)
+    :returns: the static_narrative_saved timestamp that was saved
     """
+    static_saved = int(time.time() * 1000)
     new_meta = {
         "static_narrative": url,
         "static_narrative_ver": str(ref.ver),
-        "static_narrative_saved": str(int(time.time() * 1000)),
+        "static_narrative_saved": str(static_saved),
     }
-    ws_client = Workspace(url=ws_url, token=token)
     try:
         ws_client.alter_workspace_metadata({"wsi": {"id": ref.wsid}, "new": new_meta})
     except ServerError as err:
         raise WorkspaceError(err, ref.wsid) from err
+    return static_saved
+
+
+def get_saved_narrative_url(ws_info: list, ref: NarrativeRef, url: str) -> int | None:
+    """
+    Returns the static_narrative_saved timestamp in the Narrative workspace metadata, if
+    that metadata already has url as the Static Narrative for ref (see save_narrative_url).
+    Otherwise, returns None.
+    :param ws_info: the workspace info, as returned by Workspace.get_workspace_info
+    :param ref: the NarrativeRef for the Narrative that was made static
+    :param url: the url of the Static Narrative
+    """
+    meta = ws_info[8] or {}
+    if meta.get("static_narrative") != url or meta.get("static_narrative_ver") != str(
+        ref.ver
+    ):
+        return None
+    try:
+        return int(meta["static_narrative_saved"])
+    except (KeyError, ValueError):
+        return None
+
+
+def get_narrative_saved(ws_client: Workspace, ref: NarrativeRef) -> int:
+    """
+    Returns when the Narrative object at ref was saved, in ms since epoch.
+    If there's a problem when contacting the Workspace, this raises a WorkspaceError.
+    :param ws_client: Workspace - a Workspace client with the user's auth token
+    :param ref: the NarrativeRef of the Narrative
+    """
+    try:
+        obj_info = ws_client.get_object_info3({"objects": [{"ref": str(ref)}]})
+    except ServerError as err:
+        raise WorkspaceError(err, ref.wsid) from err
+    ts = date_parser.isoparse(obj_info["infos"][0][3]).timestamp()
+    return int(ts * 1000)
 
 
-def get_static_info(ws_url: str, token: str, ws_id: int) -> dict[str, int | str]:
+def get_static_info(ws_client: Workspace, ws_id: int) -> dict[str, int | str]:
     """
     Looks up the static narrative info for the given Workspace id.
     That info is stashed in the Workspace metadata, so that gets fetched, munged into a structure,
@@ -100,8 +177,7 @@ def get_static_info(ws_url: str, token: str, ws_id: int) -> dict[str, int | str]
     If ws_id is not present, or not numeric, raises a ValueError.
     If there's a problem when contacting the Workspace (anything that raises a ServerError),
     this raises a WorkspaceError.
-    :param ws_url: the URL for the workspace endpoint
-    :param token: the user auth token
+    :param ws_client: a Workspace client with the user auth token
     :param ws_id: the workspace id of the narrative to fetch info for.
     :returns: a dictionary with the following keys if a static narrative is present:
         ws_id - int - the workspace id
@@ -117,7 +193,6 @@ def get_static_info(ws_url: str, token: str, ws_id: int) -> dict[str, int | str]
     if not ws_id or not str(ws_id).isdigit():
         raise ValueError(f"The parameter ws_id must be an integer, not {ws_id}")
 
-    ws_client = Workspace(url=ws_url, token=token)
     try:
         ws_info = ws_client.get_workspace_info({"id": ws_id})
     except ServerError as err:
@@ -133,65 +208,68 @@ def get_static_info(ws_url: str, token: str, ws_id: int) -> dict[str, int | str]
             "url": ws_meta["static_narrative"],
             "static_saved": int(ws_meta["static_narrative_saved"]),
         }
-        try:
-            obj_info = ws_client.get_object_info3(
-                {
-                    "objects": [
-                        {"ref": f"{ws_id}/{info['narrative_id']}/{info['version']}"}
-                    ]
-                }
-            )
-        except ServerError as err:
-            raise WorkspaceError(err, ws_id) from err
-        ts = date_parser.isoparse(obj_info["infos"][0][3]).timestamp()
-        info["narr_saved"] = int(ts * 1000)
+        info["narr_saved"] = get_narrative_saved(
+            ws_client,
+            NarrativeRef(
+                {"wsid": ws_id, "objid": info["narrative_id"], "ver": info["version"]}
+            ),
+        )
     return info
 
 
-def verify_admin_privilege(
-    workspace_url: str, user_id: str, token: str, ws_id: int
-) -> None:
+def get_workspace_snapshot(ws_client: Workspace, ws_id: int) -> dict[str, Any]:
+    """
+    Fetches everything about a workspace that's needed to check permissions and list the
+    Narrative's authors, i.e. its info and its permissions, so that can all be done from
+    the one lookup.
+    Returns a dict with keys:
+        info - list - the workspace info
+        perms - dict - the permissions, user id -> permission ('a', 'w', 'r', or 'n'),
+            as seen with the client's token. Includes user '*' if the workspace is public.
+
+    Raises a WorkspaceError if anything goes wrong with the lookup.
+
+    :param ws_client: Workspace - a Workspace client with the user's auth token
+    :param ws_id: int - the workspace to look up
+    """
+    try:
+        perms = ws_client.get_permissions_mass({"workspaces": [{"id": ws_id}]})
+        ws_info = ws_client.get_workspace_info({"id": ws_id})
+    except ServerError as err:
+        raise WorkspaceError(err, ws_id) from err
+    return {"info": ws_info, "perms": perms["perms"][0]}
+
+
+def verify_admin_privilege(perms: dict[str, str], user_id: str, ws_id: int) -> None:
     """
     Raises PermissionError if the user is not an admin (has 'a' rights) on the Workspace.
     Gotta write to the Workspace metadata to create and save a Static Narrative, so this
     checks that the user has rights.
     If the user has admin rights, this returns None.
 
-    Raises a WorkspaceError if anything goes wrong with the permission lookup.
-
-    :param workspace_url: str - the workspace endpoint url
-    :param token: str - the auth token
+    :param perms: dict - the workspace permissions, as fetched with the user's auth token
+        (see get_workspace_snapshot)
     :param user_id: str - the user id to check. This is expected to be the owner of the
         provided token. Not checked, though, since that should be done by the Server module.
-    :param ws_id: int - the workspace to check
+    :param ws_id: int - the workspace that was checked
     """
-    ws_client = Workspace(url=workspace_url, token=token)
-    try:
-        perms = ws_client.get_permissions({"id": ws_id})
-    except ServerError as err:
-        raise WorkspaceError(err, ws_id) from err
     if user_id not in perms or perms[user_id] != "a":
         err = f"User {user_id} does not have admin rights on workspace {ws_id}"
         logging.getLogger("StaticNarrative").error(err)
         raise PermissionError(err)
 
 
-def verify_public_narrative(workspace_url: str, ws_id: int) -> None:
+def verify_public_narrative(perms: dict[str, str], ws_id: int) -> None:
     """
     Raises a PermissionError if the workspace is not public (i.e. user '*' has 'r' access).
     Creating a stating Narrative is only permitted on public Narratives.
     If the Narrative is public, this returns None.
 
-    Raises a WorkspaceError if anything goes wrong with the lookup.
-
-    :param workspace_url: str - the workspace endpoint url
-    :param ws_id: int - the workspace to check
+    :param perms: dict - the workspace permissions (see get_workspace_snapshot). Those
+        include the anonymous user '*' whatever token they were fetched with, so this
+        doesn't need a separate lookup without a token.
+    :param ws_id: int - the workspace that was checked
     """
-    ws_client = Workspace(url=workspace_url)
-    try:
-        perms = ws_client.get_permissions({"id": ws_id})
-    except ServerError as err:
-        raise WorkspaceError(err, ws_id) from err
     if perms.get("*", "n") not in ["r", "w", "a"]:
         err = f"Workspace {ws_id} must be publicly readable to make a Static Narrative"
         logging.getLogger("StaticNarrative").error(err)
@@ -0,0 +1,317 @@
+"""
+A registry of every published Static Narrative, kept in a SQLite database next to the
+static file root, so they can be listed without walking the whole webroot.
+
+The registry gets updated whenever a Static Narrative is published, and each published
+Static Narrative also keeps its own info in an info.json file. The database gets set up
+once, when the service starts (see init_registry), by running this module:
+
+    python -m StaticNarrative.registry init
+
+with KB_DEPLOYMENT_CONFIG set to the service config file. The registry can also be rebuilt
+from the info.json files (see rebuild) at any time, with:
+
+    python -m StaticNarrative.registry rebuild
+"""
+import json
+import os
+import sqlite3
+import sys
+import threading
+from collections.abc import Iterator
+from configparser import ConfigParser
+from contextlib import closing, contextmanager
+from typing import Any
+
+from StaticNarrative.fingerprint import FINGERPRINT_FILE
+
+REGISTRY_FILE = "static_narratives.db"
+INFO_FILE = "info.json"
+INFO_FIELDS = [
+    "ws_id",
+    "narrative_id",
+    "narrative_version",
+    "url",
+    "narr_saved",
+    "static_saved",
+]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS static_narratives (
+    ws_id INTEGER PRIMARY KEY,
+    narrative_id INTEGER,
+    narrative_version INTEGER NOT NULL,
+    url TEXT NOT NULL,
+    narr_saved INTEGER,
+    static_saved INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS static_narratives_static_saved
+    ON static_narratives (static_saved, ws_id);
+"""
+SORT_FIELDS = ["ws_id", "static_saved"]
+
+
+class StaticNarrativeRegistry:
+    """
+    Holds the StaticNarrativeInfo of the current Static Narrative for each workspace, i.e.
+    the last one published, same as what's in the workspace metadata.
+    """
+
+    def __init__(self: "StaticNarrativeRegistry", db_path: str) -> None:
+        """
+        :param db_path: str - the path to the SQLite database file. It has to be set up
+            with initialize before it gets used.
+        """
+        self.db_path = db_path
+
+    def initialize(self: "StaticNarrativeRegistry", webroot: str | None = None) -> bool:
+        """
+        Sets up the database, making it if it doesn't exist. If it didn't have the registry
+        in it yet and webroot is given, it gets built from the Static Narratives under
+        webroot. Returns True if it was new.
+
+        :param webroot: str - the static file root
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+        with closing(sqlite3.connect(self.db_path, timeout=30)) as conn:
+            # WAL lets the workers read while another one's writing. It's kept in the file.
+            conn.execute("PRAGMA journal_mode=WAL")
+            with conn:
+                is_new = (
+                    conn.execute(
+                        "SELECT 1 FROM sqlite_master WHERE name = 'static_narratives'"
+                    ).fetchone()
+                    is None
+                )
+                conn.executescript(_SCHEMA)
+        if is_new and webroot is not None and os.path.isdir(webroot):
+            self.rebuild(webroot)
+        return is_new
+
+    @contextmanager
+    def _connect(self: "StaticNarrativeRegistry") -> Iterator[sqlite3.Connection]:
+        """Yields a connection in a transaction that's committed when it's done."""
+        with closing(sqlite3.connect(self.db_path, timeout=30)) as conn:
+            conn.row_factory = sqlite3.Row
+            with conn:
+                yield conn
+
+    def record(self: "StaticNarrativeRegistry", info: dict[str, Any]) -> None:
+        """
+        Records a newly published Static Narrative, replacing any other for the same
+        workspace.
+
+        :param info: dict - the StaticNarrativeInfo (see INFO_FIELDS)
+        """
+        with self._connect() as conn:
+            _insert(conn, [info])
+
+    def get(self: "StaticNarrativeRegistry", ws_id: int) -> dict[str, Any] | None:
+        """
+        Returns the StaticNarrativeInfo of the current Static Narrative for a workspace, or
+        None if it doesn't have one.
+        """
+        with self._connect() as conn:
+            row = conn.execute(
+                f"SELECT {', '.join(INFO_FIELDS)} FROM static_narratives "  # noqa: S608
+                "WHERE ws_id = ?",
+                (ws_id,),
+            ).fetchone()
+        return dict(row) if row is not None else None
+
+    def list_all(self: "StaticNarrativeRegistry") -> list[dict[str, Any]]:
+        """Returns the StaticNarrativeInfo of every Static Narrative, by workspace id."""
+        return self.query()[1]
+
+    def query(
+        self: "StaticNarrativeRegistry",
+        offset: int = 0,
+        limit: int | None = None,
+        min_ws_id: int | None = None,
+        max_ws_id: int | None = None,
+        saved_after: int | None = None,
+        sort_by: str = "ws_id",
+        sort_desc: bool = False,
+    ) -> tuple[int, list[dict[str, Any]]]:
+        """
+        Returns one page of Static Narratives, as a tuple of the total number that matched
+        the filters, and the StaticNarrativeInfo of the ones on the page.
+
+        :param offset: int - the number of matching Static Narratives to skip
+        :param limit: int - the most to return (if None, returns the rest)
+        :param min_ws_id: int - only include ones with at least this workspace id
+        :param max_ws_id: int - only include ones with at most this workspace id
+        :param saved_after: int - only include ones saved after this (ms since epoch)
+        :param sort_by: str - the field to sort by, one of SORT_FIELDS
+        :param sort_desc: bool - if True, sort in descending order
+        """
+        if sort_by not in SORT_FIELDS:
+            raise ValueError(f"Can't sort Static Narratives by {sort_by}")
+        conditions = []
+        args = {}
+        if min_ws_id is not None:
+            conditions.append("ws_id >= :min_ws_id")
+            args["min_ws_id"] = min_ws_id
+        if max_ws_id is not None:
+            conditions.append("ws_id <= :max_ws_id")
+            args["max_ws_id"] = max_ws_id
+        if saved_after is not None:
+            conditions.append("static_saved > :saved_after")
+            args["saved_after"] = saved_after
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        direction = "DESC" if sort_desc else "ASC"
+        # ws_id breaks ties, so pages don't overlap
+        order = f"{sort_by} {direction}, ws_id {direction}"
+        args["limit"] = -1 if limit is None else limit
+        args["offset"] = offset
+        with self._connect() as conn:
+            total = conn.execute(
+                f"SELECT COUNT(*) FROM static_narratives {where}", args  # noqa: S608
+            ).fetchone()[0]
+            rows = conn.execute(
+                f"SELECT {', '.join(INFO_FIELDS)} FROM static_narratives {where} "  # noqa: S608
+                f"ORDER BY {order} LIMIT :limit OFFSET :offset",
+                args,
+            ).fetchall()
+        return total, [dict(row) for row in rows]
+
+    def rebuild(self: "StaticNarrativeRegistry", webroot: str) -> int:
+        """
+        Replaces everything in the registry with the Static Narratives found under webroot,
+        using the latest one for each workspace. Returns the number of workspaces found.
+
+        :param webroot: str - the static file root
+        """
+        latest = {}
+        for info in find_static_narratives(webroot):
+            current = latest.get(info["ws_id"])
+            if current is None or info["static_saved"] > current["static_saved"]:
+                latest[info["ws_id"]] = info
+        with self._connect() as conn:
+            conn.execute("DELETE FROM static_narratives")
+            _insert(conn, latest.values())
+        return len(latest)
+
+
+def _insert(conn: sqlite3.Connection, infos: Iterator[dict[str, Any]]) -> None:
+    conn.executemany(
+        f"INSERT OR REPLACE INTO static_narratives ({', '.join(INFO_FIELDS)}) "  # noqa: S608
+        f"VALUES ({', '.join(':' + field for field in INFO_FIELDS)})",
+        [{field: info.get(field) for field in INFO_FIELDS} for info in infos],
+    )
+
+
+def write_static_info(path: str, info: dict[str, Any]) -> None:
+    """
+    Stores the StaticNarrativeInfo of a published Static Narrative in its directory.
+
+    :param path: str - the directory of the published Static Narrative
+    :param info: dict - the StaticNarrativeInfo (see INFO_FIELDS)
+    """
+    # it goes next to a published Static Narrative, so it gets swapped in whole
+    tmp_path = os.path.join(path, f".{INFO_FILE}.{os.getpid()}.{threading.get_ident()}")
+    with open(tmp_path, "w") as f:
+        json.dump({field: info.get(field) for field in INFO_FIELDS}, f)
+    os.replace(tmp_path, os.path.join(path, INFO_FILE))
+
+
+def read_static_info(path: str) -> dict[str, Any] | None:
+    """
+    Returns the StaticNarrativeInfo stored in a published Static Narrative's directory.
+    Static Narratives published before info.json was added don't have one, so their info is
+    worked out from the directory itself: the narrative id comes from its fingerprint, if
+    it has one, the static save time from index.html, and the Narrative's save time is
+    unknown.
+    Returns None if there's no Static Narrative in the directory.
+
+    :param path: str - a directory under the static file root, like <root>/<ws_id>/<ver>
+    """
+    index_path = os.path.join(path, "index.html")
+    if not os.path.isfile(index_path):
+        return None
+    try:
+        with open(os.path.join(path, INFO_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        pass
+    ws_id, ver = os.path.normpath(path).split(os.sep)[-2:]
+    if not ws_id.isdigit() or not ver.isdigit():
+        return None
+    narrative_id = None
+    try:
+        with open(os.path.join(path, FINGERPRINT_FILE)) as f:
+            narrative_id = int(json.load(f)["ref"].split("/")[1])
+    except (OSError, ValueError, KeyError, IndexError):
+        pass
+    return {
+        "ws_id": int(ws_id),
+        "narrative_id": narrative_id,
+        "narrative_version": int(ver),
+        "url": f"/{ws_id}/{ver}/",
+        "narr_saved": None,
+        "static_saved": int(os.path.getmtime(index_path) * 1000),
+    }
+
+
+def find_static_narratives(webroot: str) -> Iterator[dict[str, Any]]:
+    """
+    Yields the StaticNarrativeInfo of every Static Narrative under webroot, which are
+    stored as <webroot>/<ws_id>/<version>/index.html. <version> is usually a symlink to
+    the hidden directory the current copy was published in (see uploader).
+
+    :param webroot: str - the static file root
+    """
+    with os.scandir(webroot) as ws_dirs:
+        for ws_dir in ws_dirs:
+            if not ws_dir.is_dir() or not ws_dir.name.isdigit():
+                continue
+            with os.scandir(ws_dir.path) as ver_dirs:
+                for ver_dir in ver_dirs:
+                    if ver_dir.name.isdigit() and ver_dir.is_dir():
+                        info = read_static_info(ver_dir.path)
+                        if info is not None:
+                            yield info
+
+
+def get_registry(config: dict[str, Any]) -> StaticNarrativeRegistry:
+    """
+    Returns the registry, kept in the file set by the "registry-db" config value (default
+    static_narratives.db next to the static-file-root directory). It has to have been set
+    up by init_registry.
+
+    :param config: dict - the service config
+    """
+    db_path = config.get("registry-db") or os.path.join(
+        os.path.dirname(os.path.normpath(config["static-file-root"])), REGISTRY_FILE
+    )
+    return StaticNarrativeRegistry(db_path)
+
+
+def init_registry(config: dict[str, Any]) -> StaticNarrativeRegistry:
+    """
+    Sets up the registry (see get_registry) when the service starts, and returns it. If
+    it's new, it gets built from the Static Narratives already in the static file root.
+
+    :param config: dict - the service config
+    """
+    registry = get_registry(config)
+    registry.initialize(config["static-file-root"])
+    return registry
+
+
+def main(argv: list[str]) -> int:
+    if argv not in (["init"], ["rebuild"]):
+        sys.stderr.write("Usage: python -m StaticNarrative.registry init|rebuild\n")
+        return 2
+    parser = ConfigParser()
+    parser.read(os.environ["KB_DEPLOYMENT_CONFIG"])
+    config = dict(parser.items("StaticNarrative"))
+    registry = init_registry(config)
+    if argv == ["rebuild"]:
+        count = registry.rebuild(config["static-file-root"])
+        sys.stdout.write(f"Registered Static Narratives for {count} workspaces\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,160 @@
+"""
+Makes sure only one of a kind of task runs at a time, and that anyone else who asks for it
+while it's running gets the same result.
+
+SingleFlight handles that between threads in one process, and passes on the progress of the
+running task to every thread waiting on it. file_lock handles it between processes (e.g.
+uwsgi workers), which can't share results directly - a process that had to wait for the
+lock should check for the result that the other one left behind.
+"""
+import fcntl
+import os
+import threading
+import time
+from collections.abc import Callable, Iterator
+from concurrent.futures import Future
+from contextlib import contextmanager
+from typing import Any, TextIO
+
+# How often to check whether a lock file is free, in seconds.
+LOCK_POLL_INTERVAL = 0.1
+
+
+class LockTimeoutError(TimeoutError):
+    """Raised when file_lock gives up waiting for a lock."""
+
+
+class _Call:
+    def __init__(self: "_Call") -> None:
+        self.future = Future()
+        self.progress = []
+        self.listeners = []
+
+
+class SingleFlight:
+    def __init__(self: "SingleFlight") -> None:
+        self._lock = threading.Lock()
+        self._calls: dict[str, _Call] = {}
+
+    def do(
+        self: "SingleFlight",
+        key: str,
+        fn: Callable[[], Any],
+        on_progress: Callable[[Any], None] | None = None,
+    ) -> tuple[Any, bool]:
+        """
+        Runs fn, unless it's already running for the same key in another thread. In that
+        case, this waits for that one to finish and returns (or raises) what it did.
+
+        Returns a tuple of fn's result, and whether it was shared from another thread.
+
+        :param key: str - identifies the task
+        :param fn: Callable - runs the task
+        :param on_progress: Callable - if given, gets called with everything the running
+            task passes to report, whether it's this one or another thread's. Anything
+            reported before this call joined gets passed on first.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+            if on_progress is not None:
+                progress = list(call.progress)
+                call.listeners.append(on_progress)
+        if on_progress is not None:
+            for value in progress:
+                on_progress(value)
+        if not leader:
+            return call.future.result(), True
+
+        try:
+            call.future.set_result(fn())
+        except BaseException as e:
+            call.future.set_exception(e)
+        finally:
+            with self._lock:
+                del self._calls[key]
+        return call.future.result(), False
+
+    def report(self: "SingleFlight", key: str, value: Any) -> None:
+        """
+        Passes on progress of the task running for key to everyone waiting on it (see do).
+        Should only be called by that task.
+
+        :param key: str - identifies the task
+        :param value: Any - the progress to pass on
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                return
+            call.progress.append(value)
+            listeners = list(call.listeners)
+        for listener in listeners:
+            listener(value)
+
+
+@contextmanager
+def file_lock(path: str, timeout: float | None = None) -> Iterator[bool]:
+    """
+    Holds an exclusive lock on the file at path (made if it doesn't exist). Yields True if
+    it had to wait for another process to let go of the lock, or False if it got it right
+    away. The file gets removed again before the lock is let go.
+
+    Raises a LockTimeoutError if the lock isn't free within timeout seconds.
+
+    :param path: str - the path to the lock file
+    :param timeout: float - the most seconds to wait for the lock, or None to wait as long
+        as it takes
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    deadline = None if timeout is None else time.monotonic() + timeout
+    waited = False
+    while True:
+        lock_file = open(path, "a")  # noqa: SIM115
+        try:
+            waited = not _flock(lock_file, deadline, path) or waited
+            # the last holder may have removed the file after this opened it
+            try:
+                current = os.path.samestat(os.fstat(lock_file.fileno()), os.stat(path))
+            except FileNotFoundError:
+                current = False
+        except BaseException:
+            lock_file.close()
+            raise
+        if current:
+            break
+        lock_file.close()
+        waited = True
+    try:
+        yield waited
+    finally:
+        os.remove(path)
+        lock_file.close()
+
+
+def _flock(lock_file: TextIO, deadline: float | None, path: str) -> bool:
+    """
+    Locks lock_file, waiting until deadline (a time.monotonic time) at most. Returns True
+    if it got the lock right away.
+    """
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except BlockingIOError:
+        if deadline is None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            return False
+    while True:
+        if time.monotonic() >= deadline:
+            raise LockTimeoutError(
+                f"Timed out waiting for another process to let go of the lock at {path}"
+            )
+        time.sleep(LOCK_POLL_INTERVAL)
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return False
+        except BlockingIOError:
+            pass
@@ -0,0 +1,88 @@
+"""
+A small thread-safe in-memory cache, with a maximum size and a time to live for each entry.
+"""
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Hashable
+from typing import Any
+
+_MISSING = object()
+
+
+class TTLCache:
+    """
+    Keeps up to max_size entries, each for up to ttl seconds after it was put in. When it's
+    full, putting in a new entry evicts the least recently used one. Getting, putting, and
+    evicting entries all take constant time.
+
+    Every get counts as a hit or a miss (an expired entry is a miss), see stats.
+    """
+
+    def __init__(self: "TTLCache", max_size: int, ttl: float) -> None:
+        """
+        :param max_size: int - the most entries to keep (if < 1, nothing gets kept)
+        :param ttl: float - how long to keep each entry, in seconds (if <= 0, nothing gets
+            kept)
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # key -> (expiry time, value), least recently used first
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self: "TTLCache", key: Hashable, default: Any = None) -> Any:
+        """Returns the value for key, or default if it's not there or has expired."""
+        with self._lock:
+            entry = self._entries.get(key, _MISSING)
+            if entry is not _MISSING:
+                if entry[0] > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                del self._entries[key]
+            self.misses += 1
+            return default
+
+    def put(self: "TTLCache", key: Hashable, value: Any) -> None:
+        """Stores value under key, evicting the least recently used entry if it's full."""
+        if self.max_size < 1 or self.ttl <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def discard(self: "TTLCache", key: Hashable) -> None:
+        """Removes key from the cache, if it's there."""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self: "TTLCache") -> None:
+        """Removes everything from the cache. The stats are kept."""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self: "TTLCache") -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def stats(self: "TTLCache") -> dict[str, int | float]:
+        """
+        Returns the number of hits, misses, and evictions so far, the hit rate (0 if
+        nothing's been looked up yet), and the current number of entries.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0,
+                "size": len(self._entries),
+            }
@@ -0,0 +1,153 @@
+"""
+Writes pre-compressed copies of a published Static Narrative's files, so the static file
+server can send them as they are (e.g. with nginx's gzip_static and brotli_static) instead
+of compressing the same pages on every request.
+
+Each file gets a gzip sibling (index.html -> index.html.gz) and, if the brotli package is
+installed, a brotli one (index.html.br), both at the highest compression level. That's slow
+for large pages, so it's done on a background thread after publishing (see
+get_compressor). Until a file's siblings are written, the server just sends the file
+itself.
+"""
+import gzip
+import logging
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+DEFAULT_WORKERS = 1
+# Only text files are worth compressing, and tiny ones aren't worth a second file.
+COMPRESSIBLE_EXTENSIONS = (".html", ".json", ".css", ".js", ".svg")
+MIN_SIZE = 1024
+GZIP_SUFFIX = ".gz"
+BROTLI_SUFFIX = ".br"
+COMPRESSED_SUFFIXES = (GZIP_SUFFIX, BROTLI_SUFFIX)
+
+_compressor = None
+_compressor_lock = threading.Lock()
+
+
+def compress_static_files(path: str) -> list[str]:
+    """
+    Writes the compressed siblings of every compressible file under path, and returns the
+    paths of the ones that were written. Siblings that are already up to date (they have
+    the same modification time as their file) are skipped.
+
+    Each sibling gets written to a temporary file first, then renamed into place, so a
+    reader never gets part of one. If its file gets replaced while it's being compressed,
+    the sibling is thrown away, as it'd be out of date.
+
+    :param path: str - the directory of a published Static Narrative
+    """
+    written = []
+    for root, _, files in os.walk(path):
+        for file_name in files:
+            if not file_name.endswith(COMPRESSIBLE_EXTENSIONS):
+                continue
+            file_path = os.path.join(root, file_name)
+            for suffix, compress in _compressors():
+                if _compress_file(file_path, file_path + suffix, compress):
+                    written.append(file_path + suffix)
+    return written
+
+
+def _compressors() -> list[tuple[str, Any]]:
+    compressors = [(GZIP_SUFFIX, lambda data: gzip.compress(data, 9, mtime=0))]
+    if brotli is not None:
+        compressors.append(
+            (BROTLI_SUFFIX, lambda data: brotli.compress(data, quality=11))
+        )
+    return compressors
+
+
+def _compress_file(file_path: str, out_path: str, compress: Any) -> bool:
+    try:
+        with open(file_path, "rb") as f:
+            stat = os.fstat(f.fileno())
+            if stat.st_size < MIN_SIZE or _mtime_ns(out_path) == stat.st_mtime_ns:
+                return False
+            data = compress(f.read())
+    except FileNotFoundError:
+        return False
+    tmp_path = f"{out_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    # match the file's time, so it's easy to tell if the sibling's up to date
+    os.utime(tmp_path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    try:
+        if os.stat(file_path).st_ino == stat.st_ino:
+            os.replace(tmp_path, out_path)
+            return True
+    except FileNotFoundError:
+        pass
+    os.remove(tmp_path)
+    return False
+
+
+def _mtime_ns(path: str) -> int | None:
+    try:
+        return os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+class StaticFileCompressor:
+    """
+    Compresses published Static Narratives in the background, one at a time, in the order
+    they were published.
+    """
+
+    def __init__(self: "StaticFileCompressor", workers: int) -> None:
+        """
+        :param workers: int - the number of threads to compress with (if < 1, nothing
+            gets compressed)
+        """
+        self._pool = None
+        if workers > 0:
+            self._pool = ThreadPoolExecutor(
+                max_workers=workers, thread_name_prefix="StaticFileCompressor"
+            )
+
+    def compress_later(self: "StaticFileCompressor", path: str) -> Future | None:
+        """
+        Queues up compressing the files of a published Static Narrative (see
+        compress_static_files). Any errors get logged. Returns the Future for the job, or
+        None if compression is turned off.
+
+        :param path: str - the directory of a published Static Narrative
+        """
+        if self._pool is None:
+            return None
+        return self._pool.submit(self._compress, path)
+
+    def _compress(self: "StaticFileCompressor", path: str) -> list[str]:
+        try:
+            return compress_static_files(path)
+        except Exception as e:
+            logging.getLogger("StaticNarrative").warning(
+                f"Unable to compress the Static Narrative at {path}: {e}"
+            )
+            return []
+
+
+def get_compressor(config: dict[str, Any]) -> StaticFileCompressor:
+    """
+    Returns the worker's StaticFileCompressor, making it on first use. The number of
+    threads it uses comes from the "compression-workers" config value (default 1). Setting
+    it to 0 turns off pre-compression.
+
+    :param config: dict - the service config
+    """
+    global _compressor
+    with _compressor_lock:
+        if _compressor is None:
+            _compressor = StaticFileCompressor(
+                int(config.get("compression-workers", DEFAULT_WORKERS))
+            )
+        return _compressor
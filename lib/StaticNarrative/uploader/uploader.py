@@ -1,43 +1,205 @@
 import os
 import shutil
+import tempfile
+import uuid
 
+from StaticNarrative.fingerprint import read_fingerprint, write_fingerprint
 from StaticNarrative.narrative_ref import NarrativeRef
+from StaticNarrative.registry import (
+    INFO_FILE,
+    StaticNarrativeRegistry,
+    read_static_info,
+    write_static_info,
+)
+
+# Static Narratives get exported into directories in here, then moved into place. By
+# default, it's next to the static file root, so it's not served.
+STAGING_DIR = "static_narrative_staging"
+
+
+def make_staging_dir(
+    ref: NarrativeRef, upload_endpt: str, staging_root: str | None = None
+) -> str:
+    """
+    Makes a new, empty directory to export a static Narrative into, and returns its path.
+    It should be on the same filesystem as upload_endpt, so upload_static_narrative can
+    move it into place instead of copying it.
+
+    :param ref: NarrativeRef, the ref of the Narrative being exported
+    :param upload_endpt: str, the path where static Narratives get uploaded
+    :param staging_root: str, the directory to make it in (the "staging-dir" config
+        value). Defaults to STAGING_DIR next to upload_endpt.
+    """
+    staging_root = staging_root or os.path.join(
+        os.path.dirname(os.path.normpath(upload_endpt)), STAGING_DIR
+    )
+    os.makedirs(staging_root, exist_ok=True)
+    staging_dir = tempfile.mkdtemp(
+        prefix=f"{ref.wsid}.{ref.objid}.{ref.ver}.", dir=staging_root
+    )
+    # mkdtemp makes it private, but it gets served once it's published
+    os.chmod(staging_dir, 0o755)  # noqa: S103
+    return staging_dir
 
 
 def upload_static_narrative(
-    ref: NarrativeRef, narr_path: str, upload_endpt: str, url_prefix: str | None = None
+    ref: NarrativeRef,
+    narr_path: str,
+    upload_endpt: str,
+    url_prefix: str | None = None,
+    fingerprint: str | None = None,
 ) -> str:
     """
-    Uploads a finished static Narrative to the display endpoint.
+    Publishes a finished static Narrative to the display endpoint.
+
+    The static Narrative gets exported into a staging directory (see make_staging_dir),
+    which gets moved into upload_endpt/wsid as a new, hidden, versioned directory. Then
+    upload_endpt/wsid/ver gets swapped over to it in one step, by renaming a symlink to
+    it over the old one, so readers see either the whole old static Narrative or the
+    whole new one. The old versioned directory gets removed afterward, and so does the
+    staging directory.
     Can raise:
         IOError if the path doesn't exist
 
-    :param narr_id: int, the narrative id (will create url http://endpt/narr_id if it doesn't exist)
-    :param narr_ver: int, the narrative version
-    :param narr_path: str, the path to the generated static narrative html file
-    :param upload_endpt: str, the URL where the file should be uploaded
-        (could also be mounted path, we'll see?)
+    :param ref: NarrativeRef, the ref of the Narrative (published at
+        upload_endpt/wsid/ver)
+    :param narr_path: str, the path to the generated static narrative html file, in the
+        staging directory along with everything else that gets published with it
+    :param upload_endpt: str, the path where static Narratives get uploaded. If it's not
+        on the same filesystem as the staging directory, that gets copied in instead.
+    :param fingerprint: str, if given, the fingerprint of the static Narrative to store
+        alongside it (see StaticNarrative.fingerprint)
     :returns: The URL to the uploaded public, static, Narrative
     """
-    # validate file is present
-    # upload the file
-    # return None
     if not os.path.exists(narr_path):
         raise IOError(f"Static Narrative doesn't seem to exist at path {narr_path}")
 
-    # Let's assume we get an endpoint to copy to, so upload_endpt is a path
-    # we need to:
-    # 1. Make a directory there if it doesn't exist (/narr_id)
-    # 2. Copy the file to /narr_id/index.html
-    # 3. return the url
-    static_narr_path = os.path.join(upload_endpt, str(ref.wsid), str(ref.ver))
-    if not os.path.exists(static_narr_path):
-        os.makedirs(static_narr_path)
-    narr_dir = os.path.dirname(narr_path)
-    shutil.copyfile(narr_path, os.path.join(static_narr_path, "index.html"))
-    shutil.copyfile(
-        os.path.join(narr_dir, "data.json"), os.path.join(static_narr_path, "data.json")
-    )
+    staging_dir = os.path.dirname(narr_path)
+    static_narr_path = static_narrative_path(ref, upload_endpt)
+    try:
+        os.rename(narr_path, os.path.join(staging_dir, "index.html"))
+        if fingerprint is not None:
+            write_fingerprint(staging_dir, ref, fingerprint)
+        # the info gets replaced when it's registered, but keep it until then
+        old_info = os.path.join(static_narr_path, INFO_FILE)
+        if os.path.isfile(old_info):
+            shutil.copy2(old_info, os.path.join(staging_dir, INFO_FILE))
+        os.makedirs(os.path.dirname(static_narr_path), exist_ok=True)
+        version_dir = _version_dir(ref, upload_endpt)
+        # a rename, unless they're on different filesystems
+        shutil.move(staging_dir, version_dir)
+        try:
+            old_version_dir = _swap_link(static_narr_path, version_dir)
+        except BaseException:
+            shutil.rmtree(version_dir, ignore_errors=True)
+            raise
+        if old_version_dir is not None:
+            shutil.rmtree(old_version_dir, ignore_errors=True)
+    finally:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+
+    return _static_narrative_url(ref, url_prefix)
+
+
+def _version_dir(ref: NarrativeRef, upload_endpt: str) -> str:
+    """Returns a new path for a version of a published static Narrative to go."""
+    return os.path.join(upload_endpt, str(ref.wsid), f".{ref.ver}.{uuid.uuid4().hex}")
+
+
+def _swap_link(static_narr_path: str, version_dir: str) -> str | None:
+    """
+    Points static_narr_path at version_dir, by renaming a new symlink over it. Returns the
+    directory it used to point to, if any, which can be removed once nothing's using it.
+
+    Static Narratives published before they were versioned are directories themselves.
+    Those get renamed to a versioned directory first, so they're briefly not there.
+    """
+    parent = os.path.dirname(static_narr_path)
+    old_version_dir = None
+    unversioned = False
+    if os.path.islink(static_narr_path):
+        old_version_dir = os.path.join(parent, os.readlink(static_narr_path))
+    elif os.path.isdir(static_narr_path):
+        old_version_dir = f"{version_dir}.old"
+        os.rename(static_narr_path, old_version_dir)
+        unversioned = True
+    tmp_link = f"{version_dir}.link"
+    try:
+        os.symlink(os.path.basename(version_dir), tmp_link)
+        os.replace(tmp_link, static_narr_path)
+    except OSError:
+        if os.path.lexists(tmp_link):
+            os.remove(tmp_link)
+        if unversioned:
+            os.rename(old_version_dir, static_narr_path)
+        raise
+    return old_version_dir
+
+
+def find_static_narrative(
+    ref: NarrativeRef,
+    upload_endpt: str,
+    fingerprint: str,
+    url_prefix: str | None = None,
+) -> str | None:
+    """
+    Looks for a static Narrative that was already uploaded with the same fingerprint.
+    Returns its URL if there is one, or None if it needs to be made (again).
+
+    :param ref: NarrativeRef, the ref of the Narrative
+    :param upload_endpt: str, the path where static Narratives get uploaded
+    :param fingerprint: str, the fingerprint of the static Narrative that would be made
+    :returns: The URL to the uploaded static Narrative, or None
+    """
+    static_narr_path = static_narrative_path(ref, upload_endpt)
+    if read_fingerprint(static_narr_path) != fingerprint:
+        return None
+    for file_name in ["index.html", "data.json"]:
+        if not os.path.isfile(os.path.join(static_narr_path, file_name)):
+            return None
+    return _static_narrative_url(ref, url_prefix)
+
+
+def register_static_narrative(
+    ref: NarrativeRef,
+    upload_endpt: str,
+    registry: StaticNarrativeRegistry,
+    static_saved: int,
+    narr_saved: int | None = None,
+    url_prefix: str | None = None,
+) -> dict[str, int | str | None]:
+    """
+    Records an uploaded static Narrative in the registry, and stores its info alongside it
+    so the registry can be rebuilt. Returns that info.
+
+    :param ref: NarrativeRef, the ref of the Narrative
+    :param upload_endpt: str, the path where static Narratives get uploaded
+    :param registry: StaticNarrativeRegistry, the registry to record it in
+    :param static_saved: int, when the static Narrative was saved (ms since epoch)
+    :param narr_saved: int, when the Narrative was saved (ms since epoch). If not given,
+        the one already stored with the static Narrative is kept.
+    """
+    static_narr_path = static_narrative_path(ref, upload_endpt)
+    if narr_saved is None:
+        narr_saved = (read_static_info(static_narr_path) or {}).get("narr_saved")
+    info = {
+        "ws_id": ref.wsid,
+        "narrative_id": ref.objid,
+        "narrative_version": ref.ver,
+        "url": _static_narrative_url(ref, url_prefix),
+        "narr_saved": narr_saved,
+        "static_saved": static_saved,
+    }
+    write_static_info(static_narr_path, info)
+    registry.record(info)
+    return info
+
+
+def static_narrative_path(ref: NarrativeRef, upload_endpt: str) -> str:
+    """Returns the directory that a static Narrative gets published to."""
+    return os.path.join(upload_endpt, str(ref.wsid), str(ref.ver))
+
 
+def _static_narrative_url(ref: NarrativeRef, url_prefix: str | None) -> str:
     static_url = url_prefix or ""
     return f"{static_url}/{ref.wsid}/{ref.ver}/"
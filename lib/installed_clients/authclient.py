@@ -10,6 +10,8 @@ import requests as _requests
 import threading as _threading
 import hashlib
 
+from installed_clients.baseclient import get_session as _get_session
+
 
 class TokenCache(object):
     ''' A basic cache for tokens. '''
@@ -63,14 +65,25 @@ class KBaseAuth(object):
     _LOGIN_URL = 'https://kbase.us/services/auth/api/legacy/KBase/Sessions/Login'
     ENDPT_USER_DISPLAY = "/api/V2/users/?list="
 
-    def __init__(self, auth_url=None):
+    def __init__(self, auth_url=None, token_cache=None, display_name_cache=None):
         '''
         Constructor
+
+        token_cache - a cache for the users of valid tokens, with the same get_user and
+            add_valid_token methods as TokenCache (default is a new TokenCache).
+        display_name_cache - a cache for user display names, shared between tokens,
+            with get(user_id) and put(user_id, display_name) methods. If not given,
+            display names aren't cached.
         '''
         self._authurl = auth_url
         if not self._authurl:
             self._authurl = self._LOGIN_URL
-        self._cache = TokenCache()
+        self._cache = token_cache if token_cache is not None else TokenCache()
+        self._display_name_cache = display_name_cache
+
+    @property
+    def token_cache(self):
+        return self._cache
 
     def get_user(self, token):
         if not token:
@@ -80,7 +93,7 @@ class KBaseAuth(object):
             return user
 
         d = {'token': token, 'fields': 'user_id'}
-        ret = _requests.post(self._authurl, data=d)
+        ret = _get_session().post(self._authurl, data=d)
         if not ret.ok:
             try:
                 err = ret.json()
@@ -95,9 +108,28 @@ class KBaseAuth(object):
         return user
 
     def get_display_names(self, auth_token: str, user_ids: list) -> dict:
+        if self._display_name_cache is None:
+            return self._fetch_display_names(auth_token, user_ids)
+        names = {}
+        missing = []
+        for user_id in user_ids:
+            name = self._display_name_cache.get(user_id)
+            if name is None:
+                missing.append(user_id)
+            else:
+                names[user_id] = name
+        if missing:
+            fetched = self._fetch_display_names(auth_token, missing)
+            for user_id, name in fetched.items():
+                self._display_name_cache.put(user_id, name)
+            names.update(fetched)
+        return names
+
+    def _fetch_display_names(self, auth_token: str, user_ids: list) -> dict:
         headers = {"Authorization": auth_token}
-        r = _requests.get(self._authurl + self.ENDPT_USER_DISPLAY + ",".join(user_ids),
-                          headers=headers)
+        r = _get_session().get(
+            self._authurl + self.ENDPT_USER_DISPLAY + ",".join(user_ids),
+            headers=headers)
         if r.status_code != _requests.codes.ok:
             r.raise_for_status()
         return r.json()
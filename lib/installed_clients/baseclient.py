@@ -7,11 +7,14 @@
 
 from __future__ import print_function
 
+import http.cookiejar as _cookiejar
 import json as _json
 import requests as _requests
 import random as _random
 import os as _os
+import threading as _threading
 import traceback as _traceback
+from requests.adapters import HTTPAdapter as _HTTPAdapter
 from requests.exceptions import ConnectionError
 from urllib3.exceptions import ProtocolError
 
@@ -31,6 +34,63 @@ _AJ = 'application/json'
 _URL_SCHEME = frozenset(['http', 'https'])
 _CHECK_JOB_RETRYS = 3
 
+# Settings for the HTTP session shared by every client in this process.
+# See configure_session_pool.
+_POOL_SETTINGS = {'pool_connections': 10, 'pool_maxsize': 10,
+                  'pool_block': False, 'keep_alive': True}
+_session = None
+_session_pid = None
+_session_lock = _threading.Lock()
+
+
+def configure_session_pool(pool_connections=10, pool_maxsize=10,
+                           pool_block=False, keep_alive=True):
+    '''
+    Configures the HTTP connection pool shared by all clients in this process.
+    pool_connections - the number of hosts to keep connection pools for.
+    pool_maxsize - the maximum number of connections kept open to any one host.
+    pool_block - if True, wait for a free connection when a host's pool is
+        fully used, rather than opening an extra (unpooled) connection.
+    keep_alive - if False, connections are closed after every call.
+    The shared session is rebuilt on its next use.
+    '''
+    global _session
+    with _session_lock:
+        _POOL_SETTINGS.update({'pool_connections': int(pool_connections),
+                               'pool_maxsize': int(pool_maxsize),
+                               'pool_block': bool(pool_block),
+                               'keep_alive': bool(keep_alive)})
+        old_session, _session = _session, None
+    if old_session is not None:
+        old_session.close()
+
+
+def get_session():
+    '''
+    Returns the requests Session shared by all clients in this process, so
+    connections (and their TLS handshakes) get reused between calls.
+    A new session is made after a fork, so worker processes never share
+    sockets with their parent. The session never stores cookies, so nothing
+    set by one user's call gets sent with another's.
+    '''
+    global _session, _session_pid
+    with _session_lock:
+        if _session is None or _session_pid != _os.getpid():
+            session = _requests.Session()
+            session.cookies.set_policy(
+                _cookiejar.DefaultCookiePolicy(allowed_domains=[]))
+            adapter = _HTTPAdapter(
+                pool_connections=_POOL_SETTINGS['pool_connections'],
+                pool_maxsize=_POOL_SETTINGS['pool_maxsize'],
+                pool_block=_POOL_SETTINGS['pool_block'])
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            if not _POOL_SETTINGS['keep_alive']:
+                session.headers['Connection'] = 'close'
+            _session = session
+            _session_pid = _os.getpid()
+        return _session
+
 
 def _get_token(user_id, password, auth_svc):
     # This is bandaid helper function until we get a full
@@ -176,9 +236,9 @@ class BaseClient(object):
             arg_hash['context'] = context
 
         body = _json.dumps(arg_hash, cls=_JSONObjectEncoder)
-        ret = _requests.post(url, data=body, headers=self._headers,
-                             timeout=self.timeout,
-                             verify=not self.trust_all_ssl_certificates)
+        ret = get_session().post(url, data=body, headers=self._headers,
+                                 timeout=self.timeout,
+                                 verify=not self.trust_all_ssl_certificates)
         ret.encoding = 'utf-8'
         if ret.status_code == 500:
             if ret.headers.get(_CT) == _AJ:
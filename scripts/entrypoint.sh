@@ -18,6 +18,8 @@ elif [ "${1}" = "bash" ] ; then
   sh
 elif [ "${1}" = "sh" ] ; then
   sh
+elif [ "${1}" = "rebuild_registry" ] ; then
+  PYTHONPATH=./lib KB_DEPLOYMENT_CONFIG=./deploy.cfg python -m StaticNarrative.registry rebuild
 elif [ "${1}" = "report" ] ; then
   echo "The compile report can be found at ./work/compile_report.json"
 else
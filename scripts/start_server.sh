@@ -2,4 +2,6 @@
 script_dir=$(dirname "$(readlink -f "$0")")
 export KB_DEPLOYMENT_CONFIG="$script_dir"/../deploy.cfg
 export PYTHONPATH="$script_dir"/../lib:"$PATH":"$PYTHONPATH"
+# set up the Static Narrative registry once, before the workers start
+python -m StaticNarrative.registry init
 uwsgi --master --processes 5 --threads 5 --http :5000 --wsgi-file "$script_dir"/../lib/StaticNarrative/StaticNarrativeServer.py
@@ -1,9 +1,18 @@
 # -*- coding: utf-8 -*-
+import json
+import os
+import tempfile
+import time
 import unittest
 from test.mocks import set_up_ok_mocks
 from test.test_config import get_test_config
+from unittest.mock import patch
 
 import requests_mock
+from bs4 import BeautifulSoup
+from StaticNarrative.exporter.exporter import NarrativeExporter
+from StaticNarrative.exporter.published_files import find_published_files
+from StaticNarrative.registry import init_registry
 from StaticNarrative.StaticNarrativeImpl import StaticNarrative
 from StaticNarrative.StaticNarrativeServer import MethodContext
 
@@ -11,7 +20,8 @@ from StaticNarrative.StaticNarrativeServer import MethodContext
 class StaticNarrativeTest(unittest.TestCase):
     @classmethod
     def setUpClass(cls):
-        cls.cfg = get_test_config()
+        cls.scratch_dir = tempfile.TemporaryDirectory()
+        cls.cfg = get_test_config(scratch=cls.scratch_dir.name)
         cls.ctx = MethodContext(None)
         cls.ctx.update(
             {
@@ -28,9 +38,15 @@ class StaticNarrativeTest(unittest.TestCase):
             }
         )
         cls.service_impl = StaticNarrative(cls.cfg)
+        # done by the start script in a deployment
+        init_registry(cls.cfg)
         cls.scratch = cls.cfg["scratch"]
         cls.user_id = "some_user"
 
+    @classmethod
+    def tearDownClass(cls):
+        cls.scratch_dir.cleanup()
+
     def test_status(self):
         impl = self.service_impl
         status = impl.status(self.ctx)[0]
@@ -151,11 +167,238 @@ class StaticNarrativeTest(unittest.TestCase):
                 ws_obj_info_file=f"data/{ws_id}/objects-{ws_id}.json",
             )
             output = self.service_impl.create_static_narrative(
-                self.ctx, {"narrative_ref": narr_ref}
+                self.ctx, {"narrative_ref": narr_ref, "overwrite": 1}
             )[0]
             self.assertEqual(
                 output["static_narrative_url"], f"/{ws_id}/{narr_ref.split('/')[-1]}/"
             )
+            # every report the page links to got published with it
+            static_path = os.path.join(
+                self.cfg["static-file-root"], str(ws_id), narr_ref.split("/")[-1]
+            )
+            with open(os.path.join(static_path, "index.html")) as f:
+                page = f.read()
+            for url in find_published_files(page):
+                self.assertTrue(os.path.isfile(os.path.join(static_path, url)))
+
+    @requests_mock.Mocker()
+    def test_create_static_narrative_unchanged(self, rqm):
+        """
+        Test that an unchanged Narrative doesn't get exported again, unless overwrite is set.
+        """
+        ws_id = 5846
+        narr_ref = f"{ws_id}/1/19"
+        ws_info = [
+            ws_id,
+            "some_narrative",
+            self.user_id,
+            "2019-08-26T17:33:56+0000",
+            7,
+            "a",
+            "r",
+            "unlocked",
+            {"narrative": "1"},
+        ]
+        set_up_ok_mocks(
+            rqm,
+            ref_to_file={narr_ref: f"data/{ws_id}/narrative-5846.1.19.json"},
+            ws_info=ws_info,
+            ws_perms={ws_id: {self.user_id: "a", "*": "r"}},
+            user_map={self.user_id: "Some User"},
+            ws_obj_info_file=f"data/{ws_id}/objects-{ws_id}.json",
+        )
+        params = {"narrative_ref": narr_ref}
+        expected = {"static_narrative_url": f"/{ws_id}/19/"}
+        output = self.service_impl.create_static_narrative(
+            self.ctx, {**params, "overwrite": 1}
+        )[0]
+        self.assertEqual(output, expected)
+        # the permission checks and the author list share one lookup
+        methods = [
+            r.json()["method"] for r in rqm.request_history if r.method == "POST"
+        ]
+        self.assertEqual(methods.count("Workspace.get_permissions_mass"), 1)
+        self.assertEqual(methods.count("Workspace.get_workspace_info"), 1)
+        self.assertNotIn("Workspace.get_permissions", methods)
+
+        export_error = RuntimeError("exported again")
+        with patch.object(
+            NarrativeExporter, "export_narrative", side_effect=export_error
+        ) as export:
+            output = self.service_impl.create_static_narrative(self.ctx, params)[0]
+            self.assertEqual(output, expected)
+            export.assert_not_called()
+
+            # overwrite always exports it
+            with self.assertRaises(RuntimeError):
+                self.service_impl.create_static_narrative(
+                    self.ctx, {**params, "overwrite": 1}
+                )
+
+            # and so does anything that changes the fingerprint
+            with self.assertRaises(RuntimeError):
+                self.service_impl.create_static_narrative(
+                    self.ctx, {"narrative_ref": f"{ws_id}/2/19"}
+                )
+            cfg = {**self.cfg, "assets-version": "v2"}
+            with self.assertRaises(RuntimeError):
+                StaticNarrative(cfg).create_static_narrative(self.ctx, params)
+            # including the config values that change the exported files
+            cfg = {**self.cfg, "data-page-size": "10"}
+            with self.assertRaises(RuntimeError):
+                StaticNarrative(cfg).create_static_narrative(self.ctx, params)
+
+            # if the Workspace already has the url, it doesn't get saved again
+            ws_info[8] = {
+                "narrative": "1",
+                "static_narrative": expected["static_narrative_url"],
+                "static_narrative_ver": "19",
+                "static_narrative_saved": "1234",
+            }
+            set_up_ok_mocks(
+                rqm,
+                ref_to_file={narr_ref: f"data/{ws_id}/narrative-5846.1.19.json"},
+                ws_info=ws_info,
+                ws_perms={ws_id: {self.user_id: "a", "*": "r"}},
+                user_map={self.user_id: "Some User"},
+                ws_obj_info_file=f"data/{ws_id}/objects-{ws_id}.json",
+            )
+            num_requests = len(rqm.request_history)
+            output = self.service_impl.create_static_narrative(self.ctx, params)[0]
+            self.assertEqual(output, expected)
+            methods = [
+                r.json()["method"]
+                for r in rqm.request_history[num_requests:]
+                if r.method == "POST"
+            ]
+            self.assertNotIn("Workspace.alter_workspace_metadata", methods)
+
+    @requests_mock.Mocker()
+    def test_create_static_narrative_paged_data(self, rqm):
+        ws_id = 25022
+        narr_ref = f"{ws_id}/1/114"
+        ws_info = [ws_id, "some_narrative", self.user_id, "2019-08-26T17:33:56+0000"]
+        ws_info += [7, "a", "r", "unlocked", {"narrative": "1"}]
+        set_up_ok_mocks(
+            rqm,
+            ref_to_file={narr_ref: f"data/{ws_id}/narrative-25022.1.114.json"},
+            ws_info=ws_info,
+            ws_perms={ws_id: {self.user_id: "a", "*": "r"}},
+            user_map={self.user_id: "Some User"},
+            ws_obj_info_file=f"data/{ws_id}/objects-{ws_id}.json",
+        )
+        service_impl = StaticNarrative({**self.cfg, "data-page-size": "10"})
+        output = service_impl.create_static_narrative(
+            self.ctx, {"narrative_ref": narr_ref, "overwrite": 1}
+        )[0]
+        static_path = os.path.join(self.cfg["static-file-root"], str(ws_id), "114")
+        with open(os.path.join(static_path, "data.json")) as data_file:
+            manifest = json.load(data_file)
+        for page in manifest["pages"]:
+            self.assertTrue(os.path.isfile(os.path.join(static_path, page["file"])))
+        # it's fingerprinted by its data, same as if it weren't paged
+        with patch.object(NarrativeExporter, "export_narrative") as export:
+            self.assertEqual(
+                service_impl.create_static_narrative(
+                    self.ctx, {"narrative_ref": narr_ref}
+                )[0],
+                output,
+            )
+            export.assert_not_called()
+
+    @requests_mock.Mocker()
+    def test_create_static_narrative_report_files(self, rqm):
+        """
+        With report-files, reports get published in their own files, and are shown in
+        sandboxed iframes that don't share the page's origin.
+        """
+        ws_id = 47123
+        narr_ref = f"{ws_id}/1/28"
+        ref_to_file = {narr_ref: f"data/{ws_id}/narrative-47123.1.28.json"}
+        for obj_id in range(4, 10):
+            ref_to_file[
+                f"{ws_id}/{obj_id}/1"
+            ] = f"data/{ws_id}/report-47123.{obj_id}.1.json"
+        ws_info = [ws_id, "some_narrative", self.user_id, "2019-08-26T17:33:56+0000"]
+        ws_info += [7, "a", "r", "unlocked", {"narrative": "1"}]
+        set_up_ok_mocks(
+            rqm,
+            ref_to_file=ref_to_file,
+            ws_info=ws_info,
+            ws_perms={ws_id: {self.user_id: "a", "*": "r"}},
+            user_map={self.user_id: "Some User"},
+            ws_obj_info_file=f"data/{ws_id}/objects-{ws_id}.json",
+        )
+        service_impl = StaticNarrative({**self.cfg, "report-files": "true"})
+        service_impl.create_static_narrative(
+            self.ctx, {"narrative_ref": narr_ref, "overwrite": 1}
+        )
+        static_path = os.path.join(self.cfg["static-file-root"], str(ws_id), "28")
+        with open(os.path.join(static_path, "index.html")) as f:
+            page = BeautifulSoup(f.read(), features="html.parser")
+        iframes = page.select("iframe.kb-app-report-iframe")
+        self.assertGreater(len(iframes), 0)
+        for iframe in iframes:
+            self.assertEqual(iframe["sandbox"], ["allow-scripts", "allow-popups"])
+            self.assertNotIn("onload", iframe.attrs)
+            self.assertTrue(os.path.isfile(os.path.join(static_path, iframe["src"])))
+
+    @requests_mock.Mocker()
+    def test_create_static_narrative_shared_styles(self, rqm):
+        """
+        With shared-styles, the page links to a stylesheet published in the static file
+        root instead of inlining the Narrative styles.
+        """
+        ws_id = 5846
+        ws_info = [ws_id, "some_narrative", self.user_id, "2019-08-26T17:33:56+0000"]
+        ws_info += [7, "a", "r", "unlocked", {"narrative": "1"}]
+        set_up_ok_mocks(
+            rqm,
+            ref_to_file={f"{ws_id}/1/19": f"data/{ws_id}/narrative-5846.1.19.json"},
+            ws_info=ws_info,
+            ws_perms={ws_id: {self.user_id: "a", "*": "r"}},
+            user_map={self.user_id: "Some User"},
+            ws_obj_info_file=f"data/{ws_id}/objects-{ws_id}.json",
+        )
+        service_impl = StaticNarrative({**self.cfg, "shared-styles": "true"})
+        service_impl.create_static_narrative(
+            self.ctx, {"narrative_ref": f"{ws_id}/1/19", "overwrite": 1}
+        )
+        static_path = os.path.join(self.cfg["static-file-root"], str(ws_id), "19")
+        with open(os.path.join(static_path, "index.html")) as f:
+            page = BeautifulSoup(f.read(), features="html.parser")
+        links = [
+            link["href"]
+            for link in page.select("link[rel=stylesheet]")
+            if link["href"].startswith("../")
+        ]
+        self.assertEqual(len(links), 1)
+        with open(os.path.join(static_path, links[0])) as f:
+            stylesheet = f.read()
+        self.assertIn('font-family: "kbase-icons"', stylesheet)
+        for style in page.select("style"):
+            self.assertNotIn('font-family: "kbase-icons"', style.text)
+
+    @requests_mock.Mocker()
+    def test_submit_static_narrative(self, rqm):
+        """
+        Test that a submitted job can be polled until it's done.
+        """
+        ws_id = 12345
+        set_up_ok_mocks(rqm, ws_perms={ws_id: {self.user_id: "n"}})
+        job_id = self.service_impl.submit_static_narrative(
+            self.ctx, {"narrative_ref": f"{ws_id}/1/1"}
+        )[0]["job_id"]
+        for _ in range(100):
+            job = self.service_impl.get_static_narrative_job(
+                self.ctx, {"job_id": job_id}
+            )[0]
+            if job["state"] == "error":
+                break
+            time.sleep(0.1)
+        self.assertEqual(job["job_id"], job_id)
+        self.assertEqual(job["state"], "error")
+        self.assertIn("does not have admin rights", job["error"])
 
     def test_create_static_narrative_no_auth(self):
         """
@@ -241,9 +484,9 @@ class StaticNarrativeTest(unittest.TestCase):
         set_up_ok_mocks(
             rqm, ref_to_file=ref_to_file, ref_to_info=ref_to_info, ws_info=ws_info
         )
-        info = self.service_impl.get_static_narrative_info(self.ctx, {"ws_id": ws_id})[
-            0
-        ]
+        info = self.service_impl.get_static_narrative_info(
+            self.ctx, {"ws_id": ws_id, "verify": 1}
+        )[0]
         std_info = {
             "ws_id": ws_id,
             "version": 1,
@@ -253,6 +496,13 @@ class StaticNarrativeTest(unittest.TestCase):
             "narr_saved": 1571953877000,
         }
         self.assertEqual(info, std_info)
+        # verifying it registers it, so it's answered without the Workspace after that
+        num_requests = len(rqm.request_history)
+        info = self.service_impl.get_static_narrative_info(self.ctx, {"ws_id": ws_id})[
+            0
+        ]
+        self.assertEqual(info, std_info)
+        self.assertEqual(len(rqm.request_history), num_requests)
 
     def test_list_static_narratives(self):
         """
@@ -260,4 +510,7 @@ class StaticNarrativeTest(unittest.TestCase):
         TODO: deeper unit testing?
         """
         narrs = self.service_impl.list_static_narratives(self.ctx)[0]
-        print(narrs)
+        self.assertEqual(narrs["count"], len(narrs["narratives"]))
+        for ws_id, info in narrs["narratives"].items():
+            self.assertEqual(str(info["ws_id"]), ws_id)
+            self.assertTrue(info["url"].startswith(f"/{ws_id}/"))
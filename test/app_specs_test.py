@@ -0,0 +1,64 @@
+import unittest
+from test.mocks import set_up_ok_mocks
+from test.test_config import get_test_config
+
+import requests_mock
+from installed_clients.NarrativeMethodStoreClient import NarrativeMethodStore
+from StaticNarrative.exporter.app_specs import AppSpecCache
+
+NMS_METHOD = "NarrativeMethodStore.get_method_full_info"
+
+
+def _nms_calls(requests):
+    return [
+        r.json()["params"][0]
+        for r in requests
+        if r.method == "POST" and r.json().get("method") == NMS_METHOD
+    ]
+
+
+class AppSpecCacheTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.nms_url = get_test_config()["nms-url"]
+        cls.nms = NarrativeMethodStore(url=cls.nms_url)
+
+    @requests_mock.Mocker()
+    def test_get_infos(self, rqm):
+        set_up_ok_mocks(rqm)
+        app_specs = AppSpecCache(10, 60)
+        first = app_specs.get_infos(self.nms, "release", ["SomeModule/app_a"])
+        self.assertEqual(first, [{"name": "Some Unknown App", "publications": []}])
+        # only the uncached app gets fetched
+        infos = app_specs.get_infos(
+            self.nms, "release", ["SomeModule/app_b", "SomeModule/app_a"]
+        )
+        self.assertEqual(len(infos), 2)
+        self.assertEqual(
+            _nms_calls(rqm.request_history),
+            [
+                {"ids": ["SomeModule/app_a"], "tag": "release"},
+                {"ids": ["SomeModule/app_b"], "tag": "release"},
+            ],
+        )
+        # nothing gets fetched once they're all cached
+        num_requests = len(rqm.request_history)
+        app_specs.get_infos(self.nms, "release", ["SomeModule/app_a"])
+        self.assertEqual(len(rqm.request_history), num_requests)
+        # tags are cached separately
+        app_specs.get_infos(self.nms, "beta", ["SomeModule/app_a"])
+        self.assertEqual(len(rqm.request_history), num_requests + 1)
+        stats = app_specs.stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (2, 3))
+
+    @requests_mock.Mocker()
+    def test_get_infos_error(self, rqm):
+        set_up_ok_mocks(rqm)
+        app_specs = AppSpecCache(10, 60)
+        app_specs.get_infos(self.nms, "release", ["SomeModule/app_a"])
+        rqm.post(self.nms_url, status_code=500)
+        with self.assertLogs("StaticNarrative", level="WARNING"):
+            infos = app_specs.get_infos(
+                self.nms, "release", ["SomeModule/app_a", "SomeModule/app_b"]
+            )
+        self.assertEqual(infos, [{"name": "Some Unknown App", "publications": []}])
@@ -0,0 +1,53 @@
+import unittest
+from test.mocks import set_up_ok_mocks
+from test.test_config import get_test_config
+
+import requests_mock
+from StaticNarrative.authclient import KBaseAuth, TokenCache
+from StaticNarrative.ttl_cache import TTLCache
+
+
+class AuthClientTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.cfg = get_test_config()
+        cls.token = "some_token"
+
+    def test_token_cache(self):
+        cache = TokenCache(10, 60)
+        self.assertIsNone(cache.get_user(self.token))
+        cache.add_valid_token(self.token, "some_user")
+        self.assertEqual(cache.get_user(self.token), "some_user")
+        # tokens aren't kept as they are
+        self.assertNotIn(self.token, cache._entries)
+        with self.assertRaises(ValueError):
+            cache.add_valid_token(self.token, None)
+        with self.assertRaises(ValueError):
+            cache.add_valid_token("", "some_user")
+
+    def test_token_cache_from_config(self):
+        auth = KBaseAuth(self.cfg["auth-url"])
+        self.assertIsInstance(auth.token_cache, TokenCache)
+        self.assertEqual(
+            auth.token_cache.max_size, int(self.cfg["auth-token-cache-size"])
+        )
+        self.assertEqual(auth.token_cache.ttl, float(self.cfg["auth-token-cache-ttl"]))
+        token_cache = TokenCache(10, 60)
+        self.assertIs(KBaseAuth(token_cache=token_cache).token_cache, token_cache)
+
+    @requests_mock.Mocker()
+    def test_display_name_cache(self, rqm):
+        user_map = {"user_a": "User A", "user_b": "User B"}
+        set_up_ok_mocks(rqm, user_map=user_map)
+        auth = KBaseAuth(self.cfg["auth-url"], display_name_cache=TTLCache(10, 60))
+        self.assertEqual(auth.get_display_names(self.token, ["user_a"]), user_map)
+        self.assertEqual(len(rqm.request_history), 1)
+        # both are cached now
+        self.assertEqual(
+            auth.get_display_names(self.token, ["user_a", "user_b"]), user_map
+        )
+        self.assertEqual(len(rqm.request_history), 1)
+        # without a cache, they're always fetched
+        auth = KBaseAuth(self.cfg["auth-url"])
+        auth.get_display_names(self.token, ["user_a"])
+        self.assertEqual(len(rqm.request_history), 2)
@@ -0,0 +1,208 @@
+import os
+import tempfile
+import time
+import unittest
+from test.mocks import set_up_ok_mocks
+from test.test_config import get_test_config
+from types import SimpleNamespace
+
+import nbformat
+import requests_mock
+from StaticNarrative.exporter.cell_cache import (
+    CACHE_METADATA_KEY,
+    PRUNE_INTERVAL,
+    CellCache,
+    finish_cells,
+)
+from StaticNarrative.exporter.exporter import NarrativeExporter
+from StaticNarrative.exporter.published_files import (
+    write_image_file,
+    write_report_file,
+)
+from StaticNarrative.narrative_ref import NarrativeRef
+
+WS_ID = 43666
+REPORT_REFS = ["43666/3/1", "43666/7/1"]
+
+
+def _fetched_refs(requests):
+    refs = []
+    for r in requests:
+        if r.method == "POST" and r.json().get("method") == "Workspace.get_objects2":
+            refs += [obj["ref"] for obj in r.json()["params"][0]["objects"]]
+    return refs
+
+
+class CellCacheTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.user_id = "some_user"
+        cls.token = "some_token"
+
+    def setUp(self):
+        self.scratch_dir = tempfile.TemporaryDirectory()
+        self.cfg = get_test_config(scratch=self.scratch_dir.name)
+
+    def tearDown(self):
+        self.scratch_dir.cleanup()
+
+    def _set_up_mocks(self, rqm):
+        ref_to_file = {
+            "43666/1/18": "data/43666/narrative-43666.1.18.json",
+            "43666/1/21": "data/43666/narrative-43666.1.21.json",
+        }
+        for ref in REPORT_REFS:
+            ref_to_file[ref] = f"data/43666/report-{ref.replace('/', '.')}.json"
+        ws_info = [
+            WS_ID,
+            "some_narrative",
+            self.user_id,
+            "2019-08-26T17:33:56+0000",
+            7,
+            "a",
+            "r",
+            "unlocked",
+            {"narrative": "1"},
+        ]
+        set_up_ok_mocks(
+            rqm,
+            ref_to_file=ref_to_file,
+            ws_info=ws_info,
+            user_map={self.user_id: "Some User"},
+            ws_obj_info_file="data/43666/objects-43666.json",
+        )
+
+    def _export(self, cfg, ver):
+        exporter = NarrativeExporter(cfg, self.user_id, self.token)
+        output_dir = tempfile.mkdtemp(dir=cfg["scratch"])
+        path = exporter.export_narrative(
+            NarrativeRef({"wsid": WS_ID, "objid": 1, "ver": ver}), output_dir
+        )
+        with open(path) as narr_file:
+            return narr_file.read()
+
+    @requests_mock.Mocker()
+    def test_cached_export(self, rqm):
+        self._set_up_mocks(rqm)
+        no_cache_cfg = {**self.cfg, "cell-cache-dir": ""}
+        expected = self._export(no_cache_cfg, 21)
+        self.assertNotIn("kbs-cell", expected)
+
+        cold = self._export(self.cfg, 21)
+        self.assertIn(REPORT_REFS[0], _fetched_refs(rqm.request_history))
+
+        # with every cell cached, only the Narrative itself gets fetched
+        num_requests = len(rqm.request_history)
+        warm = self._export(self.cfg, 21)
+        self.assertEqual(
+            _fetched_refs(rqm.request_history[num_requests:]), ["43666/1/21"]
+        )
+        self.assertEqual(cold, expected)
+        self.assertEqual(warm, expected)
+
+    @requests_mock.Mocker()
+    def test_cached_stream_render(self, rqm):
+        self._set_up_mocks(rqm)
+        cfg = {**self.cfg, "stream-render": "true"}
+        expected = self._export({**cfg, "cell-cache-dir": ""}, 21)
+        self.assertNotIn("kbs-cell", expected)
+        self.assertEqual(self._export(cfg, 21), expected)
+        num_requests = len(rqm.request_history)
+        self.assertEqual(self._export(cfg, 21), expected)
+        self.assertEqual(
+            _fetched_refs(rqm.request_history[num_requests:]), ["43666/1/21"]
+        )
+        # streamed cells don't get used in pages rendered all at once
+        num_requests = len(rqm.request_history)
+        self._export(self.cfg, 21)
+        self.assertIn(REPORT_REFS[0], _fetched_refs(rqm.request_history[num_requests:]))
+
+    @requests_mock.Mocker()
+    def test_other_version(self, rqm):
+        """Exporting another version reuses the cells they have in common."""
+        self._set_up_mocks(rqm)
+        self._export(self.cfg, 18)
+        num_cached = sum(
+            len(files) for _, _, files in os.walk(self.cfg["cell-cache-dir"])
+        )
+        self.assertGreater(num_cached, 0)
+        expected = self._export({**self.cfg, "cell-cache-dir": ""}, 21)
+        self.assertEqual(self._export(self.cfg, 21), expected)
+
+    def test_finish_cells(self):
+        cache = CellCache(self.cfg["cell-cache-dir"])
+        new_key = "a" * 64
+        cached_key = "b" * 64
+        html = (
+            "<div>\n"
+            f"<!--kbs-cell-start:{new_key}-->\n<p>new\r\n</p>\n<!--kbs-cell-end:{new_key}-->"
+            f" <!--kbs-cell:{cached_key}--> </div>"
+        )
+        finished = finish_cells(html, cache, {cached_key: "<p>cached</p>"})
+        self.assertEqual(finished, "<div>\n<p>new\r\n</p>\n<p>cached</p> </div>")
+        self.assertEqual(cache.get(new_key), "\n<p>new\r\n</p>\n")
+        self.assertIsNone(cache.get(cached_key))
+
+    def test_published_files(self):
+        """
+        Cached cells only get used if the reports and images they link to are cached too.
+        """
+        cache = CellCache(self.cfg["cell-cache-dir"])
+        output_dir = tempfile.mkdtemp(dir=self.cfg["scratch"])
+        report_url = write_report_file(output_dir, "<html>a report</html>")
+        image_url = write_image_file(output_dir, b"not really a png", "png")
+        session = SimpleNamespace(
+            host="https://ci.kbase.us",
+            ws_id=WS_ID,
+            nms_image_url="",
+            assets_base_url="",
+            assets_version="v1",
+            stream_render=False,
+            report_dir=output_dir,
+            image_dir=output_dir,
+        )
+
+        def new_notebook():
+            return nbformat.v4.new_notebook(
+                cells=[nbformat.v4.new_markdown_cell("hi", id="a-cell")]
+            )
+
+        nb = new_notebook()
+        cache.look_up(nb, session)
+        key = nb.cells[0].metadata[CACHE_METADATA_KEY]["key"]
+        cell_html = f'<iframe src="{report_url}"></iframe><img src="{image_url}">'
+        cache.put(key, cell_html)
+        self.assertEqual(cache.look_up(new_notebook(), session), {})
+
+        cache.store_files(output_dir)
+        cached_cells = cache.look_up(new_notebook(), session)
+        self.assertEqual(cached_cells, {key: cell_html})
+        new_output_dir = tempfile.mkdtemp(dir=self.cfg["scratch"])
+        cache.restore_files(cached_cells, new_output_dir)
+        for url in [report_url, image_url]:
+            with open(os.path.join(new_output_dir, url), "rb") as restored_file:
+                with open(os.path.join(output_dir, url), "rb") as expected:
+                    self.assertEqual(restored_file.read(), expected.read())
+
+    def test_prune(self):
+        """The least recently used files get pruned, unless they were just used."""
+        cache = CellCache(self.cfg["cell-cache-dir"], max_size=2000)
+        old = time.time() - PRUNE_INTERVAL - 100
+        for i in range(4):
+            cache.put(f"key{i}", "x" * 1000)
+            os.utime(cache._path(f"key{i}"), (old + i, old + i))
+        # using a cell marks it as recently used
+        self.assertEqual(cache.get("key0"), "x" * 1000)
+        cache.put("key4", "x" * 1000)
+
+        self.assertEqual(cache.prune(), 3)
+        for i, kept in enumerate([True, False, False, False, True]):
+            self.assertEqual(cache.get(f"key{i}") is not None, kept)
+        # only 2000 bytes are left now
+        self.assertEqual(cache.prune(), 0)
+        self.assertEqual(CellCache(self.cfg["cell-cache-dir"]).prune(), 0)
+
+        # files used just now are kept, even if the cache stays too big
+        cache.max_size = 0
+        self.assertEqual(cache.prune(), 0)
+        self.assertIsNotNone(cache.get("key0"))
@@ -0,0 +1,73 @@
+import unittest
+from test.mocks import set_up_ok_mocks
+from test.test_config import get_test_config
+
+import requests_mock
+from StaticNarrative.clients import ServiceCaches, ServiceClients
+
+
+class ServiceClientsTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.cfg = get_test_config()
+        cls.token = "some_token"
+
+    def test_clients_reused(self):
+        clients = ServiceClients(self.cfg, self.token)
+        self.assertIs(clients.workspace, clients.workspace)
+        self.assertEqual(
+            clients.workspace._client._headers["AUTHORIZATION"], self.token
+        )
+        self.assertIs(clients.auth, clients.auth)
+        self.assertEqual(clients.total_calls(), 0)
+
+    @requests_mock.Mocker()
+    def test_calls_counted(self, rqm):
+        ws_id = 123
+        user_map = {"counted_user": "Counted User"}
+        set_up_ok_mocks(rqm, ws_perms={ws_id: {"counted_user": "a"}}, user_map=user_map)
+        clients = ServiceClients(self.cfg, self.token)
+        clients.workspace.get_permissions({"id": ws_id})
+        clients.workspace.get_permissions({"id": ws_id})
+        for _ in range(2):
+            self.assertEqual(
+                clients.auth.get_display_names(self.token, ["counted_user"]),
+                user_map,
+            )
+        self.assertEqual(
+            dict(clients.call_counts),
+            {"Workspace.get_permissions": 2, "Auth.get_display_names": 1},
+        )
+        self.assertEqual(clients.total_calls(), 3)
+
+    @requests_mock.Mocker()
+    def test_caches_shared(self, rqm):
+        user_map = {"shared_user": "Shared User"}
+        set_up_ok_mocks(rqm, user_map=user_map)
+        caches = ServiceCaches(self.cfg)
+        for _ in range(2):
+            clients = ServiceClients(self.cfg, self.token, caches=caches)
+            self.assertIs(clients.caches, caches)
+            self.assertEqual(
+                clients.auth.get_display_names(self.token, ["shared_user"]), user_map
+            )
+        # only the first request had to look up the display name
+        self.assertEqual(dict(clients.call_counts), {})
+        self.assertEqual(caches.stats()["display_names"]["hits"], 1)
+        # without shared caches, each request gets its own
+        self.assertIsNot(ServiceClients(self.cfg, self.token).caches, caches)
+
+    @requests_mock.Mocker()
+    def test_workspace_snapshot_fetched_once(self, rqm):
+        ws_id = 123
+        ws_info = [ws_id, "some_narrative", "some_user"]
+        ws_perms = {ws_id: {"some_user": "a", "*": "r"}}
+        set_up_ok_mocks(rqm, ws_info=ws_info, ws_perms=ws_perms)
+        clients = ServiceClients(self.cfg, self.token)
+        snapshot = clients.workspace_snapshot(ws_id)
+        self.assertEqual(snapshot, {"info": ws_info, "perms": ws_perms[ws_id]})
+        self.assertIs(clients.workspace_snapshot(str(ws_id)), snapshot)
+        self.assertEqual(
+            dict(clients.call_counts),
+            {"Workspace.get_permissions_mass": 1, "Workspace.get_workspace_info": 1},
+        )
@@ -0,0 +1,81 @@
+import gzip
+import os
+import tempfile
+import unittest
+from test.test_config import get_test_config
+
+from StaticNarrative.narrative_ref import NarrativeRef
+from StaticNarrative.uploader.compressor import (
+    StaticFileCompressor,
+    brotli,
+    compress_static_files,
+)
+from StaticNarrative.uploader.uploader import make_staging_dir, upload_static_narrative
+
+
+class CompressorTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.ref = NarrativeRef.parse("1/2/3")
+        cls.html = "<html>" + "<p>some narrative</p>" * 200 + "</html>"
+
+    def setUp(self):
+        self.scratch_dir = tempfile.TemporaryDirectory()
+        self.cfg = get_test_config(scratch=self.scratch_dir.name)
+        self.upload_endpt = self.cfg["static-file-root"]
+        self.static_path = os.path.join(
+            self.upload_endpt, str(self.ref.wsid), str(self.ref.ver)
+        )
+
+    def tearDown(self):
+        self.scratch_dir.cleanup()
+
+    def _publish(self, html):
+        staging_dir = make_staging_dir(self.ref, self.upload_endpt)
+        with open(os.path.join(staging_dir, "narrative.html"), "w") as f:
+            f.write(html)
+        with open(os.path.join(staging_dir, "data.json"), "w") as f:
+            f.write("{}")
+        upload_static_narrative(
+            self.ref, os.path.join(staging_dir, "narrative.html"), self.upload_endpt
+        )
+
+    def _suffixes(self):
+        return [".gz", ".br"] if brotli is not None else [".gz"]
+
+    def test_compress_static_files(self):
+        self._publish(self.html)
+        index_path = os.path.join(self.static_path, "index.html")
+        written = compress_static_files(self.static_path)
+        # data.json is too small to bother with
+        self.assertEqual(
+            sorted(written), sorted(index_path + suffix for suffix in self._suffixes())
+        )
+        with gzip.open(index_path + ".gz", "rt") as f:
+            self.assertEqual(f.read(), self.html)
+        if brotli is not None:
+            with open(index_path + ".br", "rb") as f:
+                self.assertEqual(brotli.decompress(f.read()).decode(), self.html)
+        # they're up to date, so they don't get written again
+        self.assertEqual(compress_static_files(self.static_path), [])
+
+    def test_republish_removes_old_siblings(self):
+        self._publish(self.html)
+        compress_static_files(self.static_path)
+        new_html = self.html.replace("some", "another")
+        self._publish(new_html)
+        self.assertEqual(
+            sorted(os.listdir(self.static_path)), ["data.json", "index.html"]
+        )
+        compress_static_files(self.static_path)
+        with gzip.open(os.path.join(self.static_path, "index.html.gz"), "rt") as f:
+            self.assertEqual(f.read(), new_html)
+
+    def test_compress_later(self):
+        self._publish(self.html)
+        future = StaticFileCompressor(1).compress_later(self.static_path)
+        self.assertEqual(len(future.result()), len(self._suffixes()))
+        self.assertIsNone(StaticFileCompressor(0).compress_later(self.static_path))
+        # errors get logged, not raised
+        future = StaticFileCompressor(1).compress_later(None)
+        self.assertEqual(future.result(), [])
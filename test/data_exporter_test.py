@@ -0,0 +1,149 @@
+import json
+import os
+import tempfile
+import unittest
+from test.mocks import set_up_ok_mocks
+from test.test_config import get_test_config
+
+import requests_mock
+from installed_clients.NarrativeServiceClient import NarrativeService
+from StaticNarrative.exporter.data_exporter import (
+    decode_compact,
+    encode_compact,
+    export_narrative_data,
+    get_narrative_data,
+    read_narrative_data,
+)
+
+WS_ID = 25022
+
+
+class DataExporterTestCase(unittest.TestCase):
+    def setUp(self):
+        self.scratch_dir = tempfile.TemporaryDirectory()
+        self.cfg = get_test_config(scratch=self.scratch_dir.name)
+        self.output_dir = tempfile.mkdtemp(dir=self.cfg["scratch"])
+        self.ns_client = NarrativeService(
+            url=self.cfg["srv-wiz-url"], token="some_token"
+        )
+
+    def tearDown(self):
+        self.scratch_dir.cleanup()
+
+    def _read(self, file_name):
+        with open(os.path.join(self.output_dir, file_name)) as f:
+            return json.load(f)
+
+    @requests_mock.Mocker()
+    def test_export_narrative_data(self, rqm):
+        set_up_ok_mocks(rqm, ws_obj_info_file=f"data/{WS_ID}/objects-{WS_ID}.json")
+        narrative_data = export_narrative_data(WS_ID, self.output_dir, self.ns_client)
+        self.assertEqual(
+            narrative_data["path"], os.path.join(self.output_dir, "data.json")
+        )
+        self.assertEqual(
+            self._read("data.json"),
+            {"data": narrative_data["data"], "types": narrative_data["types"]},
+        )
+        self.assertEqual(os.listdir(self.output_dir), ["data.json"])
+        self.assertEqual(
+            read_narrative_data(self.output_dir),
+            {"data": narrative_data["data"], "types": narrative_data["types"]},
+        )
+
+    @requests_mock.Mocker()
+    def test_export_narrative_data_pages(self, rqm):
+        set_up_ok_mocks(rqm, ws_obj_info_file=f"data/{WS_ID}/objects-{WS_ID}.json")
+        narrative_data = get_narrative_data(WS_ID, self.ns_client)
+        num_objects = len(narrative_data["data"])
+        self.assertGreater(num_objects, 10)
+        exported = export_narrative_data(
+            WS_ID, self.output_dir, self.ns_client, narrative_data, page_size=10
+        )
+        self.assertEqual(exported["data"], narrative_data["data"])
+
+        manifest = self._read("data.json")
+        self.assertEqual(manifest["types"], narrative_data["types"])
+        self.assertEqual(manifest["count"], num_objects)
+        self.assertEqual(manifest["page_size"], 10)
+        self.assertEqual(len(manifest["pages"]), (num_objects + 9) // 10)
+        # the pages hold all the data, in order
+        data = []
+        for page_num, page in enumerate(manifest["pages"], 1):
+            self.assertEqual(page["file"], f"data-{page_num:04d}.json")
+            self.assertEqual(page["offset"], len(data))
+            page_data = self._read(page["file"])
+            self.assertEqual(page_data["offset"], page["offset"])
+            self.assertEqual(len(page_data["data"]), page["count"])
+            data += page_data["data"]
+        self.assertEqual(data, narrative_data["data"])
+        self.assertEqual(read_narrative_data(self.output_dir), narrative_data)
+
+    @requests_mock.Mocker()
+    def test_export_narrative_data_compact(self, rqm):
+        set_up_ok_mocks(rqm, ws_obj_info_file=f"data/{WS_ID}/objects-{WS_ID}.json")
+        narrative_data = get_narrative_data(WS_ID, self.ns_client)
+        rows_dir = self.output_dir
+        export_narrative_data(WS_ID, rows_dir, self.ns_client, narrative_data)
+        self.output_dir = tempfile.mkdtemp(dir=self.cfg["scratch"])
+        export_narrative_data(
+            WS_ID,
+            self.output_dir,
+            self.ns_client,
+            narrative_data,
+            data_format="compact",
+        )
+        compact = self._read("data.json")
+        self.assertEqual(compact["format"], "compact")
+        self.assertEqual(compact["types"], narrative_data["types"])
+        self.assertEqual(decode_compact(compact), narrative_data["data"])
+        self.assertEqual(read_narrative_data(self.output_dir), narrative_data)
+        self.assertLess(
+            os.path.getsize(os.path.join(self.output_dir, "data.json")),
+            os.path.getsize(os.path.join(rows_dir, "data.json")),
+        )
+
+        # and paged
+        self.output_dir = tempfile.mkdtemp(dir=self.cfg["scratch"])
+        export_narrative_data(
+            WS_ID,
+            self.output_dir,
+            self.ns_client,
+            narrative_data,
+            page_size=10,
+            data_format="compact",
+        )
+        page = self._read("data-0001.json")
+        self.assertEqual(page["offset"], 0)
+        self.assertEqual(decode_compact(page), narrative_data["data"][:10])
+        self.assertEqual(read_narrative_data(self.output_dir), narrative_data)
+
+        with self.assertRaises(ValueError):
+            export_narrative_data(
+                WS_ID, self.output_dir, self.ns_client, narrative_data, data_format="x"
+            )
+
+    def test_encode_compact(self):
+        data = [
+            ["1/2/3", "b", "A.B-1.0", "2019-08-26T17:33:56+0000", {"x": "1", "y": "2"}],
+            ["1/3/1", "a", "A.B-1.0", "2019-08-26T17:33:56Z", {"y": "1"}],
+            ["1/4/1", "c", "A.C-2.0", None, None],
+        ]
+        encoded = encode_compact(data)
+        self.assertEqual(encoded["type_names"], ["A.B-1.0", "A.C-2.0"])
+        self.assertEqual(encoded["meta_keys"], ["x", "y"])
+        self.assertEqual(encoded["meta_values"], ["1", "2"])
+        self.assertEqual(
+            encoded["columns"],
+            {
+                "ref": ["1/2/3", "1/3/1", "1/4/1"],
+                "name": ["b", "a", "c"],
+                "type": [0, 0, 1],
+                # only dates in the Workspace's format get converted
+                "saved": [1566840836000, "2019-08-26T17:33:56Z", None],
+                "meta": [[0, 0, 1, 1], [1, 0], None],
+            },
+        )
+        self.assertEqual(decode_compact(json.loads(json.dumps(encoded))), data)
+        with self.assertRaises(ValueError):
+            decode_compact({**encoded, "format_version": 2})
@@ -1,22 +1,39 @@
+import base64
 import os
+import tempfile
+import threading
 import unittest
+from copy import deepcopy
 from test.mocks import set_up_ok_mocks
 from test.test_config import get_test_config
+from unittest.mock import patch
 
+import nbformat
 import requests_mock
-from StaticNarrative.exporter.exporter import NarrativeExporter
+from bs4 import BeautifulSoup
+from StaticNarrative.exporter import exporter as exporter_module
+from StaticNarrative.exporter.exporter import (
+    NarrativeExporter,
+    NarrativeSession,
+    get_html_exporter,
+)
 from StaticNarrative.narrative_ref import NarrativeRef
 
 
 class ExporterTest(unittest.TestCase):
     @classmethod
     def setUpClass(cls):
-        cls.cfg = get_test_config()
         cls.user_id = "some_user"
         cls.token = "some_token"
 
-    @requests_mock.Mocker()
-    def test_exporter_ok(self, rqm):
+    def setUp(self):
+        self.scratch_dir = tempfile.TemporaryDirectory()
+        self.cfg = get_test_config(scratch=self.scratch_dir.name)
+
+    def tearDown(self):
+        self.scratch_dir.cleanup()
+
+    def _set_up_43666_mocks(self, rqm):
         ws_id = 43666
         ref_to_file = {
             "43666/1/21": "data/43666/narrative-43666.1.21.json",
@@ -52,6 +69,11 @@ class ExporterTest(unittest.TestCase):
             user_map=user_map,
             ws_obj_info_file="data/43666/objects-43666.json",
         )
+
+    @requests_mock.Mocker()
+    def test_exporter_ok(self, rqm):
+        ws_id = 43666
+        self._set_up_43666_mocks(rqm)
         exporter = NarrativeExporter(self.cfg, self.user_id, self.token)
         static_path = exporter.export_narrative(
             NarrativeRef({"wsid": ws_id, "objid": 1, "ver": 21}), self.cfg["scratch"]
@@ -59,3 +81,170 @@ class ExporterTest(unittest.TestCase):
         self.assertEqual(
             static_path, os.path.join(self.cfg["scratch"], "narrative.html")
         )
+        with open(static_path) as narr_file:
+            narr_html = narr_file.read()
+        self.assertIn(
+            "A KBase Narrative that uses these Apps: Annotate Assembly and Re-annotate "
+            "Genomes with Prokka(v1.12), Edit Media, QUAST",
+            narr_html,
+        )
+
+    @requests_mock.Mocker()
+    def test_exporter_stream_render(self, rqm):
+        """
+        A streamed page should be the same as one rendered all at once, other than
+        the reformatting that BeautifulSoup does to the whole page.
+        """
+        self._set_up_43666_mocks(rqm)
+        cfg = {**self.cfg, "cell-cache-dir": ""}
+        for ver in [18, 21]:
+            ref = NarrativeRef({"wsid": 43666, "objid": 1, "ver": ver})
+            pages = {}
+            for stream_render in ["false", "true"]:
+                exporter = NarrativeExporter(
+                    {**cfg, "stream-render": stream_render}, self.user_id, self.token
+                )
+                static_path = exporter.export_narrative(ref, self.cfg["scratch"])
+                with open(static_path) as narr_file:
+                    pages[stream_render] = narr_file.read()
+            self.assertNotEqual(pages["true"], pages["false"])
+            self.assertEqual(
+                str(BeautifulSoup(pages["true"], features="html.parser")),
+                pages["false"],
+            )
+
+    @requests_mock.Mocker()
+    def test_exporter_reused(self, rqm):
+        """
+        The HTMLExporter (and its compiled templates) should get built once and reused
+        between exports, with each export getting its own session.
+        """
+        self._set_up_43666_mocks(rqm)
+        html_exporter = get_html_exporter()
+        exporter = NarrativeExporter(self.cfg, self.user_id, self.token)
+        for ver in [18, 21]:
+            static_path = exporter.export_narrative(
+                NarrativeRef({"wsid": 43666, "objid": 1, "ver": ver}),
+                self.cfg["scratch"],
+            )
+            self.assertIs(get_html_exporter(), html_exporter)
+            with open(static_path) as narr_file:
+                self.assertIn("https://ci.kbase.us/narrative/43666", narr_file.read())
+
+    @requests_mock.Mocker()
+    def test_exporter_validation_rate(self, rqm):
+        """
+        The notebook only gets validated, when it's read and after the preprocessors
+        have run, for the sample of exports set by narrative-validation-rate.
+        """
+        self._set_up_43666_mocks(rqm)
+        ref = NarrativeRef({"wsid": 43666, "objid": 1, "ver": 21})
+        for rate, num_validations in [("0", 0), ("1", 2)]:
+            exporter = NarrativeExporter(
+                {**self.cfg, "narrative-validation-rate": rate},
+                self.user_id,
+                self.token,
+            )
+            with patch("nbformat.validate", wraps=nbformat.validate) as validate:
+                exporter.export_narrative(ref, self.cfg["scratch"])
+            self.assertEqual(validate.call_count, num_validations)
+
+    def test_narrative_session_deepcopy(self):
+        session = NarrativeSession(token=self.token, ws_id=43666)
+        resources = {"narrative_session": session}
+        self.assertIs(deepcopy(resources)["narrative_session"], session)
+
+    @requests_mock.Mocker()
+    def test_exporter_concurrent_stages(self, rqm):
+        """
+        The data export and author lookup stages should run at the same time. Each waits
+        on a barrier that only opens once both are running, so this would time out (and
+        fail) if they ran one after the other.
+        """
+        self._set_up_43666_mocks(rqm)
+        barrier = threading.Barrier(2, timeout=10)
+
+        def wait_then(func):
+            def wrapped(*args, **kwargs):
+                barrier.wait()
+                return func(*args, **kwargs)
+
+            return wrapped
+
+        with patch.object(
+            exporter_module,
+            "export_narrative_data",
+            wait_then(exporter_module.export_narrative_data),
+        ), patch.object(
+            exporter_module, "get_authors", wait_then(exporter_module.get_authors)
+        ):
+            exporter = NarrativeExporter(self.cfg, self.user_id, self.token)
+            static_path = exporter.export_narrative(
+                NarrativeRef({"wsid": 43666, "objid": 1, "ver": 21}),
+                self.cfg["scratch"],
+            )
+        with open(static_path) as narr_file:
+            self.assertIn("Some User", narr_file.read())
+
+    @requests_mock.Mocker()
+    def test_exporter_sequential_stages(self, rqm):
+        self._set_up_43666_mocks(rqm)
+        cfg = dict(self.cfg)
+        cfg["export-stage-workers"] = "1"
+        exporter = NarrativeExporter(cfg, self.user_id, self.token)
+        static_path = exporter.export_narrative(
+            NarrativeRef({"wsid": 43666, "objid": 1, "ver": 21}), self.cfg["scratch"]
+        )
+        with open(static_path) as narr_file:
+            self.assertIn("Some User", narr_file.read())
+
+    @requests_mock.Mocker()
+    def test_exporter_image_files(self, rqm):
+        """
+        Images in code cell outputs should get written to their own files, and linked to
+        from the page, unless image-files is turned off.
+        """
+        self._set_up_43666_mocks(rqm)
+        image = b"\x89PNG not really a png"
+        read_notebook = NarrativeExporter._read_notebook
+
+        def read_notebook_with_image(exporter, narrative_ref, validate):
+            nb = read_notebook(exporter, narrative_ref, validate)
+            cell = nbformat.v4.new_code_cell("show()", id="image-cell")
+            output = nbformat.v4.new_output(
+                "display_data", data={"image/png": base64.b64encode(image).decode()}
+            )
+            # the same image twice only gets written once
+            cell.outputs = [output, deepcopy(output)]
+            nb.cells.append(cell)
+            return nb
+
+        ref = NarrativeRef({"wsid": 43666, "objid": 1, "ver": 21})
+        with patch.object(
+            NarrativeExporter, "_read_notebook", read_notebook_with_image
+        ):
+            output_dir = tempfile.mkdtemp(dir=self.cfg["scratch"])
+            exporter = NarrativeExporter(self.cfg, self.user_id, self.token)
+            with open(exporter.export_narrative(ref, output_dir)) as narr_file:
+                page = BeautifulSoup(narr_file.read(), features="html.parser")
+            images = page.select("div.output_png img")
+            self.assertEqual(len(images), 2)
+            self.assertEqual(images[0]["src"], images[1]["src"])
+            self.assertEqual(images[0]["loading"], "lazy")
+            self.assertEqual(
+                os.listdir(os.path.join(output_dir, "images")),
+                [images[0]["src"].split("/")[1]],
+            )
+            with open(os.path.join(output_dir, images[0]["src"]), "rb") as image_file:
+                self.assertEqual(image_file.read(), image)
+
+            exporter = NarrativeExporter(
+                {**self.cfg, "image-files": "false"}, self.user_id, self.token
+            )
+            with open(exporter.export_narrative(ref, output_dir)) as narr_file:
+                page = BeautifulSoup(narr_file.read(), features="html.parser")
+            self.assertTrue(
+                page.select("div.output_png img")[0]["src"].startswith(
+                    "data:image/png;base64,"
+                )
+            )
@@ -0,0 +1,227 @@
+import json
+import os
+import signal
+import tempfile
+import time
+import unittest
+import uuid
+from test.mocks import set_up_ok_mocks
+from test.test_config import get_test_config
+from unittest.mock import patch
+
+import requests_mock
+from StaticNarrative.jobs import OWNERS_DIR, StaticNarrativeJobs
+from StaticNarrative.registry import init_registry
+
+WS_ID = 5846
+NARR_REF = f"{WS_ID}/1/19"
+
+
+class StaticNarrativeJobsTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.scratch_dir = tempfile.TemporaryDirectory()
+        cls.cfg = get_test_config(scratch=cls.scratch_dir.name)
+        cls.user_id = "some_user"
+        cls.token = "some_token"
+        cls.jobs = StaticNarrativeJobs(cls.cfg)
+        init_registry(cls.cfg)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.scratch_dir.cleanup()
+
+    def _set_up_mocks(self, rqm, ws_perms):
+        ws_info = [
+            WS_ID,
+            "some_narrative",
+            self.user_id,
+            "2019-08-26T17:33:56+0000",
+            7,
+            "a",
+            "r",
+            "unlocked",
+            {"narrative": "1"},
+        ]
+        set_up_ok_mocks(
+            rqm,
+            ref_to_file={NARR_REF: f"data/{WS_ID}/narrative-5846.1.19.json"},
+            ws_info=ws_info,
+            ws_perms=ws_perms,
+            user_map={self.user_id: "Some User"},
+            ws_obj_info_file=f"data/{WS_ID}/objects-{WS_ID}.json",
+        )
+
+    def _wait_for_job(self, job_id):
+        for _ in range(300):
+            job = self.jobs.get_job(job_id, self.user_id)
+            if job["state"] in ["completed", "error"]:
+                return job
+            time.sleep(0.1)
+        self.fail(f"job {job_id} didn't finish")
+
+    @requests_mock.Mocker()
+    def test_job_ok(self, rqm):
+        self._set_up_mocks(rqm, {WS_ID: {self.user_id: "a", "*": "r"}})
+        job_id = self.jobs.submit(
+            {"narrative_ref": NARR_REF, "overwrite": 1}, self.user_id, self.token
+        )
+        job = self._wait_for_job(job_id)
+        self.assertEqual(job["state"], "completed")
+        self.assertEqual(job["narrative_ref"], NARR_REF)
+        self.assertEqual(job["static_narrative_url"], f"/{WS_ID}/19/")
+        self.assertIsNone(job["stage"])
+        self.assertNotIn("token", job)
+        self.assertEqual(
+            [(stage["name"], stage["state"]) for stage in job["stages"]],
+            [
+                ("check_permissions", "completed"),
+                ("check_existing", "skipped"),
+                ("export", "completed"),
+                ("upload", "completed"),
+            ],
+        )
+        self.assertLessEqual(job["created"], job["started"])
+        self.assertLessEqual(job["started"], job["finished"])
+
+    @requests_mock.Mocker()
+    def test_job_error(self, rqm):
+        self._set_up_mocks(rqm, {WS_ID: {self.user_id: "n"}})
+        job_id = self.jobs.submit({"narrative_ref": NARR_REF}, self.user_id, self.token)
+        job = self._wait_for_job(job_id)
+        self.assertEqual(job["state"], "error")
+        self.assertIn(
+            f"User {self.user_id} does not have admin rights on workspace {WS_ID}",
+            job["error"],
+        )
+        self.assertEqual(
+            [stage["state"] for stage in job["stages"]],
+            ["error", "skipped", "skipped", "skipped"],
+        )
+
+    def test_submit_bad_ref(self):
+        with self.assertRaises(ValueError) as e:
+            self.jobs.submit({"narrative_ref": "1/2"}, self.user_id, self.token)
+        self.assertIn("A Narrative ref must be of the format", str(e.exception))
+
+    @requests_mock.Mocker()
+    def test_get_job_not_allowed(self, rqm):
+        self._set_up_mocks(rqm, {WS_ID: {self.user_id: "n"}})
+        job_id = self.jobs.submit({"narrative_ref": NARR_REF}, self.user_id, self.token)
+        self._wait_for_job(job_id)
+        with self.assertRaises(PermissionError) as e:
+            self.jobs.get_job(job_id, "some_other_user")
+        self.assertIn(
+            f"User some_other_user does not have access to Static Narrative job {job_id}",
+            str(e.exception),
+        )
+
+    def test_get_job_missing(self):
+        for job_id in [
+            "not_a_job",
+            "../../deploy",
+            None,
+            "1b671a64-40d5-491e-99b0-da01ff1f3341",
+        ]:
+            with self.assertRaises(ValueError) as e:
+                self.jobs.get_job(job_id, self.user_id)
+            self.assertIn(
+                f"No Static Narrative job found with id {job_id}", str(e.exception)
+            )
+
+    def _write_job(self, owner):
+        job_id = str(uuid.uuid4())
+        job = {
+            "job_id": job_id,
+            "narrative_ref": NARR_REF,
+            "user_id": self.user_id,
+            "owner": owner,
+            "state": "running",
+            "stage": "export",
+            "stages": [
+                {"name": "check_permissions", "state": "completed"},
+                {"name": "check_existing", "state": "completed"},
+                {"name": "export", "state": "running"},
+                {"name": "upload", "state": "queued"},
+            ],
+            "created": 1,
+        }
+        with open(os.path.join(self.jobs.job_dir, f"{job_id}.json"), "w") as f:
+            json.dump(job, f)
+        return job_id
+
+    def test_orphaned_job(self):
+        """A job whose process is gone gets marked as an error."""
+        # another live process's jobs are left alone
+        other_jobs = StaticNarrativeJobs(self.cfg)
+        job_id = self._write_job(other_jobs.owner_id)
+        job = self.jobs.get_job(job_id, self.user_id)
+        self.assertEqual(job["state"], "running")
+
+        dead_owner = str(uuid.uuid4())
+        dead_owner_path = os.path.join(
+            self.jobs.job_dir, OWNERS_DIR, f"{dead_owner}.lock"
+        )
+        with open(dead_owner_path, "w"):
+            pass
+        for owner in [dead_owner, str(uuid.uuid4()), None]:
+            job_id = self._write_job(owner)
+            job = self.jobs.get_job(job_id, self.user_id)
+            self.assertEqual(job["state"], "error")
+            self.assertIn("The Static Narrative job was lost", job["error"])
+            self.assertIsNone(job["stage"])
+            self.assertEqual(
+                [stage["state"] for stage in job["stages"]],
+                ["completed", "completed", "error", "skipped"],
+            )
+            # it's saved that way
+            self.assertEqual(self.jobs.get_job(job_id, self.user_id), job)
+
+        # a new process cleans up the lock files of the ones that are gone
+        self.assertIsNotNone(StaticNarrativeJobs(self.cfg).owner_id)
+        self.assertFalse(os.path.exists(dead_owner_path))
+        self.assertTrue(
+            os.path.exists(
+                os.path.join(
+                    self.jobs.job_dir, OWNERS_DIR, f"{other_jobs.owner_id}.lock"
+                )
+            )
+        )
+
+    @patch("StaticNarrative.jobs.StaticNarrativeCreator")
+    def test_forked_worker_job_lost(self, mock_creator):
+        """
+        A worker forked from a process that already set up its jobs runs them as its own
+        owner, so they're marked as lost once it's killed.
+        """
+        mock_creator.return_value.create_static_narrative.side_effect = (
+            lambda *args, **kwargs: time.sleep(60)
+        )
+        jobs = StaticNarrativeJobs(self.cfg)
+        parent_owner = jobs.owner_id
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            try:
+                os.close(read_fd)
+                job_id = jobs.submit(
+                    {"narrative_ref": NARR_REF}, self.user_id, self.token
+                )
+                os.write(write_fd, job_id.encode("utf-8"))
+                os.close(write_fd)
+                time.sleep(60)
+            finally:
+                os._exit(0)
+        os.close(write_fd)
+        with os.fdopen(read_fd) as pipe:
+            job_id = pipe.read()
+        try:
+            job = jobs.get_job(job_id, self.user_id)
+            self.assertNotEqual(job["owner"], parent_owner)
+            self.assertIn(job["state"], ["queued", "running"])
+        finally:
+            os.kill(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+        job = jobs.get_job(job_id, self.user_id)
+        self.assertEqual(job["state"], "error")
+        self.assertIn("The Static Narrative job was lost", job["error"])
@@ -20,7 +20,9 @@ def _mock_adapter(
     Mocks POST calls to:
         Workspace.get_objects2,
         Workspace.get_workspace_info,
-        Workspace.get_object_info3
+        Workspace.get_object_info3,
+        Workspace.get_permissions,
+        Workspace.get_permissions_mass
     Mocks GET calls to:
         Auth (api/V2/users)
     :param ref_to_file: dict - maps from a workspace ref to the path to a file containing the
@@ -46,15 +48,21 @@ def _mock_adapter(
             result = []
             if method == "Workspace.get_objects2":
                 # maps a workspace object reference to returns from a file,
-                # fails if no matching file present.
-                # only gets called with a single obj requested, so craft the
-                # response that way
-                ref = params[0].get("objects", [{}])[0].get("ref")
-                if ref not in ref_to_file:
-                    response.status_code = 500
-                    result = [{"error": f"no object with reference {ref}"}]
+                # fails if no matching file present, unless ignoreErrors is set,
+                # then that object is None.
+                data = []
+                for obj in params[0].get("objects", [{}]):
+                    ref = obj.get("ref")
+                    if ref in ref_to_file:
+                        data.append(_get_object_from_file(ref_to_file[ref]))
+                    elif params[0].get("ignoreErrors"):
+                        data.append(None)
+                    else:
+                        response.status_code = 500
+                        result = [{"error": f"no object with reference {ref}"}]
+                        break
                 else:
-                    result = [{"data": [_get_object_from_file(ref_to_file[ref])]}]
+                    result = [{"data": data}]
             elif method == "Workspace.get_object_info3":
                 # list of created objects for reports - can fail.
                 info_list = []
@@ -85,6 +93,15 @@ def _mock_adapter(
             elif method == "Workspace.get_permissions":
                 ws_id = params[0].get("id")
                 result = [ws_perms.get(ws_id, {})]
+            elif method == "Workspace.get_permissions_mass":
+                result = [
+                    {
+                        "perms": [
+                            (ws_perms or {}).get(ws["id"], {})
+                            for ws in params[0]["workspaces"]
+                        ]
+                    }
+                ]
             elif method == "ServiceWizard.get_service_status":
                 result = [
                     {"url": "https://something.kbase.us/service/narrative_service_url"}
@@ -109,7 +126,7 @@ def _mock_adapter(
 
 
 def _get_fake_nms_info(tag: str, ids: list) -> list:
-    app_infos = _get_object_from_file("data/nms_info.json")[tag]
+    app_infos = _get_object_from_file("data/nms_info.json").get(tag, {})
     ret = []
     for i in ids:
         if i in app_infos:
@@ -1,14 +1,22 @@
+import json
+import os
 import time
 import unittest
+from copy import deepcopy
+from test import TEST_BASE_DIR
 from test.mocks import mock_ws_bad, set_up_ok_mocks
 from test.test_config import get_test_config
 
+import nbformat
 import requests_mock
 from installed_clients.WorkspaceClient import Workspace
 from StaticNarrative.exceptions import WorkspaceError
 from StaticNarrative.narrative.narrative_util import (
     _validate_narr_type,
+    get_saved_narrative_url,
     get_static_info,
+    get_workspace_snapshot,
+    narrative_to_notebook,
     read_narrative,
     save_narrative_url,
     verify_admin_privilege,
@@ -23,6 +31,7 @@ class NarrativeUtilTestCase(unittest.TestCase):
         cls.user_id = "some_user"
         cls.token = "some_token"
         cls.cfg = get_test_config()
+        cls.ws_client = Workspace(url=cls.cfg["workspace-url"], token=cls.token)
 
     @requests_mock.Mocker()
     def test_read_narrative_ok(self, rqm):
@@ -65,6 +74,26 @@ class NarrativeUtilTestCase(unittest.TestCase):
             str(e.exception),
         )
 
+    def test_narrative_to_notebook(self):
+        for narr_file in [
+            "data/43666/narrative-43666.1.18.json",
+            "data/25022/narrative-25022.1.114.json",
+        ]:
+            with open(os.path.join(TEST_BASE_DIR, narr_file)) as f:
+                nar = json.load(f)["data"]
+            nar_copy = deepcopy(nar)
+            for validate in [True, False]:
+                nb = narrative_to_notebook(nar, validate=validate)
+                self.assertIsInstance(nb, nbformat.NotebookNode)
+                self.assertEqual(nb, nbformat.reads(json.dumps(nar), as_version=4))
+                # the given dict shouldn't be changed
+                self.assertEqual(nar, nar_copy)
+
+    def test_narrative_to_notebook_bad_version(self):
+        with self.assertRaises(nbformat.NBFormatError) as e:
+            narrative_to_notebook({"nbformat": 12, "cells": []})
+        self.assertIn("Unsupported nbformat version 12", str(e.exception))
+
     def test_validate_narr_type(self):
         good_types = ["KBaseNarrative.Narrative-1.0", "KBaseNarrative.Narrative-4.0"]
         bad_types = [
@@ -86,7 +115,7 @@ class NarrativeUtilTestCase(unittest.TestCase):
         for t in invalid_types:
             with self.assertRaises(ValueError) as e:
                 _validate_narr_type(t, ref)
-            self.assertIn(f"The type string must be a string", str(e.exception))
+            self.assertIn("The type string must be a string", str(e.exception))
 
     @requests_mock.Mocker()
     def test_save_narrative_url(self, rqm):
@@ -98,19 +127,33 @@ class NarrativeUtilTestCase(unittest.TestCase):
         ws_id = 234
         with self.assertRaises(WorkspaceError) as e:
             save_narrative_url(
-                self.cfg["workspace-url"],
-                self.token,
+                self.ws_client,
                 NarrativeRef.parse("234/1/2"),
                 "/234/1",
             )
         self.assertIn("Failed to alter metadata", str(e.exception))
         self.assertIn(str(ws_id), str(e.exception))
 
+    def test_get_saved_narrative_url(self):
+        ref = NarrativeRef.parse("234/1/2")
+        meta = {
+            "static_narrative": "/234/2/",
+            "static_narrative_ver": "2",
+            "static_narrative_saved": "1234",
+        }
+        ws_info = [234, "ws", "user", "date", 1, "a", "r", "unlocked", meta]
+        self.assertEqual(get_saved_narrative_url(ws_info, ref, "/234/2/"), 1234)
+        self.assertIsNone(get_saved_narrative_url(ws_info, ref, "/234/3/"))
+        ws_info[8] = {**meta, "static_narrative_ver": "1"}
+        self.assertIsNone(get_saved_narrative_url(ws_info, ref, "/234/2/"))
+        ws_info[8] = {}
+        self.assertIsNone(get_saved_narrative_url(ws_info, ref, "/234/2/"))
+
     def test_get_static_info_bad(self):
         bad_wsids = ["foo", "onetwo", {"no": "way"}, ["nope"], None, str]
         for ws_id in bad_wsids:
             with self.assertRaises(ValueError) as e:
-                get_static_info("someurl", "some_token", ws_id)
+                get_static_info(self.ws_client, ws_id)
             self.assertIn(
                 "The parameter ws_id must be an integer, not ", str(e.exception)
             )
@@ -176,11 +219,11 @@ class NarrativeUtilTestCase(unittest.TestCase):
             ],
         }
         set_up_ok_mocks(rqm, ref_to_info=ref_to_info, ws_info=ws_info_map[ws_id1])
-        info = get_static_info(self.cfg["workspace-url"], self.token, ws_id1)
+        info = get_static_info(self.ws_client, ws_id1)
         self.assertEqual(info, {})
 
         set_up_ok_mocks(rqm, ref_to_info=ref_to_info, ws_info=ws_info_map[ws_id2])
-        info = get_static_info(self.cfg["workspace-url"], self.token, ws_id2)
+        info = get_static_info(self.ws_client, ws_id2)
         self.assertEqual(
             info,
             {
@@ -197,86 +240,72 @@ class NarrativeUtilTestCase(unittest.TestCase):
     def test_static_info_ws_err(self, rqm):
         mock_ws_bad(rqm, "Workspace not found")
         with self.assertRaises(WorkspaceError) as e:
-            get_static_info(self.cfg["workspace-url"], self.token, 123)
+            get_static_info(self.ws_client, 123)
         self.assertIn("123", str(e.exception))
 
     @requests_mock.Mocker()
-    def test_verify_admin_privs_ok(self, rqm):
+    def test_get_workspace_snapshot_ok(self, rqm):
+        ws_id = 123
+        ws_info = [ws_id, "some_narrative", self.user_id, "2019-08-26T17:33:56+0000"]
+        ws_perms = {ws_id: {self.user_id: "a", "*": "r"}}
+        set_up_ok_mocks(rqm, ws_info=ws_info, ws_perms=ws_perms)
+        snapshot = get_workspace_snapshot(self.ws_client, ws_id)
+        self.assertEqual(snapshot, {"info": ws_info, "perms": ws_perms[ws_id]})
+        self.assertEqual(len(rqm.request_history), 2)
+
+    @requests_mock.Mocker()
+    def test_get_workspace_snapshot_bad_client(self, rqm):
+        mock_ws_bad(rqm, "Can't reach workspace")
+        ws_id = 5
+        with self.assertRaises(WorkspaceError) as e:
+            get_workspace_snapshot(self.ws_client, ws_id)
+        self.assertIn("Can't reach workspace", str(e.exception))
+        self.assertIn(str(ws_id), str(e.exception))
+
+    def test_verify_admin_privs_ok(self):
         ws_ids_ok = {123: {self.user_id: "a"}, "1123": {self.user_id: "a"}}
-        set_up_ok_mocks(rqm, ws_perms=ws_ids_ok)
-        for ws_id in ws_ids_ok:
+        for ws_id, perms in ws_ids_ok.items():
             # verify_admin_privilege throws an error if the user doesn't have privs,
             # so we just check that each function completes successfully.
-            verify_admin_privilege(
-                self.cfg["workspace-url"], self.user_id, self.token, ws_id
-            )
+            verify_admin_privilege(perms, self.user_id, ws_id)
 
-    @requests_mock.Mocker()
-    def test_verify_admin_privs_fail(self, rqm):
+    def test_verify_admin_privs_fail(self):
         ws_no_privs = {
             123: {self.user_id: "n"},
             456: {self.user_id: "w"},
             789: {self.user_id: "r"},
             234: {"some_other_user": "a", "*": "r"},
         }
-        set_up_ok_mocks(rqm, ws_perms=ws_no_privs)
-        for ws_id in ws_no_privs:
+        for ws_id, perms in ws_no_privs.items():
             with self.assertRaises(PermissionError) as e:
-                verify_admin_privilege(
-                    self.cfg["workspace-url"], self.user_id, self.token, ws_id
-                )
+                verify_admin_privilege(perms, self.user_id, ws_id)
             self.assertIn(
                 f"User {self.user_id} does not have admin rights on workspace {ws_id}",
                 str(e.exception),
             )
 
-    @requests_mock.Mocker()
-    def test_verify_admin_privs_bad_client(self, rqm):
-        mock_ws_bad(rqm, "Can't reach workspace")
-        ws_id = 5
-        with self.assertRaises(WorkspaceError) as e:
-            verify_admin_privilege(
-                self.cfg["workspace-url"], self.user_id, self.token, ws_id
-            )
-        self.assertIn("Can't reach workspace", str(e.exception))
-        self.assertIn(str(ws_id), str(e.exception))
-
-    @requests_mock.Mocker()
-    def test_verify_public_narrative_ok(self, rqm):
+    def test_verify_public_narrative_ok(self):
         # all kinda stupid, but valid.
         ws_perms = {
             123: {self.user_id: "a", "*": "r"},
             456: {self.user_id: "n", "*": "w"},
             "789": {self.user_id: "r", "*": "a"},
         }
-        set_up_ok_mocks(rqm, ws_perms=ws_perms)
-
         # verify_public_narrative throws an error so just ensure that the
         # functions execute without issue.
-        for ws_id in ws_perms:
-            verify_public_narrative(self.cfg["workspace-url"], ws_id)
+        for ws_id, perms in ws_perms.items():
+            verify_public_narrative(perms, ws_id)
 
-    @requests_mock.Mocker()
-    def test_verify_public_narrative_fail(self, rqm):
+    def test_verify_public_narrative_fail(self):
         ws_no_privs = {
             123: {self.user_id: "n"},
             "456": {self.user_id: "a"},
             789: {self.user_id: "w"},
         }
-        set_up_ok_mocks(rqm, ws_perms=ws_no_privs)
-        for ws_id in ws_no_privs:
+        for ws_id, perms in ws_no_privs.items():
             with self.assertRaises(PermissionError) as e:
-                verify_public_narrative(self.cfg["workspace-url"], ws_id)
+                verify_public_narrative(perms, ws_id)
             self.assertIn(
                 f"Workspace {ws_id} must be publicly readable to make a Static Narrative",
                 str(e.exception),
             )
-
-    @requests_mock.Mocker()
-    def test_verify_public_privs_bad_client(self, rqm):
-        mock_ws_bad(rqm, "Can't reach workspace")
-        ws_id = 666
-        with self.assertRaises(WorkspaceError) as e:
-            verify_public_narrative(self.cfg["workspace-url"], ws_id)
-        self.assertIn("Can't reach workspace", str(e.exception))
-        self.assertIn(str(ws_id), str(e.exception))
@@ -0,0 +1,58 @@
+import tempfile
+import unittest
+from test.test_config import get_test_config
+
+from StaticNarrative.exporter.cell_cache import CellCache
+from StaticNarrative.exporter.page_writer import MISSING_ALT_TEXT, PageWriter
+
+
+class PageWriterTestCase(unittest.TestCase):
+    def setUp(self):
+        self.scratch_dir = tempfile.TemporaryDirectory()
+        cfg = get_test_config(scratch=self.scratch_dir.name)
+        self.cache = CellCache(cfg["cell-cache-dir"])
+
+    def tearDown(self):
+        self.scratch_dir.cleanup()
+
+    def _write(self, chunks, cached_cells=None):
+        written = []
+        writer = PageWriter(written.append, self.cache, cached_cells or {})
+        for chunk in chunks:
+            writer.write(chunk)
+        writer.close()
+        return "".join(written)
+
+    def test_page_writer(self):
+        new_key = "a" * 64
+        cached_key = "b" * 64
+        page = (
+            "\n\n<div><img src='logo.png'/>\n"
+            f"<!--kbs-cell-start:{new_key}--><p>new <img src=x></p>"
+            f"<!--kbs-cell-end:{new_key}-->"
+            f"<!--kbs-cell:{cached_key}--><!-- other comment -->"
+            '<img alt="a logo" src="logo.png"></div>'
+        )
+        expected = (
+            f"<div><img src='logo.png' alt=\"{MISSING_ALT_TEXT}\"/>\n"
+            f'<p>new <img src=x alt="{MISSING_ALT_TEXT}"></p>'
+            "<p>cached</p><!-- other comment -->"
+            '<img alt="a logo" src="logo.png"></div>'
+        )
+        cached_cells = {cached_key: "<p>cached</p>"}
+        # however it gets split up, it comes out the same
+        for size in [1, 2, 7, 64, len(page)]:
+            chunks = [page[i : i + size] for i in range(0, len(page), size)]
+            self.assertEqual(self._write(chunks, cached_cells), expected)
+            self.assertEqual(
+                self.cache.get(new_key),
+                f'<p>new <img src=x alt="{MISSING_ALT_TEXT}"></p>',
+            )
+
+    def test_page_writer_unfinished(self):
+        self.assertEqual(self._write(["<p>a", " <b"]), "<p>a <b")
+        key = "c" * 64
+        self.assertEqual(
+            self._write([f"<div><!--kbs-cell-start:{key}--><p>"]), "<div><p>"
+        )
+        self.assertIsNone(self.cache.get(key))
@@ -0,0 +1,113 @@
+import json
+import os
+import unittest
+from test import TEST_BASE_DIR
+from test.mocks import set_up_ok_mocks
+from test.test_config import get_test_config
+
+import requests_mock
+from installed_clients.WorkspaceClient import Workspace
+from StaticNarrative.exporter.app_processor import AppProcessor
+from StaticNarrative.exporter.object_cache import ObjectCache
+from StaticNarrative.exporter.prefetch import prefetch_narrative_data
+from StaticNarrative.narrative.narrative_util import narrative_to_notebook
+
+WS_ID = 25022
+REPORT_REFS = [
+    f"{WS_ID}/{obj_id}/1" for obj_id in [4, 6, 8, 9, 11, 12, 13, 19, 20, 31, 34]
+]
+
+
+def _ws_calls(rqm, method):
+    return [
+        r
+        for r in rqm.request_history
+        if r.method == "POST" and r.json().get("method") == method
+    ]
+
+
+class PrefetchTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.cfg = get_test_config()
+        cls.token = "some_token"
+        with open(
+            os.path.join(TEST_BASE_DIR, "data", "25022", "narrative-25022.1.114.json")
+        ) as f:
+            cls.nb = narrative_to_notebook(json.load(f)["data"])
+        cls.ref_to_file = {
+            ref: f"data/{WS_ID}/report-{ref.replace('/', '.')}.json"
+            for ref in REPORT_REFS
+        }
+
+    def _app_cells(self):
+        return [
+            c.metadata.kbase
+            for c in self.nb.cells
+            if c.metadata.get("kbase", {}).get("type") == "app"
+        ]
+
+    @requests_mock.Mocker()
+    def test_prefetch_batches_calls(self, rqm):
+        set_up_ok_mocks(rqm, ref_to_file=self.ref_to_file)
+        ws_client = Workspace(url=self.cfg["workspace-url"], token=self.token)
+        prefetched = prefetch_narrative_data(self.nb, ws_client)
+        self.assertEqual(sorted(prefetched["reports"]), sorted(REPORT_REFS))
+        self.assertEqual(len(_ws_calls(rqm, "Workspace.get_objects2")), 1)
+        self.assertEqual(len(_ws_calls(rqm, "Workspace.get_object_info3")), 1)
+        for report in prefetched["reports"].values():
+            for obj in report.get("objects_created", []):
+                self.assertIn(obj["ref"], prefetched["infos"])
+
+        # processing all the app cells should now be done without any more Workspace calls
+        num_calls = len(rqm.request_history)
+        app_processor = AppProcessor(
+            "https://ci.kbase.us", ws_client, prefetched=prefetched
+        )
+        for kb_meta in self._app_cells():
+            app_processor.process({}, kb_meta)
+        self.assertEqual(len(rqm.request_history), num_calls)
+
+    @requests_mock.Mocker()
+    def test_prefetch_missing_report(self, rqm):
+        missing_ref = REPORT_REFS[0]
+        ref_to_file = dict(self.ref_to_file)
+        del ref_to_file[missing_ref]
+        set_up_ok_mocks(rqm, ref_to_file=ref_to_file)
+        ws_client = Workspace(url=self.cfg["workspace-url"], token=self.token)
+        prefetched = prefetch_narrative_data(self.nb, ws_client)
+        self.assertNotIn(missing_ref, prefetched["reports"])
+        self.assertEqual(len(prefetched["reports"]), len(REPORT_REFS) - 1)
+
+    @requests_mock.Mocker()
+    def test_prefetch_object_cache(self, rqm):
+        set_up_ok_mocks(rqm, ref_to_file=self.ref_to_file, ws_perms={WS_ID: {"*": "r"}})
+        ws_client = Workspace(url=self.cfg["workspace-url"], token=self.token)
+        object_cache = ObjectCache(1000, 60)
+        expected = prefetch_narrative_data(self.nb, ws_client)
+        self.assertEqual(
+            prefetch_narrative_data(self.nb, ws_client, object_cache), expected
+        )
+
+        # everything's public and versioned, so it all comes from the cache after that,
+        # with only the permissions getting checked again
+        num_calls = len(rqm.request_history)
+        self.assertEqual(
+            prefetch_narrative_data(self.nb, ws_client, object_cache), expected
+        )
+        methods = [r.json()["method"] for r in rqm.request_history[num_calls:]]
+        self.assertEqual(methods, ["Workspace.get_permissions_mass"])
+        self.assertGreater(object_cache.stats()["hits"], 0)
+
+    @requests_mock.Mocker()
+    def test_prefetch_object_cache_private(self, rqm):
+        set_up_ok_mocks(
+            rqm, ref_to_file=self.ref_to_file, ws_perms={WS_ID: {"some_user": "a"}}
+        )
+        ws_client = Workspace(url=self.cfg["workspace-url"], token=self.token)
+        object_cache = ObjectCache(1000, 60)
+        prefetch_narrative_data(self.nb, ws_client, object_cache)
+        self.assertEqual(object_cache.stats()["size"], 0)
+        # so the reports get fetched again
+        prefetch_narrative_data(self.nb, ws_client, object_cache)
+        self.assertEqual(len(_ws_calls(rqm, "Workspace.get_objects2")), 2)
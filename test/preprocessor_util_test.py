@@ -1,7 +1,9 @@
+import os
 from unittest.mock import create_autospec
 
 from installed_clients.WorkspaceClient import Workspace
 from StaticNarrative.exporter.processor_util import build_report_view_data
+from StaticNarrative.exporter.published_files import find_published_files
 
 
 def test_Report_with_None_direct_link_index_and_truthy_html_links():
@@ -44,3 +46,32 @@ def test_Report_with_None_direct_link_index_and_truthy_html_links():
     assert res == expected
 
     ws.get_objects2.assert_called_once_with({"objects": [{"ref": "1/2/3"}]})
+
+
+def test_Report_direct_html_files(tmp_path):
+    """
+    Tests that a report's direct html gets written to a file when there's a report_dir,
+    and that the same report is only written once.
+    """
+    ws = create_autospec(Workspace, spec_set=True, instance=True)
+    direct_html = "<html><body>Some report \u2603</body></html>"
+    ws.get_objects2.return_value = {"data": [{"data": {"direct_html": direct_html}}]}
+    report_result = {"report_name": "some_report", "report_ref": "1/2/3"}
+
+    res = build_report_view_data("https://ci.kbase.us", ws, report_result)
+    assert res["html"]["direct"].startswith("data:text/html;charset=utf-8,")
+
+    report_dir = str(tmp_path)
+    res = build_report_view_data(
+        "https://ci.kbase.us", ws, report_result, report_dir=report_dir
+    )
+    url = res["html"]["direct"]
+    assert find_published_files(url) == {url}
+    with open(os.path.join(report_dir, url), encoding="utf-8-sig") as report_file:
+        assert report_file.read() == direct_html
+
+    again = build_report_view_data(
+        "https://ci.kbase.us", ws, report_result, report_dir=report_dir
+    )
+    assert again["html"]["direct"] == url
+    assert os.listdir(os.path.join(report_dir, "reports")) == [url.split("/")[-1]]
@@ -0,0 +1,251 @@
+import json
+import os
+import tempfile
+import unittest
+from test.mocks import set_up_ok_mocks
+from test.test_config import get_test_config
+
+import requests_mock
+from StaticNarrative.clients import ServiceClients
+from StaticNarrative.fingerprint import FINGERPRINT_FILE
+from StaticNarrative.manager import StaticNarrativeManager
+from StaticNarrative.narrative_ref import NarrativeRef
+from StaticNarrative.registry import (
+    INFO_FIELDS,
+    StaticNarrativeRegistry,
+    get_registry,
+    init_registry,
+    read_static_info,
+)
+from StaticNarrative.uploader.uploader import register_static_narrative
+
+
+def _info(ws_id, ver, static_saved, narr_saved=1571953877000):
+    return {
+        "ws_id": ws_id,
+        "narrative_id": 1,
+        "narrative_version": ver,
+        "url": f"/{ws_id}/{ver}/",
+        "narr_saved": narr_saved,
+        "static_saved": static_saved,
+    }
+
+
+class StaticNarrativeRegistryTestCase(unittest.TestCase):
+    def setUp(self):
+        self.scratch_dir = tempfile.TemporaryDirectory()
+        self.root = self.scratch_dir.name
+        self.webroot = os.path.join(self.root, "nginx")
+        os.makedirs(self.webroot)
+        self.cfg = {"static-file-root": self.webroot}
+
+    def tearDown(self):
+        self.scratch_dir.cleanup()
+
+    def _publish(self, ws_id, ver, info=None):
+        path = os.path.join(self.webroot, str(ws_id), str(ver))
+        os.makedirs(path)
+        with open(os.path.join(path, "index.html"), "w") as f:
+            f.write("<html></html>")
+        if info is not None:
+            with open(os.path.join(path, "info.json"), "w") as f:
+                json.dump(info, f)
+        return path
+
+    def test_record_list(self):
+        registry = StaticNarrativeRegistry(os.path.join(self.root, "registry.db"))
+        self.assertTrue(registry.initialize())
+        self.assertEqual(registry.list_all(), [])
+        registry.record(_info(20, 1, 1000))
+        registry.record(_info(10, 3, 1000))
+        # the next one published for a workspace replaces the last one
+        registry.record(_info(10, 2, 2000))
+        self.assertEqual(registry.list_all(), [_info(10, 2, 2000), _info(20, 1, 1000)])
+
+    def test_rebuild(self):
+        self._publish(10, 1, _info(10, 1, 1000))
+        self._publish(10, 2, _info(10, 2, 2000))
+        # published before there was an info.json
+        legacy_path = self._publish(20, 5)
+        with open(os.path.join(legacy_path, FINGERPRINT_FILE), "w") as f:
+            json.dump({"ref": "20/3/5", "fingerprint": "abc"}, f)
+        # not a static narrative
+        os.makedirs(os.path.join(self.webroot, "30", "1"))
+        os.makedirs(os.path.join(self.webroot, "assets"))
+
+        registry = StaticNarrativeRegistry(os.path.join(self.root, "registry.db"))
+        registry.initialize()
+        registry.record(_info(40, 1, 1000))
+        self.assertEqual(registry.rebuild(self.webroot), 2)
+        infos = registry.list_all()
+        self.assertEqual(infos[0], _info(10, 2, 2000))
+        self.assertEqual(
+            {
+                field: infos[1][field]
+                for field in INFO_FIELDS
+                if field != "static_saved"
+            },
+            {
+                "ws_id": 20,
+                "narrative_id": 3,
+                "narrative_version": 5,
+                "url": "/20/5/",
+                "narr_saved": None,
+            },
+        )
+        self.assertEqual(
+            infos[1]["static_saved"],
+            int(os.path.getmtime(os.path.join(legacy_path, "index.html")) * 1000),
+        )
+
+    def test_init_registry(self):
+        """A new registry gets built from what's already been published."""
+        self._publish(10, 1, _info(10, 1, 1000))
+        registry = init_registry(self.cfg)
+        self.assertEqual(
+            os.path.abspath(registry.db_path),
+            os.path.abspath(os.path.join(self.root, "static_narratives.db")),
+        )
+        self.assertEqual(registry.list_all(), [_info(10, 1, 1000)])
+        # once it's there, it's not rebuilt
+        self._publish(20, 1, _info(20, 1, 1000))
+        self.assertFalse(init_registry(self.cfg).initialize(self.webroot))
+        self.assertEqual(len(get_registry(self.cfg).list_all()), 1)
+
+    def test_register_static_narrative(self):
+        path = self._publish(10, 2)
+        registry = init_registry(self.cfg)
+        ref = NarrativeRef({"wsid": 10, "objid": 1, "ver": 2})
+        info = register_static_narrative(
+            ref, self.webroot, registry, 2000, narr_saved=1500
+        )
+        self.assertEqual(info, _info(10, 2, 2000, narr_saved=1500))
+        self.assertEqual(read_static_info(path), info)
+        # without narr_saved, the one that's already stored is kept
+        info = register_static_narrative(ref, self.webroot, registry, 3000)
+        self.assertEqual(info, _info(10, 2, 3000, narr_saved=1500))
+        self.assertEqual(registry.list_all(), [info])
+
+    def test_list_static_narratives(self):
+        self._publish(10, 2, _info(10, 2, 2000))
+        self._publish(20, 1, _info(20, 1, 1000))
+        init_registry(self.cfg)
+        narratives = StaticNarrativeManager(self.cfg).list_static_narratives()
+        self.assertEqual(
+            narratives,
+            {
+                "count": 2,
+                "total": 2,
+                "narratives": {"10": _info(10, 2, 2000), "20": _info(20, 1, 1000)},
+                "order": [10, 20],
+            },
+        )
+
+    def test_list_static_narratives_paged(self):
+        registry = init_registry(self.cfg)
+        for ws_id in range(1, 11):
+            # saved in the opposite order to their ids
+            registry.record(_info(ws_id, 1, 1000 - ws_id))
+        manager = StaticNarrativeManager(self.cfg)
+
+        def list_narratives(**params):
+            narratives = manager.list_static_narratives(params)
+            self.assertEqual(narratives["count"], len(narratives["order"]))
+            self.assertEqual(
+                sorted(narratives["narratives"]),
+                sorted(str(ws_id) for ws_id in narratives["order"]),
+            )
+            return narratives["total"], narratives["order"]
+
+        self.assertEqual(list_narratives(offset=2, limit=3), (10, [3, 4, 5]))
+        self.assertEqual(list_narratives(offset=9, limit=3), (10, [10]))
+        self.assertEqual(list_narratives(offset=20), (10, []))
+        self.assertEqual(
+            list_narratives(min_ws_id=3, max_ws_id=6, limit=2), (4, [3, 4])
+        )
+        self.assertEqual(list_narratives(saved_after=996), (3, [1, 2, 3]))
+        self.assertEqual(
+            list_narratives(sort_by="static_saved", limit=3), (10, [10, 9, 8])
+        )
+        self.assertEqual(
+            list_narratives(sort_by="static_saved", sort_desc=1, limit=3),
+            (10, [1, 2, 3]),
+        )
+
+    def test_list_static_narratives_bad_params(self):
+        init_registry(self.cfg)
+        manager = StaticNarrativeManager(self.cfg)
+        for params, err in [
+            ({"limit": 1001}, "limit must be at most 1000, not 1001"),
+            ({"offset": -1}, "offset must be a non-negative integer, not -1"),
+            ({"min_ws_id": "5"}, "min_ws_id must be a non-negative integer, not 5"),
+            ({"sort_by": "url"}, "sort_by must be one of ws_id, static_saved, not url"),
+        ]:
+            with self.assertRaises(ValueError) as e:
+                manager.list_static_narratives(params)
+            self.assertIn(err, str(e.exception))
+
+    @requests_mock.Mocker()
+    def test_get_static_narrative_info(self, rqm):
+        set_up_ok_mocks(rqm)
+        clients = ServiceClients(get_test_config(), "some_token")
+        self._publish(10, 2, _info(10, 2, 2000))
+        init_registry(self.cfg)
+        manager = StaticNarrativeManager(self.cfg)
+        self.assertEqual(
+            manager.get_static_narrative_info(10, clients),
+            {
+                "ws_id": 10,
+                "version": 2,
+                "narrative_id": 1,
+                "url": "/10/2/",
+                "static_saved": 2000,
+                "narr_saved": 1571953877000,
+            },
+        )
+        self.assertEqual(manager.get_static_narrative_info(20, clients), {})
+        self.assertEqual(rqm.request_history, [])
+        with self.assertRaises(ValueError) as e:
+            manager.get_static_narrative_info("foo", clients)
+        self.assertIn(
+            "The parameter ws_id must be an integer, not foo", str(e.exception)
+        )
+
+    @requests_mock.Mocker()
+    def test_get_static_narrative_info_unknown_narr_saved(self, rqm):
+        """Narratives registered without a save time get it from the Workspace."""
+        ws_meta = {
+            "narrative": "3",
+            "static_narrative_ver": "5",
+            "static_narrative_saved": "2000",
+            "static_narrative": "/20/5/",
+        }
+        ws_info = [
+            20,
+            "ws",
+            "some_user",
+            "2019-10-24T21:51:17+0000",
+            1,
+            "a",
+            "r",
+            "unlocked",
+            ws_meta,
+        ]
+        set_up_ok_mocks(rqm, ws_info=ws_info)
+        clients = ServiceClients(get_test_config(), "some_token")
+        self._publish(20, 5)
+        init_registry(self.cfg)
+        manager = StaticNarrativeManager(self.cfg)
+        expected = {
+            "ws_id": 20,
+            "version": 5,
+            "narrative_id": 3,
+            "url": "/20/5/",
+            "static_saved": 2000,
+            "narr_saved": 1571953877000,
+        }
+        self.assertEqual(manager.get_static_narrative_info(20, clients), expected)
+        num_requests = len(rqm.request_history)
+        self.assertGreater(num_requests, 0)
+        self.assertEqual(manager.get_static_narrative_info(20, clients), expected)
+        self.assertEqual(len(rqm.request_history), num_requests)
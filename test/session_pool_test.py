@@ -0,0 +1,70 @@
+import unittest
+from email.message import Message
+from test.mocks import set_up_ok_mocks
+from test.test_config import get_test_config
+
+import requests
+import requests_mock
+from installed_clients import baseclient
+from installed_clients.authclient import KBaseAuth
+from installed_clients.WorkspaceClient import Workspace
+from requests.cookies import MockRequest, MockResponse
+
+
+class SessionPoolTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.cfg = get_test_config()
+
+    def tearDown(self):
+        baseclient.configure_session_pool()
+
+    def test_session_shared(self):
+        session = baseclient.get_session()
+        self.assertIs(baseclient.get_session(), session)
+        adapter = session.get_adapter("https://ci.kbase.us/services/ws")
+        self.assertEqual(adapter._pool_maxsize, 10)
+        self.assertEqual(session.headers["Connection"], "keep-alive")
+
+    def test_configure_session_pool(self):
+        session = baseclient.get_session()
+        baseclient.configure_session_pool(
+            pool_connections=2, pool_maxsize=5, pool_block=True, keep_alive=False
+        )
+        new_session = baseclient.get_session()
+        self.assertIsNot(new_session, session)
+        adapter = new_session.get_adapter("https://ci.kbase.us/services/ws")
+        self.assertEqual(adapter._pool_connections, 2)
+        self.assertEqual(adapter._pool_maxsize, 5)
+        self.assertTrue(adapter._pool_block)
+        self.assertEqual(new_session.headers["Connection"], "close")
+
+    @requests_mock.Mocker()
+    def test_clients_use_shared_session(self, rqm):
+        ws_id = 123
+        user_map = {"some_user": "Some User"}
+        set_up_ok_mocks(rqm, ws_perms={ws_id: {"some_user": "a"}}, user_map=user_map)
+        session = baseclient.get_session()
+        sent = []
+        orig_send = session.send
+
+        def send(request, **kwargs):
+            sent.append(request.url)
+            return orig_send(request, **kwargs)
+
+        session.send = send
+        ws = Workspace(url=self.cfg["workspace-url"], token="some_token")
+        ws.get_permissions({"id": ws_id})
+        auth = KBaseAuth(self.cfg["auth-url"])
+        self.assertEqual(auth.get_display_names("some_token", ["some_user"]), user_map)
+        self.assertEqual(len(sent), 2)
+        self.assertEqual(sent[0], self.cfg["workspace-url"])
+
+    def test_session_keeps_no_cookies(self):
+        session = baseclient.get_session()
+        request = requests.Request("POST", self.cfg["workspace-url"]).prepare()
+        headers = Message()
+        headers["Set-Cookie"] = "session=some_user; Path=/"
+        # this is how requests stores the cookies from each response
+        session.cookies.extract_cookies(MockResponse(headers), MockRequest(request))
+        self.assertEqual(len(session.cookies), 0)
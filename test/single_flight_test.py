@@ -0,0 +1,329 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from contextlib import contextmanager
+from test.mocks import set_up_ok_mocks
+from test.test_config import get_test_config
+from unittest.mock import patch
+
+import requests_mock
+from StaticNarrative import creator as creator_module
+from StaticNarrative.creator import StaticNarrativeCreator
+from StaticNarrative.exporter.exporter import NarrativeExporter
+from StaticNarrative.registry import init_registry
+from StaticNarrative.single_flight import LockTimeoutError, SingleFlight, file_lock
+
+
+class SingleFlightTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.scratch_dir = tempfile.TemporaryDirectory()
+        cls.cfg = get_test_config(scratch=cls.scratch_dir.name)
+        cls.user_id = "some_user"
+        init_registry(cls.cfg)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.scratch_dir.cleanup()
+
+    def _run_in_threads(self, targets):
+        threads = [threading.Thread(target=target) for target in targets]
+        for t in threads:
+            t.start()
+        return threads
+
+    def test_single_flight_shared(self):
+        single_flight = SingleFlight()
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+        results = []
+
+        def task():
+            calls.append(1)
+            started.set()
+            release.wait(10)
+            return "done"
+
+        def leader():
+            results.append(single_flight.do("key", task))
+
+        def follower():
+            results.append(single_flight.do("key", lambda: "not shared"))
+
+        threads = self._run_in_threads([leader])
+        started.wait(10)
+        threads += self._run_in_threads([follower])
+        # the follower can't be let go until the leader finishes
+        threads[1].join(0.2)
+        self.assertTrue(threads[1].is_alive())
+        release.set()
+        for t in threads:
+            t.join(10)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(sorted(results), [("done", False), ("done", True)])
+        # once it's done, the next call runs again
+        self.assertEqual(single_flight.do("key", lambda: "again"), ("again", False))
+
+    def test_single_flight_progress(self):
+        single_flight = SingleFlight()
+        reported = threading.Event()
+        joined = threading.Event()
+        leader_progress = []
+        follower_progress = []
+
+        def task():
+            single_flight.report("key", "first")
+            reported.set()
+            joined.wait(10)
+            single_flight.report("key", "second")
+            return "done"
+
+        def follower():
+            single_flight.do("key", lambda: "not shared", follower_progress.append)
+
+        threads = self._run_in_threads(
+            [lambda: single_flight.do("key", task, leader_progress.append)]
+        )
+        reported.wait(10)
+        threads += self._run_in_threads([follower])
+        # wait for the follower to join
+        while not single_flight._calls["key"].listeners[1:]:
+            threads[1].join(0.01)
+        joined.set()
+        for t in threads:
+            t.join(10)
+        self.assertEqual(leader_progress, ["first", "second"])
+        # the follower gets what was reported before it joined, too
+        self.assertEqual(follower_progress, ["first", "second"])
+        # there's nothing to pass progress on to after the task is done
+        single_flight.report("key", "third")
+
+    def test_single_flight_error(self):
+        single_flight = SingleFlight()
+
+        def fail():
+            raise ValueError("nope")
+
+        with self.assertRaises(ValueError):
+            single_flight.do("key", fail)
+        self.assertEqual(single_flight.do("key", lambda: 1), (1, False))
+
+    def test_file_lock(self):
+        lock_path = os.path.join(self.cfg["scratch"], "locks", "test.lock")
+        locked = threading.Event()
+        release = threading.Event()
+        waited = []
+
+        def holder():
+            with file_lock(lock_path) as w:
+                waited.append(w)
+                locked.set()
+                release.wait(10)
+
+        def waiter():
+            with file_lock(lock_path) as w:
+                waited.append(w)
+
+        threads = self._run_in_threads([holder])
+        locked.wait(10)
+        threads += self._run_in_threads([waiter])
+        threads[1].join(0.2)
+        self.assertTrue(threads[1].is_alive())
+        release.set()
+        for t in threads:
+            t.join(10)
+        self.assertEqual(waited, [False, True])
+
+    def test_file_lock_timeout(self):
+        lock_path = os.path.join(self.cfg["scratch"], "locks", "timeout.lock")
+        with file_lock(lock_path, timeout=0.2) as waited:
+            self.assertFalse(waited)
+            errors = []
+
+            def waiter():
+                try:
+                    with file_lock(lock_path, timeout=0.2):
+                        pass
+                except LockTimeoutError as e:
+                    errors.append(str(e))
+
+            for t in self._run_in_threads([waiter]):
+                t.join(10)
+            self.assertEqual(len(errors), 1)
+            self.assertIn(f"the lock at {lock_path}", errors[0])
+        # the lock file is cleaned up, and the lock can be had again
+        self.assertFalse(os.path.exists(lock_path))
+        with file_lock(lock_path, timeout=0.2) as waited:
+            self.assertFalse(waited)
+
+    def _set_up_create_mocks(self, rqm, ws_id, narr_ref):
+        ws_info = [
+            ws_id,
+            "some_narrative",
+            self.user_id,
+            "2019-08-26T17:33:56+0000",
+            7,
+            "a",
+            "r",
+            "unlocked",
+            {"narrative": "1"},
+        ]
+        set_up_ok_mocks(
+            rqm,
+            ref_to_file={narr_ref: f"data/{ws_id}/narrative-5846.1.19.json"},
+            ws_info=ws_info,
+            ws_perms={ws_id: {self.user_id: "a", "*": "r"}},
+            user_map={self.user_id: "Some User"},
+            ws_obj_info_file=f"data/{ws_id}/objects-{ws_id}.json",
+        )
+
+    @requests_mock.Mocker()
+    def test_create_coalesced(self, rqm):
+        """
+        Two requests for the same ref at the same time should only export it once.
+        """
+        ws_id = 5846
+        narr_ref = f"{ws_id}/1/19"
+        self._set_up_create_mocks(rqm, ws_id, narr_ref)
+        both_in = threading.Barrier(2, timeout=10)
+        export = NarrativeExporter.export_narrative
+        exports = []
+
+        def slow_export(exporter, *args, **kwargs):
+            exports.append(args[0])
+            # hold the export until the other request is waiting on it
+            both_in.wait()
+            return export(exporter, *args, **kwargs)
+
+        do = creator_module._exports.do
+        entered = []
+
+        def counted_do(key, fn, **kwargs):
+            entered.append(key)
+            if len(entered) == 2:
+                both_in.wait()
+            return do(key, fn, **kwargs)
+
+        outputs = []
+        stages = []
+
+        def create():
+            seen = []
+            stages.append(seen)
+            outputs.append(
+                StaticNarrativeCreator(self.cfg).create_static_narrative(
+                    {
+                        "narrative_ref": narr_ref,
+                        "overwrite": 1,
+                        "user_id": self.user_id,
+                        "token": "some_token",
+                    },
+                    on_stage=seen.append,
+                )
+            )
+
+        with patch.object(
+            NarrativeExporter, "export_narrative", slow_export
+        ), patch.object(creator_module._exports, "do", counted_do):
+            threads = self._run_in_threads([create, create])
+            for t in threads:
+                t.join(30)
+        self.assertEqual(len(exports), 1)
+        self.assertEqual(outputs, [{"static_narrative_url": f"/{ws_id}/19/"}] * 2)
+        # the request that shared the export still hears about its stages
+        self.assertEqual(stages, [["check_permissions", "export", "upload"]] * 2)
+
+    @requests_mock.Mocker()
+    def test_create_coalesced_mixed_overwrite(self, rqm):
+        """
+        A request to overwrite doesn't share the export of one that isn't, and exports
+        again once it's done.
+        """
+        ws_id = 5846
+        narr_ref = f"{ws_id}/1/19"
+        self._set_up_create_mocks(rqm, ws_id, narr_ref)
+        # so the request that isn't overwriting has to export it too
+        shutil.rmtree(
+            os.path.join(self.cfg["static-file-root"], str(ws_id)), ignore_errors=True
+        )
+        first_exporting = threading.Event()
+        second_in = threading.Event()
+        export = NarrativeExporter.export_narrative
+        exports = []
+
+        def slow_export(exporter, *args, **kwargs):
+            exports.append(args[0])
+            if len(exports) == 1:
+                # hold the first export until the other request is in
+                first_exporting.set()
+                second_in.wait(10)
+            return export(exporter, *args, **kwargs)
+
+        do = creator_module._exports.do
+
+        def counted_do(key, fn, **kwargs):
+            if first_exporting.is_set():
+                second_in.set()
+            return do(key, fn, **kwargs)
+
+        outputs = []
+
+        def create(overwrite):
+            outputs.append(
+                StaticNarrativeCreator(self.cfg).create_static_narrative(
+                    {
+                        "narrative_ref": narr_ref,
+                        "overwrite": overwrite,
+                        "user_id": self.user_id,
+                        "token": "some_token",
+                    }
+                )
+            )
+
+        with patch.object(
+            NarrativeExporter, "export_narrative", slow_export
+        ), patch.object(creator_module._exports, "do", counted_do):
+            threads = self._run_in_threads([lambda: create(0)])
+            self.assertTrue(first_exporting.wait(10))
+            threads += self._run_in_threads([lambda: create(1)])
+            for t in threads:
+                t.join(30)
+        self.assertEqual(len(exports), 2)
+        self.assertEqual(outputs, [{"static_narrative_url": f"/{ws_id}/19/"}] * 2)
+
+    @requests_mock.Mocker()
+    def test_create_waited_overwrite(self, rqm):
+        """
+        A request that waited on another worker still exports again if it asked to
+        overwrite.
+        """
+        ws_id = 5846
+        narr_ref = f"{ws_id}/1/19"
+        self._set_up_create_mocks(rqm, ws_id, narr_ref)
+
+        @contextmanager
+        def waited_lock(path, timeout=None):
+            yield True
+
+        export = NarrativeExporter.export_narrative
+        exports = []
+
+        def counted_export(exporter, *args, **kwargs):
+            exports.append(args[0])
+            return export(exporter, *args, **kwargs)
+
+        with patch.object(creator_module, "file_lock", waited_lock), patch.object(
+            NarrativeExporter, "export_narrative", counted_export
+        ):
+            StaticNarrativeCreator(self.cfg).create_static_narrative(
+                {
+                    "narrative_ref": narr_ref,
+                    "overwrite": 1,
+                    "user_id": self.user_id,
+                    "token": "some_token",
+                }
+            )
+        self.assertEqual(len(exports), 1)
@@ -2,13 +2,28 @@ import os
 from configparser import ConfigParser
 
 CONFIG_FILE = "./deploy.cfg"
+# The config values for where the service writes files, as paths under its scratch directory.
+SCRATCH_PATHS = {
+    "scratch": "",
+    "static-file-root": "nginx",
+    "registry-db": "static_narratives.db",
+    "staging-dir": "static_narrative_staging",
+    "cell-cache-dir": "cell_cache",
+}
 
 
-def get_test_config():
+def get_test_config(scratch=None):
+    """
+    Returns the test config. If scratch is given, everything the service writes goes
+    under that directory instead (see SCRATCH_PATHS).
+    """
     config_file = os.environ.get("KB_DEPLOYMENT_CONFIG", CONFIG_FILE)
     cfg_dict = {}
     config = ConfigParser()
     config.read(config_file)
     for nameval in config.items("StaticNarrative"):
         cfg_dict[nameval[0]] = nameval[1]
+    if scratch is not None:
+        for key, path in SCRATCH_PATHS.items():
+            cfg_dict[key] = os.path.join(scratch, path)
     return cfg_dict
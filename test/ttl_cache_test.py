@@ -0,0 +1,48 @@
+import unittest
+from unittest.mock import patch
+
+from StaticNarrative.ttl_cache import TTLCache
+
+
+class TTLCacheTestCase(unittest.TestCase):
+    def test_get_put(self):
+        cache = TTLCache(10, 60)
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.get("a", "default"), "default")
+        cache.put("a", 1)
+        self.assertEqual(cache.get("a"), 1)
+        cache.discard("a")
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(
+            cache.stats(),
+            {"hits": 1, "misses": 3, "evictions": 0, "hit_rate": 0.25, "size": 0},
+        )
+
+    def test_lru_eviction(self):
+        cache = TTLCache(2, 60)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        # using "a" makes "b" the least recently used
+        cache.get("a")
+        cache.put("c", 3)
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), 1)
+        self.assertEqual(cache.get("c"), 3)
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+    def test_ttl(self):
+        cache = TTLCache(10, 60)
+        with patch("StaticNarrative.ttl_cache.time.monotonic", return_value=1000):
+            cache.put("a", 1)
+        with patch("StaticNarrative.ttl_cache.time.monotonic", return_value=1059):
+            self.assertEqual(cache.get("a"), 1)
+        with patch("StaticNarrative.ttl_cache.time.monotonic", return_value=1060):
+            self.assertIsNone(cache.get("a"))
+        self.assertEqual(len(cache), 0)
+
+    def test_disabled(self):
+        for cache in [TTLCache(0, 60), TTLCache(10, 0)]:
+            cache.put("a", 1)
+            self.assertIsNone(cache.get("a"))
+            self.assertEqual(len(cache), 0)
@@ -1,16 +1,30 @@
 import os
+import tempfile
 import unittest
 from test.test_config import get_test_config
 
+from StaticNarrative.fingerprint import FINGERPRINT_FILE
 from StaticNarrative.narrative_ref import NarrativeRef
-from StaticNarrative.uploader.uploader import upload_static_narrative
+from StaticNarrative.registry import INFO_FILE, write_static_info
+from StaticNarrative.uploader.uploader import (
+    STAGING_DIR,
+    find_static_narrative,
+    make_staging_dir,
+    upload_static_narrative,
+)
 
 
 class UploaderTestCase(unittest.TestCase):
     @classmethod
     def setUpClass(cls):
         cls.ref = NarrativeRef.parse("1/2/3")
-        cls.cfg = get_test_config()
+
+    def setUp(self):
+        self.scratch_dir = tempfile.TemporaryDirectory()
+        self.cfg = get_test_config(scratch=self.scratch_dir.name)
+
+    def tearDown(self):
+        self.scratch_dir.cleanup()
 
     def test_upload_no_narrative_file(self):
         path = "not_a_path"
@@ -20,22 +34,93 @@ class UploaderTestCase(unittest.TestCase):
             f"Static Narrative doesn't seem to exist at path {path}", str(e.exception)
         )
 
-    def test_upload_need_to_make_path(self):
-        narr_file = os.path.join(self.cfg["scratch"], "test_file.html")
+    def _stage(self, upload_endpt, html="test", data="{}"):
+        staging_dir = make_staging_dir(self.ref, upload_endpt)
+        narr_file = os.path.join(staging_dir, "narrative.html")
         with open(narr_file, "w") as fout:
-            fout.write("test")
+            fout.write(html)
+        with open(os.path.join(staging_dir, "data.json"), "w") as fout:
+            fout.write(data)
+        return narr_file
+
+    def _staged(self, upload_endpt):
+        return os.listdir(os.path.join(os.path.dirname(upload_endpt), STAGING_DIR))
+
+    def test_upload_need_to_make_path(self):
         upload_endpt = str(os.path.join(self.cfg["scratch"], "upload_test"))
+        narr_file = self._stage(upload_endpt)
         ret = upload_static_narrative(self.ref, narr_file, upload_endpt, None)
         self.assertEqual(f"/{self.ref.wsid}/{self.ref.ver}/", ret)
-        self.assertTrue(
-            os.path.exists(
-                os.path.join(upload_endpt, str(self.ref.wsid), str(self.ref.ver))
-            )
+        static_path = os.path.join(upload_endpt, str(self.ref.wsid), str(self.ref.ver))
+        self.assertEqual(sorted(os.listdir(static_path)), ["data.json", "index.html"])
+        # the staging directory got moved into place, outside the webroot
+        self.assertEqual(self._staged(upload_endpt), [])
+        self.assertNotIn(STAGING_DIR, os.listdir(upload_endpt))
+        self.assertTrue(os.path.islink(static_path))
+
+    def test_upload_replaces_existing(self):
+        upload_endpt = str(os.path.join(self.cfg["scratch"], "replace_test"))
+        static_path = os.path.join(upload_endpt, str(self.ref.wsid), str(self.ref.ver))
+        upload_static_narrative(self.ref, self._stage(upload_endpt), upload_endpt)
+        with open(os.path.join(static_path, "old_file.txt"), "w") as fout:
+            fout.write("old")
+        write_static_info(static_path, {"ws_id": self.ref.wsid})
+        index_inode = os.stat(os.path.join(static_path, "index.html")).st_ino
+        old_version_dir = os.path.realpath(static_path)
+        old_index = open(os.path.join(static_path, "index.html"))  # noqa: SIM115
+        self.addCleanup(old_index.close)
+
+        narr_file = self._stage(upload_endpt, html="new", data='{"new": 1}')
+        new_inode = os.stat(narr_file).st_ino
+        upload_static_narrative(self.ref, narr_file, upload_endpt, fingerprint="abc")
+        self.assertEqual(
+            sorted(os.listdir(static_path)),
+            sorted([FINGERPRINT_FILE, "data.json", "index.html", INFO_FILE]),
+        )
+        with open(os.path.join(static_path, "index.html")) as fin:
+            self.assertEqual(fin.read(), "new")
+        with open(os.path.join(static_path, "data.json")) as fin:
+            self.assertEqual(fin.read(), '{"new": 1}')
+        # it's the staged file itself, renamed, not a copy
+        index_stat = os.stat(os.path.join(static_path, "index.html"))
+        self.assertEqual(index_stat.st_ino, new_inode)
+        self.assertNotEqual(index_stat.st_ino, index_inode)
+        self.assertEqual(self._staged(upload_endpt), [])
+        # the old version got swapped out whole, and removed
+        self.assertEqual(old_index.read(), "test")
+        self.assertFalse(os.path.exists(old_version_dir))
+        ws_dir = os.path.dirname(static_path)
+        self.assertEqual(len(os.listdir(ws_dir)), 2)
+
+    def test_upload_replaces_unversioned(self):
+        """Static Narratives published as plain directories get replaced too."""
+        upload_endpt = str(os.path.join(self.cfg["scratch"], "unversioned_test"))
+        static_path = os.path.join(upload_endpt, str(self.ref.wsid), str(self.ref.ver))
+        os.makedirs(static_path)
+        with open(os.path.join(static_path, "index.html"), "w") as fout:
+            fout.write("old")
+        write_static_info(static_path, {"ws_id": self.ref.wsid})
+
+        upload_static_narrative(self.ref, self._stage(upload_endpt), upload_endpt)
+        self.assertTrue(os.path.islink(static_path))
+        self.assertEqual(
+            sorted(os.listdir(static_path)), ["data.json", "index.html", INFO_FILE]
+        )
+        with open(os.path.join(static_path, "index.html")) as fin:
+            self.assertEqual(fin.read(), "test")
+        self.assertEqual(len(os.listdir(os.path.dirname(static_path))), 2)
+
+    def test_find_static_narrative(self):
+        upload_endpt = str(os.path.join(self.cfg["scratch"], "find_test"))
+        self.assertIsNone(find_static_narrative(self.ref, upload_endpt, "abc"))
+        url = upload_static_narrative(
+            self.ref, self._stage(upload_endpt), upload_endpt, fingerprint="abc"
         )
-        self.assertTrue(
-            os.path.isfile(
-                os.path.join(
-                    upload_endpt, str(self.ref.wsid), str(self.ref.ver), "index.html"
-                )
+        self.assertEqual(find_static_narrative(self.ref, upload_endpt, "abc"), url)
+        self.assertIsNone(find_static_narrative(self.ref, upload_endpt, "def"))
+        os.remove(
+            os.path.join(
+                upload_endpt, str(self.ref.wsid), str(self.ref.ver), "data.json"
             )
         )
+        self.assertIsNone(find_static_narrative(self.ref, upload_endpt, "abc"))